@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Postgresql Database Steps."""
+
+import argparse
+import sys
+
+import rich
+from python import db_ops, exec_manager
+
+# This script runs single database steps for the `bash` build and entrypoint scripts,
+# which share their database arguments and environment variables with it.
+# Arguments only the `bash` scripts understand are ignored.
+
+
+def seed(db: db_ops.DBOps) -> list[exec_manager.Result]:
+    """Load the seed data selected by `with_seed_data`, ordered by the foreign keys between its tables."""
+    return db.seed_database()
+
+
+def template(db: db_ops.DBOps) -> list[exec_manager.Result]:
+    """Snapshot the migrated database into its template database."""
+    return [db.create_template()]
+
+
+def reset(db: db_ops.DBOps) -> list[exec_manager.Result]:
+    """Recreate the database from its template database, as it was after the migrations."""
+    return [db.reset_database()]
+
+
+def workers(db: db_ops.DBOps) -> list[exec_manager.Result]:
+    """Provision a copy of the migrated database for each of `dbworkers` test workers, from a new template."""
+    results = [db.create_template()]
+    if results[-1].ok():
+        timeout = float(db.args.dbreadytimeout) if db.args.dbreadytimeout else None
+        results.extend(db.provision_workers(timeout))
+    return results
+
+
+STEPS = {
+    "seed": seed,
+    "template": template,
+    "reset": reset,
+    "workers": workers,
+}
+
+
+def main() -> None:
+    """Postgresql Database Steps."""
+    # Force color output in CI
+    rich.reconfigure(color_system="256")
+
+    parser = argparse.ArgumentParser(description="Postgres database steps.")
+    parser.add_argument("step", choices=STEPS, help="The step to run")
+    db_ops.add_args(parser)
+    args, _ = parser.parse_known_args()
+
+    db = db_ops.DBOps(args)
+    results = exec_manager.Results(f"Database Step: {args.step}")
+    try:
+        results.add(STEPS[args.step](db))
+    finally:
+        db.close()
+
+    results.print()
+    if not results.ok():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
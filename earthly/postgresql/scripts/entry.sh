@@ -1,7 +1,7 @@
 #!/usr/bin/env bash
 
 # cspell: words REINIT PGHOST PGPORT PGUSER PGPASSWORD psql initdb isready dotglob
-# cspell: words dbhost dbdesc dbdescription dbpath pgsql
+# cspell: words dbhost dbname dbdesc dbdescription dbpath pgsql
 
 # ---------------------------------------------------------------
 # Entrypoint script for database container
@@ -23,6 +23,9 @@
 # DB_USER_PASSWORD - The password of the database user
 # DEBUG - If set, the script will print debug information (optional)
 # DEBUG_SLEEP - If set, the script will sleep for the specified number of seconds (optional)
+# DB_WORKERS - The number of test workers to provision a copy of the migrated database for (optional, default 0)
+# DB_WORKER_MODE - `database` for a database per worker, or `cluster` for a cluster per worker (optional)
+# DB_WORKER_URLS - A file to list the connection strings of the worker databases in, one per line (optional)
 # STAGE - The stage being run.  Currently only controls if stage specific data is applied to the DB (optional)
 # ---------------------------------------------------------------
 
@@ -35,10 +38,12 @@ shopt -s dotglob
 show_db_config
 
 dbhost=$(get_param dbhost env_vars defaults "$@")
+dbname=$(get_param dbname env_vars defaults "$@")
 initdb=$(get_param init_and_drop_db env_vars defaults "$@")
 migrations=$(get_param with_migrations env_vars defaults "$@")
 dbdesc=$(get_param dbdescription env_vars defaults "$@")
 dbpath=$(get_param dbpath env_vars defaults "$@")
+dbworkers="${DB_WORKERS:-0}"
 
 echo ">>> Starting entrypoint script for DB: ${dbdesc} @ ${dbhost}..."
 
@@ -88,8 +93,15 @@ if [[ "${migrations}" == "true" ]]; then
         migrate_schema "$@"
 fi
 
-# Apply seed data
-seed_database
+# Apply seed data, loading files in parallel where the foreign keys between their tables allow
+status 0 "Applying Seed Data" \
+    /scripts/db_steps.py seed "$@" --dbname="${dbname}"
+
+# Provision an isolated copy of the database for each test worker, so tests can run in parallel
+if [[ "${dbworkers}" -gt 0 ]]; then
+    status_and_exit "Provisioning DB Test Workers" \
+        /scripts/db_steps.py workers "$@" --dbname="${dbname}"
+fi
 
 if [[ "${dbhost}" == "localhost" ]]; then
     echo ">>> Waiting until the Database terminates: ${dbdesc} @ ${dbhost}..."
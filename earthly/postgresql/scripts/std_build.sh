@@ -1,6 +1,6 @@
 #!/usr/bin/env bash
 
-# cspell: words dbname dbdesc dbpath pgsql dbreadytimeout
+# cspell: words dbname dbdesc dbdescription dbpath pgsql dbreadytimeout dbseeddatasrc
 
 # This script is run inside the `build` stage.
 # It validates that all the migrations and importable data are able to be
@@ -37,15 +37,21 @@ status_and_exit "DB Ready" \
 # Setup Schema and run migrations.
 setup_and_migrate "Initialization" "$@"
 
+# Snapshot the migrated database, so it can be reset without replaying the migrations.
+status_and_exit "Initialization: DB Template" \
+    /scripts/db_steps.py template "$@" --dbname=test
+
 # Test each seed data set can apply cleanly
 rc=0
 while IFS= read -r -d '' file; do
     status "${rc}" "Applying seed data from ${file}" \
-        apply_seed_data "${file}" --dbname=test
+        /scripts/db_steps.py seed "$@" --dbname=test \
+        --dbseeddatasrc="$(dirname "${file}")" --with_seed_data="$(basename "${file}")"
     rc=$?
 
-    # Reset schema so all seed data get applied to a clean database.
-    setup_and_migrate "Reset" "$@"
+    # Reset the database from its template so all seed data get applied to a clean database.
+    status_and_exit "Reset: DB From Template" \
+        /scripts/db_steps.py reset "$@" --dbname=test --dbdescription="Test DB"
 done < <(find ./seed/* -maxdepth 1 -type d -print0 | sort -z) || true
 
 # Stop the database
@@ -25,6 +25,7 @@ def sqlfluff(results: exec_manager.Results, path: str) -> None:
         exec_manager.cli_run(
             f"sqlfluff lint -vv {path}",
             name=f"Checking SQLFluff linter against files from: {path}",
+            cache=exec_manager.CacheSpec(inputs=[path, ".sqlfluff"], tools=["sqlfluff version"]),
         ),
     )
 
@@ -34,21 +35,23 @@ def main() -> None:
     # Force color output in CI
     rich.reconfigure(color_system="256")
 
-    argparse.ArgumentParser(description="Postgres checks processing.")
+    parser = argparse.ArgumentParser(description="Postgres checks processing.")
+    parser.add_argument(
+        "--fix",
+        action="store_true",
+        help="Rewrite .sqlfluff if it differs from the vendored one, and report what was changed",
+    )
+    args = parser.parse_args()
 
     results = exec_manager.Results("Postgres checks")
 
-    results.add(
-        vendor_files_check.colordiff_check(
-            "/sql/.sqlfluff",
-            ".sqlfluff",
-        ),
-    )
+    results.add(vendor_files_check.text_diff_check("/sql/.sqlfluff", ".sqlfluff", fix=args.fix))
 
     sqlfluff(results, "/sql")
     sqlfluff(results, ".")
 
     results.print()
+    results.save()
     if not results.ok():
         sys.exit(1)
 
@@ -1,44 +1,180 @@
 #!/usr/bin/env python3
 """Postgresql Standard Docs."""
-# cspell: words dbmigrations dbhost dbuser dbuserpw Tsvg pgsql11
+# cspell: words dbmigrations dbhost dbuser dbuserpw Tsvg pgsql11 schemaspy psycopg
 
 import argparse
+import hashlib
+import json
+import os
 import re
+import shutil
 import sys
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from textwrap import indent
+from typing import Self, TextIO
 
+import psycopg
 import rich
-from python import db_ops, exec_manager
+from python import db_ops, db_schema, exec_manager
 from rich import print  # noqa: A004
 
+# Where the docs are built, and the state of the last build is kept in it.
+DOCS_DIR = Path("docs")
+STATE_FILE = DOCS_DIR / ".docs-state.json"
+SCHEMA_DIR = DOCS_DIR / "database_schema"
+SCHEMA_MD = DOCS_DIR / "schema.md"
+MIGRATIONS_MD = DOCS_DIR / "migrations.md"
+
+# The versioned migrations documented in `migrations.md`.
+MIGRATION_FILE = re.compile(r"V(\d+)__(\w+)\.sql$")
+# How much of a migration file is read at a time.
+MIGRATION_CHUNK = 1024 * 1024
+
+
+def file_hashes(directory: Path, exclude: tuple[Path, ...] = ()) -> dict[str, str]:
+    """Hash every file in a directory and its subdirectories.
+
+    Args:
+        directory (Path): The directory.
+        exclude (tuple[Path, ...], optional): Files to leave out. Defaults to ().
+
+    Returns:
+        dict[str, str]: The sha256 of each file, by its path relative to the directory.
+
+    """
+    return {
+        str(path.relative_to(directory)): file_digest(path)
+        for path in sorted(directory.rglob("*"))
+        if path.is_file() and path not in exclude
+    }
+
+
+def file_digest(path: Path) -> str:
+    """Hash a file, without reading it all into memory."""
+    with path.open("rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def combined_hash(*parts: str) -> str:
+    """Hash some strings together, in order."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode() + b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class DocsState:
+    """What the docs were last built from, to only rebuild what changed.
+
+    Attributes:
+        inputs: A hash of everything which changes all the docs, like this script and the database settings.
+        migrations: The sha256 of each file in the migrations directory.
+        largest_version: The largest migration version in `migrations.md`.
+        schema: The sha256 of the `pg_dump --schema-only` output the schema docs were built from.
+        output: The sha256 of each file of the built docs, to detect when they are missing or were changed.
+
+    """
+
+    inputs: str = ""
+    migrations: dict[str, str] = field(default_factory=dict)
+    largest_version: int = 0
+    schema: str = ""
+    output: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        """Load the state of the last build, an empty state if there is none."""
+        try:
+            return cls(**json.loads(path.read_text()))
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+    def save(self, path: Path) -> None:
+        """Save the state of this build."""
+        self.output = file_hashes(path.parent, exclude=(path,))
+        path.write_text(json.dumps(asdict(self), indent=2))
+
+    def output_intact(self) -> bool:
+        """Check the docs of the last build are all there, unchanged."""
+        return bool(self.output) and file_hashes(DOCS_DIR, exclude=(STATE_FILE,)) == self.output
+
+
+@dataclass
+class MigrationFile:
+    """A migration in the migrations directory, its SQL is only read when it is written out.
+
+    Attributes:
+        version: The version of the migration.
+        name: The name of the migration.
+        path: The migration file.
+
+    """
+
+    version: int
+    name: str
+    path: Path
+
+    def size(self) -> int:
+        """Return the size of the migration file, in bytes."""
+        return self.path.stat().st_size
+
+    def lines(self) -> int:
+        """Count the lines of the migration file, a chunk at a time."""
+        count = 0
+        last = b"\n"
+        with self.path.open("rb") as file:
+            for chunk in iter(lambda: file.read(MIGRATION_CHUNK), b""):
+                count += chunk.count(b"\n")
+                last = chunk[-1:]
+        return count + (last != b"\n")
 
-def process_sql_files(directory: str) -> tuple[dict, int]:
-    """Process SQL Files."""
-    file_pattern = r"V(\d+)__(\w+)\.sql"
+    def write_section(self, out: TextIO) -> None:
+        """Write the markdown section of the migration, copying its SQL a line at a time.
+
+        The SQL is written like `textwrap.indent(sql.strip(), "    ")` would,
+        without reading the whole file: each line with code is held back until the
+        next one, so the blank lines and whitespace at the end are left out.
+        """
+        out.write(f'## {self.name}\n\n??? abstract "Schema Definition"\n\n    ```postgres\n')
+        # The last line with code, and the blank lines after it.
+        last = None
+        blank = []
+        with self.path.open() as file:
+            for line in file:
+                if not line.strip():
+                    if last is not None:
+                        blank.append(line)
+                    continue
+                if last is None:
+                    line = line.lstrip()  # noqa: PLW2901
+                else:
+                    out.write("    " + last)
+                    out.writelines(blank)
+                    blank = []
+                last = line
+        out.write("\n" if last is None else "    " + last.rstrip() + "\n")
+        out.write("    ```\n\n")
+
+
+def process_sql_files(directory: str) -> tuple[dict[int, MigrationFile], int]:
+    """Index the migrations in a directory by version, from their file names only.
+
+    Args:
+        directory (str): The migrations directory.
+
+    Returns:
+        tuple[dict[int, MigrationFile], int]: The migrations by version, and the largest version.
+
+    """
     migrations = {}
-    largest_version = 0
-
-    for filename in Path(directory).iterdir():
-        print(filename)
-        print(filename.name)
-        match = re.match(file_pattern, filename.name)
-        if match:
+    for path in Path(directory).iterdir():
+        match = MIGRATION_FILE.match(path.name)
+        if match and path.is_file():
             version = int(match.group(1))
-            migration_name = match.group(2)
-
-            largest_version = max(largest_version, version)
-
-            with filename.open() as file:
-                sql_data = file.read()
+            migrations[version] = MigrationFile(version, match.group(2), path)
 
-            migrations[version] = {
-                "version": version,
-                "migration_name": migration_name,
-                "sql_data": sql_data,
-            }
-
-    return migrations, largest_version
+    return migrations, max(migrations, default=0)
 
 
 class Migrations:
@@ -57,89 +193,230 @@ class Migrations:
         self.args = args
         self.migrations, self.migration_version = process_sql_files(args.dbmigrations)
 
+    def title(self) -> str:
+        """Return the title line of the markdown file, with the maximum migration version."""
+        return f"# Migrations (Version {self.migration_version}) \n"
+
+    def summary(self) -> str:
+        """Return the table of the size and line count of each migration, which follows the title."""
+        rows = [
+            f"| {migration.version} | {migration.name} | {exec_manager.format_size(migration.size())} "
+            f"| {migration.lines()} |\n"
+            for migration in (self.migrations[version] for version in sorted(self.migrations))
+        ]
+        return "| Version | Migration | Size | Lines |\n| --- | --- | --- | --- |\n" + "".join(rows) + "\n"
+
+    def write_header(self, out: TextIO) -> None:
+        """Write the title and the summary table of the markdown file."""
+        out.write(self.title() + "\n")
+        out.write(self.summary())
+
     def create_markdown_file(self, file_path: str) -> None:
-        """Create Markdown File."""
+        """Create Markdown File.
+
+        Each migration is copied into the file in version order, only one is read at a time.
+        """
         with Path(file_path).open("w") as markdown_file:
-            # Write the title with the maximum migration version
-            markdown_file.write(f"# Migrations (Version {self.migration_version}) \n\n")
+            self.write_header(markdown_file)
 
             # Write the contents of each file in order
-            for version in sorted(self.migrations.keys()):
-                migration = self.migrations[version]
-                sql_data = migration["sql_data"].strip()
+            for version in sorted(self.migrations):
+                self.migrations[version].write_section(markdown_file)
 
-                # Write the title of the file
-                markdown_file.write(f"## {migration['migration_name']}\n\n")
+        print(f"Markdown file created successfully at: {file_path}")
 
-                markdown_file.write('??? abstract "Schema Definition"\n\n')
-                markdown_file.write(indent(f"```postgres\n{sql_data}\n```", "    ") + "\n\n")
+    def append_markdown_file(self, file_path: str, after_version: int) -> None:
+        """Add the migrations newer than `after_version` to a markdown file made by `create_markdown_file`.
 
-        print(f"Markdown file created successfully at: {file_path}")
+        The title and summary are updated, the sections of the older migrations are copied as they are.
+        """
+        path = Path(file_path)
+        added = [version for version in sorted(self.migrations) if version > after_version]
+        new_path = path.with_name(path.name + ".new")
+        with path.open() as old, new_path.open("w") as markdown_file:
+            self.write_header(markdown_file)
+
+            # The sections start at the first heading after the title, the SQL in them is indented.
+            old.readline()
+            for line in old:
+                if line.startswith("## "):
+                    markdown_file.write(line)
+                    break
+            shutil.copyfileobj(old, markdown_file)
+
+            for version in added:
+                self.migrations[version].write_section(markdown_file)
+        new_path.replace(path)
+
+        print(f"Markdown file updated with {len(added)} new migrations at: {file_path}")
+
+
+def schema_hash(dump: str) -> str:
+    r"""Hash the output of `pg_dump --schema-only`, leaving out comments and the random `\restrict` keys."""
+    lines = (line for line in dump.splitlines() if not line.startswith(("--", "\\restrict", "\\unrestrict")))
+    return combined_hash(*lines)
+
+
+def migration_version(name: str) -> int | None:
+    """Return the version of a migration file in the migrations directory, None if it is not one."""
+    match = MIGRATION_FILE.match(name)
+    return int(match.group(1)) if match else None
+
+
+def native_schema_docs(db: db_ops.DBOps) -> exec_manager.Result:
+    """Generate the schema docs from the catalog of the database, without SchemaSpy.
+
+    A D2 diagram of the schema and a page per table are written to `SCHEMA_DIR`,
+    and an overview of them to `SCHEMA_MD`.
+    """
+
+    def procedure() -> exec_manager.ProcedureResult:
+        try:
+            tables = db_schema.introspect(db.connection())
+            written = db_schema.write_docs(tables, SCHEMA_DIR, SCHEMA_MD)
+        except (OSError, psycopg.Error) as exc:
+            return exec_manager.ProcedureResult(1, "native schema docs", str(exc))
+        finally:
+            db.close()
+        return exec_manager.ProcedureResult(
+            0, "native schema docs", f"{len(tables)} tables documented in {len(written)} files"
+        )
+
+    return exec_manager.procedure_run(procedure, "Generate Schema Documentation", verbose=True)
 
 
-def main() -> None:
-    """Postgresql Standard Docs Processing."""
+def main() -> None:  # noqa: C901, PLR0912, PLR0915
+    """Postgresql Standard Docs Processing.
+
+    Only what changed since the last build is rebuilt, if its docs and state are kept in `--docs_cache`.
+    Nothing is done if the migrations did not change. If migrations were only added, their sections
+    are appended to `migrations.md`, and the schema docs are only generated if the schema changed.
+    The schema docs are generated by SchemaSpy, or from the catalog with `--schema_generator native`,
+    which needs no JVM and is fast enough to run on every change.
+    """
     # Force color output in CI
     rich.reconfigure(color_system="256")
 
     parser = argparse.ArgumentParser(description="Standard Postgresql Documentation Processing.")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
+    parser.add_argument(
+        "--docs_cache",
+        default=os.environ.get("DOCS_CACHE"),
+        help="Directory the docs of the last build are kept in, to only rebuild what changed",
+    )
+    parser.add_argument("--force", action="store_true", help="Rebuild all the docs, even if nothing changed")
+    parser.add_argument(
+        "--schema_generator",
+        choices=["schemaspy", "native"],
+        default=os.environ.get("DOCS_SCHEMA_GENERATOR", "schemaspy"),
+        help="Generate the schema docs with SchemaSpy, or natively as D2 diagrams and markdown",
+    )
     db_ops.add_args(parser)
 
     args = parser.parse_args()
 
-    db = db_ops.DBOps(args)
-
     results = exec_manager.Results("Generate Database Documentation")
 
-    # Init the DB.
-    res = db.init_database()
-    results.add(res)
+    # Create the docs directory, with the docs of the last build if they were kept.
+    DOCS_DIR.mkdir(exist_ok=True)
+    cache = Path(args.docs_cache) / "docs" if args.docs_cache else None
+    if cache is not None and cache.is_dir() and not args.force:
+        results.add(exec_manager.cli_run(f'cp -a "{cache}/." "{DOCS_DIR}/"', name="Restore Previous Docs"))
+
+    previous = DocsState() if args.force else DocsState.load(STATE_FILE)
+    intact = previous.output_intact()
+    state = DocsState(
+        inputs=combined_hash(
+            hashlib.sha256(Path(__file__).read_bytes()).hexdigest(),
+            hashlib.sha256(Path(db_schema.__file__).read_bytes()).hexdigest(),
+            str(Path("/bin/schemaspy.jar").stat().st_size) if Path("/bin/schemaspy.jar").exists() else "",
+            args.dbname,
+            args.dbuser,
+            args.schema_generator,
+        ),
+        migrations=file_hashes(Path(args.dbmigrations)),
+    )
+    same_inputs = intact and previous.inputs == state.inputs
+
+    if same_inputs and previous.migrations == state.migrations:
+        print("[green]The migrations did not change since the docs were built, they are up to date.[/green]")
+        results.print()
+        results.save()
+        sys.exit(0 if results.ok() else 1)
 
-    if res.ok():
-        db.start()
-        res = db.wait_ready(timeout=10)
-        results.add(res)
+    db = db_ops.DBOps(args)
 
-    if res.ok():
-        res = db.setup()
-        results.add(res)
+    # Init and migrate the DB, or restore it from the cluster cache.
+    results.add(db.bring_up(timeout=10))
 
-    if res.ok():
-        res = db.migrate_schema()
+    # The docs are generated from the migrated database, we are done with our connections.
+    db.close()
+
+    if results.ok():
+        res = exec_manager.cli_run(
+            f"pg_dump --schema-only -d {db.user_connection()}",
+            name="Dump Schema",
+            log=False,
+        )
         results.add(res)
+        state.schema = schema_hash(res.out)
 
-    if res.ok():
-        # Create the docs directory
-        exec_manager.cli_run("mkdir -p docs")  # Where we build the docs.
+    if results.ok():
+        if same_inputs and previous.schema == state.schema and SCHEMA_DIR.is_dir():
+            print("[green]The schema did not change, keeping the schema documentation.[/green]")
+        else:
+            exec_manager.cli_run(f'rm -rf "{SCHEMA_DIR}"', name="Remove old Schema Documentation")
+            if args.schema_generator == "native":
+                res = native_schema_docs(db)
+            else:
+                schemaspy_cmd = (
+                    f"java -jar /bin/schemaspy.jar -t pgsql11 "
+                    f"-dp /bin/postgresql.jar "
+                    f"-db {args.dbname} "
+                    f"-host {args.dbhost} "
+                    f"-u {args.dbuser} "
+                    f"-p {args.dbuserpw} "
+                    f"-o {SCHEMA_DIR}/ "
+                )
+                res = exec_manager.cli_run(schemaspy_cmd, name="Generate SchemaSpy Documentation", verbose=True)
+            results.add(res)
+
+            # If the schema docs were generated without error, create .pages file to hide the schema folder
+            if res.ok():
+                exec_manager.cli_run(
+                    f'echo "hide: true" > {SCHEMA_DIR}/.pages',
+                    name="Create .pages file",
+                    verbose=True,
+                )
 
+    if results.ok():
         # Get all info about the migrations.
         migrations = Migrations(args)
+        state.largest_version = migrations.migration_version
+
+        added = [migration_version(name) for name in state.migrations.keys() - previous.migrations.keys()]
+        if (
+            same_inputs
+            and MIGRATIONS_MD.is_file()
+            and previous.migrations.items() <= state.migrations.items()
+            and all(version is None or version > previous.largest_version for version in added)
+        ):
+            migrations.append_markdown_file(str(MIGRATIONS_MD), previous.largest_version)
+        else:
+            migrations.create_markdown_file(str(MIGRATIONS_MD))
 
     if results.ok():
-        schemaspy_cmd = (
-            f"java -jar /bin/schemaspy.jar -t pgsql11 "
-            f"-dp /bin/postgresql.jar "
-            f"-db {args.dbname} "
-            f"-host {args.dbhost} "
-            f"-u {args.dbuser} "
-            f"-p {args.dbuserpw} "
-            f"-o docs/database_schema/ "
-        )
-        res = exec_manager.cli_run(schemaspy_cmd, name="Generate SchemaSpy Documentation", verbose=True)
-        results.add(res)
-
-        # If SchemaSpy command completes without error, create .pages file to hide the schema folder
-        if res.ok():
-            exec_manager.cli_run(
-                'echo "hide: true" > docs/database_schema/.pages',
-                name="Create .pages file",
-                verbose=True,
+        state.save(STATE_FILE)
+        if cache is not None:
+            results.add(
+                exec_manager.cli_run(
+                    f'rm -rf "{cache}" && mkdir -p "{cache}" && cp -a "{DOCS_DIR}/." "{cache}/"',
+                    name="Keep Docs for the next build",
+                ),
             )
 
-        migrations.create_markdown_file("docs/migrations.md")
-
     results.print()
+    results.save()
 
     if not results.ok():
         sys.exit(1)
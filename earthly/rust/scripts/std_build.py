@@ -17,89 +17,155 @@ from python.utils import fix_quoted_earthly_args
 # This improves visibility into all issues that need to be corrected for `build`
 # to pass without needing to iterate excessively.
 
+# Compilation steps each drive a full parallel `cargo` build, so they are weighted to take
+# half of the CPU slots and at most two are admitted at once.  The runner's jobserver keeps
+# the total number of compiler jobs across all of them within the CPU count.
+COMPILE_SLOTS = max(1, (os.cpu_count() or 1) // 2)
 
+# How often, in seconds, the memory of each step is sampled, so memory hungry steps can be found.
+MEMORY_SAMPLE_INTERVAL = 1.0
+
+
+def run_compile(
+    runner: exec_manager.ParallelRunner,
+    func: callable,
+    *args: tuple,
+    after: list[exec_manager.Task | None] | None = None,
+    always: bool = False,
+    **kwargs: dict,
+) -> exec_manager.Task:
+    """Schedule a compilation heavy step, weighted by `COMPILE_SLOTS`."""
+    return runner.schedule(
+        exec_manager.Task(
+            func,
+            args,
+            kwargs,
+            after=[task for task in after or [] if task is not None],
+            always=always,
+            slots=COMPILE_SLOTS,
+        ),
+    )
+
+
+@exec_manager.subprocess_bound
 def cargo_build(flags: str, *, verbose: bool = False) -> exec_manager.Result:
     """Cargo Build."""
     return exec_manager.cli_run(
         "cargo build " + "--release " + f"{flags} ",
         name="Build all code in the workspace",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
 
 
+@exec_manager.subprocess_bound
 def cargo_lint(flags: str, *, verbose: bool = False) -> exec_manager.Result:
     """Cargo Lint."""
     return exec_manager.cli_run(
         "cargo lint --release " + f"{flags}",
         name="Clippy Lints in the workspace check",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
 
 
+@exec_manager.subprocess_bound
 def cargo_doctest(flags: str, *, verbose: bool = False) -> exec_manager.Result:
     """Cargo Doctest."""
     return exec_manager.cli_run(
         "cargo testdocs " + f"{flags} ",
         name="Documentation tests all pass check",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
 
 
+@exec_manager.subprocess_bound
 def cargo_nextest(flags: str, *, verbose: bool = False) -> exec_manager.Result:
     """Cargo Nextest."""
     return exec_manager.cli_run(
         "cargo testunit " + f"{flags} ",
         name="Self contained Unit tests all pass check",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
 
 
-def cargo_llvm_cov(flags: str, cov_report: str, *, verbose: bool = False) -> list[exec_manager.Result]:
-    """Cargo LLVM Cov."""
+def cargo_llvm_cov(
+    runner: exec_manager.ParallelRunner,
+    flags: str,
+    cov_report: str,
+    *,
+    verbose: bool = False,
+) -> exec_manager.Task:
+    """Cargo LLVM Cov.
+
+    Returns the final task of the chain, so other steps can be scheduled after it.
+    """
     # These can not be run in parallel as they depend on each other
-    results = []
     # Remove artifacts that may affect the coverage results
-    res = exec_manager.cli_run(
+    clean = runner.run(
+        exec_manager.cli_run,
         "cargo llvm-cov clean",
         name="Remove artifacts that may affect the coverage results",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
-    results.append(res)
     # Run unit tests and generates test and coverage report artifacts
-    if res.ok():
-        res = exec_manager.cli_run(
-            "cargo testcov " + f"{flags} ",
-            name="Self contained Unit tests and collect coverage",
-            verbose=verbose,
-        )
-        results.append(res)
+    testcov = run_compile(
+        runner,
+        exec_manager.cli_run,
+        "cargo testcov " + f"{flags} ",
+        name="Self contained Unit tests and collect coverage",
+        after=[clean],
+        verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
+    )
     # Save coverage report to file if it is provided
-    if res.ok():
-        res = exec_manager.cli_run(
-            "cargo llvm-cov report --lcov " + f"{flags} " + "--release " + f"--output-path {cov_report} ",
-            name=f"Generate lcov report to {cov_report}",
-            verbose=verbose,
-        )
-        results.append(res)
-
-    return results
+    return runner.run_after(
+        [testcov],
+        exec_manager.cli_run,
+        "cargo llvm-cov report --lcov " + f"{flags} " + "--release " + f"--output-path {cov_report} ",
+        name=f"Generate lcov report to {cov_report}",
+        verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
+    )
 
 
+@exec_manager.subprocess_bound
 def cargo_bench(flags: str, *, verbose: bool = False) -> exec_manager.Result:
     """Cargo Bench."""
     return exec_manager.cli_run(
         f"cargo bench --all-targets --no-fail-fast {flags} ",
         name="Benchmarks all run to completion check",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
 
 
+@exec_manager.subprocess_bound
 def cargo_doc(*, verbose: bool = False) -> exec_manager.Result:
     """Cargo Doc."""
-    # Add RUSTDOCFLAGS to the inherited environment so we can build an index page with nightly.
-    env = os.environ
+    # Add RUSTDOCFLAGS to a copy of the inherited environment so we can build an index page with nightly.
+    # A copy, because this runs on a thread and must not change the environment of the other steps.
+    env = os.environ.copy()
     env["RUSTDOCFLAGS"] = "-Z unstable-options --enable-index-page"
-    return exec_manager.cli_run("cargo +nightly-2026-01-07 docs", name="Documentation build", verbose=verbose)
+    return exec_manager.cli_run(
+        "cargo +nightly-2026-01-07 docs",
+        name="Documentation build",
+        verbose=verbose,
+        env=env,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
+    )
 
 
 def cargo_depgraph(runner: exec_manager.ParallelRunner, *, verbose: bool = False) -> None:
@@ -109,6 +175,8 @@ def cargo_depgraph(runner: exec_manager.ParallelRunner, *, verbose: bool = False
         "cargo depgraph " + "--workspace-only " + "--dedup-transitive-deps " + "> target/doc/workspace.dot ",
         name="Workspace dependency graphs generation",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
 
     runner.run(
@@ -116,6 +184,8 @@ def cargo_depgraph(runner: exec_manager.ParallelRunner, *, verbose: bool = False
         "cargo depgraph " + "--dedup-transitive-deps " + "> target/doc/full.dot ",
         name="Full dependency graphs generation",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
 
     runner.run(
@@ -123,6 +193,8 @@ def cargo_depgraph(runner: exec_manager.ParallelRunner, *, verbose: bool = False
         "cargo depgraph " + "--all-deps " + "--dedup-transitive-deps " + "> target/doc/all.dot ",
         name="All dependency graphs generation",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
 
 
@@ -148,6 +220,8 @@ def cargo_modules_lib(
         COMMON_CARGO_MODULES_ORPHANS + f"--package '{lib}' --lib",
         name=f"Checking Orphans for {lib}",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
 
     if docs:
@@ -157,6 +231,8 @@ def cargo_modules_lib(
             COMMON_CARGO_MODULES_STRUCTURE + f"--package '{lib}' --lib > 'target/doc/{lib}.lib.modules.tree' ",
             name=f"Generate Module Trees for {lib}",
             verbose=verbose,
+            stream=True,
+            sample_interval=MEMORY_SAMPLE_INTERVAL,
         )
         # Generate graph
         runner.run(
@@ -164,6 +240,8 @@ def cargo_modules_lib(
             COMMON_CARGO_MODULES_DEPENDENCIES + f"--package '{lib}' --lib > 'target/doc/{lib}.lib.modules.dot' ",
             name=f"Generate Module Graphs for {lib}",
             verbose=verbose,
+            stream=True,
+            sample_interval=MEMORY_SAMPLE_INTERVAL,
         )
 
 
@@ -181,6 +259,8 @@ def cargo_modules_bin(
         COMMON_CARGO_MODULES_ORPHANS + f"--package '{package}' --bin '{bin_file}'",
         name=f"Checking Orphans for {package}/{bin_file}",
         verbose=verbose,
+        stream=True,
+        sample_interval=MEMORY_SAMPLE_INTERVAL,
     )
 
     if docs:
@@ -191,6 +271,8 @@ def cargo_modules_bin(
             + f"--package '{package}' --bin '{bin_file}' > 'target/doc/{package}.{bin_file}.bin.modules.tree' ",
             name=f"Generate Module Trees for {package}/{bin_file}",
             verbose=verbose,
+            stream=True,
+            sample_interval=MEMORY_SAMPLE_INTERVAL,
         )
         # Generate graph
         runner.run(
@@ -199,6 +281,8 @@ def cargo_modules_bin(
             + f"--package '{package}' --bin '{bin_file}' > 'target/doc/{package}.{bin_file}.bin.modules.dot' ",
             name=f"Generate Module Graphs for {package}/{bin_file}",
             verbose=verbose,
+            stream=True,
+            sample_interval=MEMORY_SAMPLE_INTERVAL,
         )
 
 
@@ -210,6 +294,8 @@ def help_check(results: exec_manager.Results, bin_file: str, *, verbose: bool =
             f"target/release/{bin_file} --help",
             name=f"Executable '{bin_file}' MUST have `--help` as an option.",
             verbose=verbose,
+            stream=True,
+            sample_interval=MEMORY_SAMPLE_INTERVAL,
         ),
     )
 
@@ -230,7 +316,7 @@ def readelf(results: exec_manager.Results, bin_file: str) -> None:
     )
 
 
-def main() -> None:  # noqa: C901
+def main() -> None:  # noqa: C901, PLR0915
     """Rust Standard Build."""
     # Force color output in CI
     rich.reconfigure(color_system="256")
@@ -299,31 +385,35 @@ def main() -> None:  # noqa: C901
         default="",
         help="The list of binaries `cargo-modules` docs to build and make a smoke tests on them.",
     )
+    parser.add_argument(
+        "--fail_fast",
+        action="store_true",
+        help="Stop all remaining steps as soon as one fails, instead of reporting every failure.",
+    )
     args = parser.parse_args()
 
     libs = filter(lambda lib: lib.strip() and len(lib.strip()) > 0, args.libs.split(","))
     bins = list(filter(lambda bin_file: bin_file.strip() and len(bin_file.strip()) > 0, args.bins.split(",")))
 
-    with exec_manager.ParallelRunner("Rust build") as runner:
+    with exec_manager.ParallelRunner("Rust build", jobserver=True, fail_fast=args.fail_fast) as runner:
         # Build the code.
-        runner.run(cargo_build, args.build_flags, verbose=args.verbose)
+        run_compile(runner, cargo_build, args.build_flags, verbose=args.verbose)
 
         # Check the code passes all clippy lint checks.
-        runner.run(cargo_lint, args.lint_flags, verbose=args.verbose)
+        run_compile(runner, cargo_lint, args.lint_flags, verbose=args.verbose)
 
         # Check if all Self contained tests pass (Test that need no external resources).
         # But NOT doc tests, as these are not replacements for unit tests.
         if not args.disable_tests:
             if args.cov_report == "":
                 # Without coverage report
-                runner.run(cargo_nextest, args.test_flags, verbose=args.verbose)
+                run_compile(runner, cargo_nextest, args.test_flags, verbose=args.verbose)
             else:
                 # With coverage report
-                runner.run(cargo_llvm_cov, args.test_flags, args.cov_report, verbose=args.verbose)
-                # pass
+                cargo_llvm_cov(runner, args.test_flags, args.cov_report, verbose=args.verbose)
 
         if not args.disable_benches:
-            runner.run(cargo_bench, args.bench_flags, verbose=args.verbose)
+            run_compile(runner, cargo_bench, args.bench_flags, verbose=args.verbose)
 
         # Generate all the documentation. Ensure the path docs make in exists first.
         # We need this even if we aren't making docs.
@@ -331,7 +421,7 @@ def main() -> None:  # noqa: C901
             # Make sure docs path exists before making any docs.
             Path("target/doc").mkdir(parents=True, exist_ok=True)
             # Generate rust docs.
-            runner.run(cargo_doc, verbose=args.verbose)
+            run_compile(runner, cargo_doc, verbose=args.verbose)
             # Generate dependency graphs
             cargo_depgraph(runner, verbose=args.verbose)
 
@@ -343,17 +433,26 @@ def main() -> None:  # noqa: C901
             package, bin_name = bin_file.split("/")
             cargo_modules_bin(runner, package, bin_name, docs=not args.disable_docs, verbose=args.verbose)
 
-        results = runner.get_results()
+        # Check if all Self contained doc tests pass (Test that need no external resources).
+        # Can not be run in parallel with the other builds as it becomes flaky and randomly fails,
+        # so it waits for all of them, and runs even if some of them failed.
+        # NOTE: DocTests are ONLY run to prove they are valid, they are NOT unit tests, and never
+        # currently contribute to code coverage.
+        if not args.disable_tests:
+            # Check if all documentation tests pass.
+            run_compile(
+                runner,
+                cargo_doctest,
+                args.doctest_flags,
+                after=list(runner.tasks),
+                always=True,
+                verbose=args.verbose,
+            )
 
-    # Check if all Self contained doc tests pass (Test that need no external resources).
-    # Can not be run in parallel with the normal builds as it becomes flaky and randomly fails.
-    # NOTE: DocTests are ONLY run to prove they are valid, they are NOT unit tests, and never
-    # currently contribute to code coverage.
-    if not args.disable_tests:
-        # Check if all documentation tests pass.
-        results.add(cargo_doctest(args.doctest_flags, verbose=args.verbose))
+        results = runner.get_results()
 
     results.print()
+    results.save()
     if not results.ok():
         sys.exit(1)
 
@@ -367,6 +466,7 @@ def main() -> None:  # noqa: C901
         readelf(results, bin_name)
 
     results.print()
+    results.save()
     if not results.ok():
         sys.exit(1)
 
@@ -3,8 +3,8 @@
 # cspell: words stdcfgs
 
 import argparse
-import os
 import sys
+from pathlib import Path
 
 import rich
 from python import exec_manager, vendor_files_check
@@ -22,6 +22,51 @@ from rich import print  # noqa: A004
 # to pass without needing to iterate excessively.
 
 
+# Every `Cargo.toml` must fit one of these templates.
+CARGO_MANIFEST_TEMPLATES = [
+    "/stdcfgs/cargo_manifest/workspace.toml",
+    "/stdcfgs/cargo_manifest/workspace_inherit.toml",
+    "/stdcfgs/cargo_manifest/project.toml",
+]
+
+
+def check_cargo_manifests() -> list[exec_manager.Result]:
+    """Check every `Cargo.toml` in the tree fits one of the manifest templates.
+
+    The templates are parsed once, and the manifests are checked in parallel.
+    `target` and `.git` are not searched for manifests.
+
+    :return: The result of parsing the templates, and of the check with the template each manifest matched.
+    :rtype: list[exec_manager.Result]
+    """
+    templates, parsed = vendor_files_check.load_toml_templates(CARGO_MANIFEST_TEMPLATES)
+    if not parsed.ok():
+        parsed.print(verbose_errors=True)
+        return [parsed]
+
+    manifests = vendor_files_check.find_files("Cargo.toml")
+    with exec_manager.ParallelRunner("Cargo Manifests", progress=False) as runner:
+        for manifest in manifests:
+            runner.run(vendor_files_check.toml_templates_check, templates, manifest, strict=False, name=manifest)
+        checked = sorted(runner.get_results().results, key=exec_manager.Result.get_name)
+
+    def procedure() -> exec_manager.ProcedureResult:
+        report = []
+        for res in checked:
+            if res.ok():
+                report.append(f"{res.get_name()}: {Path(res.out).name}")
+            else:
+                report.append(f"{res.get_name()}: fits no template\n{res.out}")
+        failed = sum(not res.ok() for res in checked)
+        return exec_manager.ProcedureResult(
+            1 if failed else 0,
+            f"{len(manifests)} manifests against {', '.join(Path(path).name for path in templates)}",
+            "\n".join(report),
+        )
+
+    return [parsed, exec_manager.procedure_run(procedure, "Cargo Manifest Check", verbose=True)]
+
+
 def main() -> None:
     """Rust Standard Checks."""
     rust_toolchain_enabled = False
@@ -29,56 +74,36 @@ def main() -> None:
     # Force color output in CI
     rich.reconfigure(color_system="256")
 
-    argparse.ArgumentParser(description="Rust high level non-compilation checks processing.")
+    parser = argparse.ArgumentParser(description="Rust high level non-compilation checks processing.")
+    parser.add_argument(
+        "--fix",
+        action="store_true",
+        help="Rewrite config files which differ from the vendored ones, and report what was changed",
+    )
+    args = parser.parse_args()
 
     results = exec_manager.Results("Rust checks")
 
     # Check config files.
-    # Looking for 'Cargo.toml' files
-    for root, _, files in os.walk("./"):
-        for file_name in files:
-            if file_name == "Cargo.toml":
-                cargo_toml_path = f"{root}/{file_name}"
-                # it should fits one of the template
-                res1 = vendor_files_check.toml_diff_check(
-                    "/stdcfgs/cargo_manifest/workspace.toml",
-                    cargo_toml_path,
-                    strict=False,
-                    log=False,
-                )
-                res2 = vendor_files_check.toml_diff_check(
-                    "/stdcfgs/cargo_manifest/workspace_inherit.toml",
-                    cargo_toml_path,
-                    strict=False,
-                    log=False,
-                )
-                res3 = vendor_files_check.toml_diff_check(
-                    "/stdcfgs/cargo_manifest/project.toml",
-                    cargo_toml_path,
-                    strict=False,
-                    log=False,
-                )
-                if not res1.ok() and not res2.ok() and not res3.ok():
-                    res1.print(verbose_errors=True)
-                    res2.print(verbose_errors=True)
-                    res3.print(verbose_errors=True)
-                    results.add(res1)
-                    results.add(res2)
-                    results.add(res3)
-
-    results.add(vendor_files_check.toml_diff_check("/stdcfgs/cargo_config.toml", ".cargo/config.toml"))
+    results.add(check_cargo_manifests())
+
+    vendored = [
+        vendor_files_check.VendorCheck("/stdcfgs/cargo_config.toml", ".cargo/config.toml"),
+        vendor_files_check.VendorCheck("/stdcfgs/rustfmt.toml", "rustfmt.toml"),
+        vendor_files_check.VendorCheck("/stdcfgs/nextest.toml", ".config/nextest.toml"),
+        vendor_files_check.VendorCheck("/stdcfgs/clippy.toml", "clippy.toml"),
+        vendor_files_check.VendorCheck("/stdcfgs/deny.toml", "deny.toml"),
+    ]
     if rust_toolchain_enabled:
-        results.add(
-            vendor_files_check.toml_diff_check(
+        vendored.insert(
+            1,
+            vendor_files_check.VendorCheck(
                 "/stdcfgs/rust-toolchain.toml",
                 "rust-toolchain.toml",
-                strict=False,
+                vendor_files_check.TOML_NON_STRICT,
             ),
         )
-    results.add(vendor_files_check.toml_diff_check("/stdcfgs/rustfmt.toml", "rustfmt.toml"))
-    results.add(vendor_files_check.toml_diff_check("/stdcfgs/nextest.toml", ".config/nextest.toml"))
-    results.add(vendor_files_check.toml_diff_check("/stdcfgs/clippy.toml", "clippy.toml"))
-    results.add(vendor_files_check.toml_diff_check("/stdcfgs/deny.toml", "deny.toml"))
+    results.add(vendor_files_check.check_vendor_files(vendored, fix=args.fix))
 
     # Check if the rust src is properly formatted.
     res = exec_manager.cli_run("cargo +nightly-2026-01-07 fmtchk ", name="Rust Code Format Check")
@@ -90,16 +115,28 @@ def main() -> None:
         )
 
     # Check if we have unused dependencies declared in our Cargo.toml files.
-    results.add(exec_manager.cli_run("cargo machete", name="Unused Dependencies Check"))
+    # It searches the sources for the use of each dependency, so any source change is an input.
+    results.add(
+        exec_manager.cli_run(
+            "cargo machete",
+            name="Unused Dependencies Check",
+            cache=exec_manager.CacheSpec(inputs=["."], tools=["cargo machete --version"]),
+        ),
+    )
     # Check if we have any supply chain issues with dependencies.
+    # It only reads the lock file, the manifests and its config, so source changes don't invalidate it.
+    # The advisory database changes independently of the repo, so cached results expire daily.
+    deny_inputs = ["Cargo.lock", "deny.toml", *vendor_files_check.find_files("Cargo.toml")]
     results.add(
         exec_manager.cli_run(
             "cargo deny check --exclude-dev -W vulnerability -W unmaintained",
             name="Supply Chain Issues Check",
+            cache=exec_manager.CacheSpec(inputs=deny_inputs, tools=["cargo deny --version"], max_age=24 * 60 * 60),
         ),
     )
 
     results.print()
+    results.save()
     if not results.ok():
         sys.exit(1)
 
@@ -86,6 +86,7 @@ def main() -> None:
     wasm_tools_gen_component(results, args.out)
 
     results.print()
+    results.save()
     if not results.ok():
         sys.exit(1)
 
@@ -3,16 +3,34 @@
 # cspell: words dbhost dbport dbname dbuser dbuserpw dbsuperuser dbsuperuserpw
 # cspell: words dbnamesuperuser dbdescription dbpath dbauthmethod dbcollation
 # cspell: words dbreadytimeout setupdbsql dbrefinerytoml dbmigrations
-# cspell: words dbseeddatasrc pwfile pgctl rtype initdb isready
+# cspell: words dbseeddatasrc pwfile pgctl rtype initdb isready postmaster SQLSTATE
+# cspell: words dbinprocess psycopg dbclustercache reflink conrelid confrelid conname conindid
+# cspell: words dbworkers dbworkermode dbworkerurls
+# cspell: words fsync statvfs frsize bavail dbmigrationreport dblargetablemb relfilenode nspname
+# cspell: words indexrelid indrelid inhrelid conparentid convalidated relowner relkind regclass
 
 import argparse
+import contextlib
+import csv
+import hashlib
+import json
 import os
+import re
+import shlex
+import shutil
+import socket
+import struct
 import tempfile
 import threading
 import time
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import Any, Self
 
-from python import exec_manager
+import psycopg
+from rich import print  # noqa: A004
+
+from python import exec_manager, refinery, sql_script
 
 DB_ARGUMENTS = [
     ["dbhost", "DB_HOST", "localhost"],
@@ -35,8 +53,198 @@ DB_ARGUMENTS = [
     ["init_and_drop_db", "INIT_AND_DROP_DB", False],
     ["with_migrations", "WITH_MIGRATIONS", False],
     ["with_seed_data", "WITH_SEED_DATA", None],
+    ["dbinprocess", "DB_IN_PROCESS", False],
+    ["dbclustercache", "DB_CLUSTER_CACHE", None],
+    ["dbprofile", "DB_PROFILE", "default"],
+    ["dbtmpfs", "DB_TMPFS", False],
+    ["dbmigrationreport", "DB_MIGRATION_REPORT", None],
+    ["dblargetablemb", "DB_LARGE_TABLE_MB", 100],
+    ["dbworkers", "DB_WORKERS", 0],
+    ["dbworkermode", "DB_WORKER_MODE", "database"],
+    ["dbworkerurls", "DB_WORKER_URLS", None],
 ]
 
+# First and largest delay between database readiness probes, in seconds.
+READY_PROBE_FIRST_DELAY = 0.005
+READY_PROBE_MAX_DELAY = 0.1
+# The `postmaster.pid` statuses of a server which can not accept connections yet, it is not probed then.
+POSTMASTER_NOT_READY = frozenset({"starting", "stopping"})
+# Seconds between probes even while the server is not ready, in case `postmaster.pid` is stale.
+READY_PROBE_FALLBACK = 1.0
+
+# Probe results, the same as the exit codes of `pg_isready`.
+PROBE_ACCEPTING = 0
+PROBE_REJECTING = 1
+PROBE_NO_RESPONSE = 2
+
+# How many migrated clusters `DBOps.save_cluster` keeps in the cluster cache.
+CLUSTER_CACHE_KEEP = 2
+
+# The stock `postgresql.auto.conf`, as `initdb` writes it.
+AUTO_CONF_HEADER = """# Do not edit this file manually!
+# It will be overwritten by the ALTER SYSTEM command.
+"""
+
+# Where `DB_TMPFS` puts the data directory, and the free space it needs to be used.
+TMPFS_DIR = "/dev/shm"  # noqa: S108
+TMPFS_MIN_FREE_MB = 256
+
+# The user tables and materialized views of the database, with their data file and size.
+RELATIONS_QUERY = """SELECT c.oid, c.oid::regclass::text, c.relfilenode, pg_total_relation_size(c.oid)
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'm') AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+AND n.nspname NOT LIKE 'pg_toast%'"""
+
+# The locks the current transaction holds on relations which still exist,
+# those with an oid below 16384 are built in.
+LOCKS_QUERY = """SELECT l.relation, l.relation::regclass::text, l.mode
+FROM pg_locks l JOIN pg_class c ON c.oid = l.relation JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE l.pid = pg_backend_pid() AND l.locktype = 'relation' AND l.granted AND l.relation >= 16384
+AND l.database = (SELECT oid FROM pg_database WHERE datname = current_database()) AND n.nspname <> 'pg_toast'
+ORDER BY 2, 3"""
+
+# The rows inserted, updated and deleted by this connection, since its statistics were last reported.
+ROWS_QUERY = """SELECT relid::regclass::text, n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_xact_user_tables
+WHERE n_tup_ins + n_tup_upd + n_tup_del > 0 ORDER BY 1"""
+
+# Protocol version 3.0, sent in the startup message.
+PROTOCOL_VERSION = 196608
+# SQLSTATE sent by a server which is still starting up, or is shutting down.
+CANNOT_CONNECT_NOW = "57P03"
+
+# The tables a SQL seed data file loads, from its `INSERT INTO table` and `COPY table` statements.
+SEED_TARGET = re.compile(
+    r'^\s*(?:INSERT\s+INTO|COPY)\s+((?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)',
+    re.IGNORECASE | re.MULTILINE,
+)
+# The order prefix of a CSV seed data file name, like `01_` in `01_event.csv`.
+SEED_ORDER_PREFIX = re.compile(r"^\d+[_-]")
+# The size of the chunks CSV seed data is streamed to the server in.
+SEED_COPY_CHUNK = 1024 * 1024
+
+
+def postmaster_status(dbpath: str) -> str | None:
+    """Read the status of the server from the `postmaster.pid` file in its data directory.
+
+    Args:
+        dbpath (str): The data directory of the server.
+
+    Returns:
+        str | None: The status, like `starting` or `ready`, or None if the server is not running
+            or is too old to report it.
+
+    """
+    try:
+        lines = (Path(dbpath) / "postmaster.pid").read_text().splitlines()
+    except OSError:
+        return None
+    # Line 8 holds the status, once the postmaster has written it.
+    return lines[7].strip() if len(lines) > 7 else None  # noqa: PLR2004
+
+
+def probe_server(host: str, port: int, user: str, dbname: str, timeout: float) -> int:
+    """Check if a server accepts connections, by sending it a startup message.
+
+    Like `pg_isready`, a server which asks to authenticate, or refuses the login for
+    any other reason than still starting up, is accepting connections.
+
+    Args:
+        host (str): The host of the server.
+        port (int): The port of the server.
+        user (str): The user to connect as.
+        dbname (str): The database to connect to.
+        timeout (float): The maximum time to wait for the server to answer, in seconds.
+
+    Returns:
+        int: PROBE_ACCEPTING, PROBE_REJECTING or PROBE_NO_RESPONSE.
+
+    """
+    params = f"user\0{user}\0database\0{dbname}\0\0".encode()
+    startup = struct.pack("!ii", len(params) + 8, PROTOCOL_VERSION) + params
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as conn:
+            conn.sendall(startup)
+            reply = conn.recv(1024)
+    except OSError:
+        return PROBE_NO_RESPONSE
+
+    if reply[:1] == b"R":
+        return PROBE_ACCEPTING
+    if reply[:1] == b"E":
+        # The error is a list of fields, each a type byte followed by a string, `C` is the SQLSTATE.
+        fields = {field[:1]: field[1:] for field in reply[5:].split(b"\0") if field}
+        if fields.get(b"C", b"").decode(errors="replace") == CANNOT_CONNECT_NOW:
+            return PROBE_REJECTING
+        return PROBE_ACCEPTING
+    return PROBE_NO_RESPONSE
+
+
+def flag(value: Any) -> bool:  # noqa: ANN401
+    """Interpret a command line argument or environment variable as a boolean.
+
+    Args:
+        value: The value, like `True`, `"true"` or `"0"`.
+
+    Returns:
+        bool: True for `true`, `yes`, `on` or `1`, ignoring case.
+
+    """
+    return str(value).strip().lower() in ("true", "yes", "on", "1")
+
+
+def ephemeral_settings(memory_mb: int) -> dict[str, str]:
+    """Return the settings of a database which is thrown away after use, so it never needs to survive a crash.
+
+    Nothing is flushed to disk, only the minimal WAL is written, and checkpoints are rare.
+    Memory settings are sized from the available memory, within sensible bounds.
+
+    Args:
+        memory_mb (int): The memory available to the database, in MiB.
+
+    Returns:
+        dict[str, str]: The settings, by name.
+
+    """
+
+    def size(fraction: int, low: int, high: int) -> str:
+        return f"{max(low, min(high, memory_mb // fraction))}MB"
+
+    return {
+        "fsync": "off",
+        "synchronous_commit": "off",
+        "full_page_writes": "off",
+        "wal_level": "minimal",
+        "max_wal_senders": "0",
+        "max_wal_size": "4GB",
+        "checkpoint_timeout": "1h",
+        "shared_buffers": size(8, 128, 2048),
+        "work_mem": size(64, 4, 256),
+        "maintenance_work_mem": size(16, 64, 1024),
+    }
+
+
+def tmpfs_path(dbpath: str) -> str | None:
+    """Find where the data directory can be put on tmpfs.
+
+    Args:
+        dbpath (str): The data directory.
+
+    Returns:
+        str | None: The data directory under `TMPFS_DIR`, None if it is not a writable tmpfs
+            with at least `TMPFS_MIN_FREE_MB` free.
+
+    """
+    try:
+        mounts = Path("/proc/mounts").read_text().splitlines()
+        stat = os.statvfs(TMPFS_DIR)
+    except OSError:
+        return None
+    if not any(mount.split()[1:3] == [TMPFS_DIR, "tmpfs"] for mount in mounts):
+        return None
+    if not os.access(TMPFS_DIR, os.W_OK) or stat.f_bavail * stat.f_frsize < TMPFS_MIN_FREE_MB * 1024 * 1024:
+        return None
+    return f"{TMPFS_DIR}/postgres-{Path(dbpath).name}"
+
 
 def add_args(parser: argparse.ArgumentParser) -> None:
     """Add the command line arguments to the given `argparse.ArgumentParser` object.
@@ -55,6 +263,191 @@ def add_args(parser: argparse.ArgumentParser) -> None:
         )
 
 
+@dataclass
+class SeedFile:
+    """A seed data file.
+
+    Attributes:
+        path: The file.
+        tables: The tables it loads, as SQL names.
+            A CSV file loads the table it is named after, like `01_event.csv` or `public.event.csv`.
+        columns: The columns a CSV file loads, from its header line.
+
+    """
+
+    path: Path
+    tables: list[str]
+    columns: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_file(cls, path: Path) -> Self:
+        """Read which tables a seed data file loads.
+
+        :return: The seed data file.
+        :rtype: SeedFile
+        """
+        if path.suffix == ".csv":
+            with path.open(newline="") as file:
+                header = next(csv.reader(file), [])
+            name = SEED_ORDER_PREFIX.sub("", path.stem)
+            table = ".".join(sql_script.quote_ident(part) for part in name.split("."))
+            return cls(path, [table], header)
+        return cls(path, list(dict.fromkeys(SEED_TARGET.findall(path.read_text()))))
+
+    def copy_statement(self) -> str:
+        """Return the `COPY ... FROM STDIN` statement which loads a CSV file."""
+        columns = ", ".join(sql_script.quote_ident(column) for column in self.columns)
+        return f"COPY {self.tables[0]} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)"
+
+
+def seed_dependencies(
+    seeds: list[SeedFile],
+    oids: dict[str, int | None],
+    references: dict[int, set[int]],
+) -> list[set[int]]:
+    """Find the seed data files each file must be loaded after, see `seed_order`.
+
+    :return: The indexes of the files each file depends on.
+    :rtype: list[set[int]]
+    """
+    loaded_by: dict[int, list[int]] = {}
+    for index, seed in enumerate(seeds):
+        for table in seed.tables:
+            if oids[table] is not None:
+                loaded_by.setdefault(oids[table], []).append(index)
+
+    return [
+        {
+            other
+            for table in seed.tables
+            if oids[table] is not None
+            for referenced in [oids[table], *references.get(oids[table], ())]
+            for other in loaded_by.get(referenced, ())
+            if other < index or (other != index and referenced != oids[table])
+        }
+        for index, seed in enumerate(seeds)
+    ]
+
+
+def seed_order(
+    seeds: list[SeedFile],
+    oids: dict[str, int | None],
+    references: dict[int, set[int]],
+) -> list[tuple[SeedFile, list[int]]]:
+    """Order seed data files by the foreign keys between the tables they load.
+
+    A file is loaded after the files loading the tables its tables reference, and after the
+    files before it in name order which load the same tables.
+    Files loading unknown tables, tables in a cycle of references, or tables loaded by such
+    files, are loaded last, one after the other.  Among them, a file still comes after the
+    files it depends on unless they are in a cycle, otherwise they keep their name order.
+
+    Args:
+        seeds (list[SeedFile]): The seed data files, in name order.
+        oids (dict[str, int | None]): The oid of every table the files load, None for unknown tables.
+        references (dict[int, set[int]]): The tables each table references, by oid.
+
+    Returns:
+        list[tuple[SeedFile, list[int]]]: The files in an order they can be scheduled in, each with
+            the positions in that order of the files it must be loaded after.
+
+    """
+    depends = seed_dependencies(seeds, oids, references)
+    unordered = {
+        index for index, seed in enumerate(seeds) if not seed.tables or None in (oids[table] for table in seed.tables)
+    }
+
+    position: dict[int, int] = {}
+    ready = True
+    while ready:
+        ready = [
+            index
+            for index in range(len(seeds))
+            if index not in position and index not in unordered and depends[index] <= position.keys()
+        ]
+        for index in ready:
+            position[index] = len(position)
+    ordered = [(seeds[index], sorted(position[dep] for dep in depends[index])) for index in position]
+
+    # Whatever is left can't be ordered, so load it after everything else, one file at a time.
+    left = [index for index in range(len(seeds)) if index not in position]
+
+    def depends_on(start: int) -> set[int]:
+        """Find the files left which a file depends on, directly or not."""
+        found = set()
+        todo = [start]
+        while todo:
+            for dep in depends[todo.pop()]:
+                if dep in left and dep not in found:
+                    found.add(dep)
+                    todo.append(dep)
+        return found
+
+    after = list(range(len(ordered)))
+    while left:
+        index = next((index for index in left if depends[index] <= position.keys()), None)
+        if index is None:
+            # Break a cycle, at a file which only waits for files which wait for it.
+            index = next(
+                index for index in left if all(index in depends_on(dep) for dep in depends[index] if dep in left)
+            )
+        left.remove(index)
+        position[index] = len(position)
+        ordered.append((seeds[index], after))
+        after = [len(ordered) - 1]
+    return ordered
+
+
+@dataclass
+class MigrationReport:
+    """What applying a migration did, to predict how it behaves on a production database.
+
+    Attributes:
+        migration: The migration, as its file is named.
+        duration: How long it took to apply, in seconds.
+        rows: The rows inserted, updated or deleted, by table.
+        rewrites: The tables whose data was rewritten.
+        locks: The lock modes held until the migration was committed, by relation.
+        warnings: Locks which block all access to a large table while the migration runs.
+
+    """
+
+    migration: str
+    duration: float = 0.0
+    rows: dict[str, int] = field(default_factory=dict)
+    rewrites: list[str] = field(default_factory=list)
+    locks: dict[str, list[str]] = field(default_factory=dict)
+    warnings: list[str] = field(default_factory=list)
+
+    def summary(self) -> list[str]:
+        """Summarize the report, one line per item.
+
+        :return: The lines.
+        :rtype: list[str]
+        """
+        elapsed = exec_manager.format_execution_time(self.duration)
+        lines = [f"{self.migration} : {elapsed} : {sum(self.rows.values())} rows : {len(self.rewrites)} rewrites"]
+        lines += [f"  rows : {table} : {rows}" for table, rows in self.rows.items()]
+        lines += [f"  rewrite : {table}" for table in self.rewrites]
+        lines += [f"  lock : {relation} : {', '.join(modes)}" for relation, modes in self.locks.items()]
+        lines += [f"  WARNING : {warning}" for warning in self.warnings]
+        return lines
+
+
+@dataclass
+class DeferredSchema:
+    """The indexes and foreign keys dropped while seed data loads, to be recreated once it is loaded.
+
+    Attributes:
+        indexes: The name and `CREATE INDEX` statement of each dropped index.
+        foreign_keys: The table, name, definition and whether it was validated, of each dropped foreign key.
+
+    """
+
+    indexes: list[tuple[str, str]] = field(default_factory=list)
+    foreign_keys: list[tuple[str, str, str, bool]] = field(default_factory=list)
+
+
 class DBOps:
     """DB Operations."""
 
@@ -69,6 +462,19 @@ class DBOps:
 
         """
         self.args = args
+        # Setup, migrations and seed data run over pooled connections instead of `psql` and `refinery`.
+        self.in_process = flag(args.dbinprocess)
+        self.connections: dict[str, psycopg.Connection] = {}
+        self.notices: list[str] = []
+        # The databases provisioned for test workers by `provision_workers`.
+        self.workers: list[DBOps] = []
+
+        if flag(args.dbtmpfs):
+            tmpfs = tmpfs_path(args.dbpath)
+            if tmpfs is None:
+                print(f"[yellow]{TMPFS_DIR} is not a usable tmpfs, keeping the database in {args.dbpath}[/yellow]")
+            else:
+                args.dbpath = tmpfs
 
     def user_connection(self) -> str:
         """Generate a connection string for the user.
@@ -116,6 +522,149 @@ class DBOps:
 
         return res
 
+    def configure(self) -> exec_manager.Result:
+        """Write the settings of the `dbprofile` profile to `postgresql.auto.conf`.
+
+        The `default` profile keeps the stock settings, `ephemeral` uses `ephemeral_settings`.
+        It is written before every start, so a cached cluster gets the profile of the current run.
+
+        :return: The result of writing the settings.
+        :rtype: exec_manager.Result
+        """
+        profile = self.args.dbprofile
+
+        def procedure() -> exec_manager.ProcedureResult:
+            if profile == "default":
+                settings = {}
+            elif profile == "ephemeral":
+                settings = ephemeral_settings(exec_manager.available_memory_mb())
+            else:
+                return exec_manager.ProcedureResult(1, f"profile {profile}", "Unknown database profile")
+
+            lines = [f"{name} = '{value}'" for name, value in settings.items()]
+            try:
+                Path(self.args.dbpath, "postgresql.auto.conf").write_text(AUTO_CONF_HEADER + "\n".join([*lines, ""]))
+            except OSError as exc:
+                return exec_manager.ProcedureResult(1, f"profile {profile}", str(exc))
+            return exec_manager.ProcedureResult(0, f"profile {profile}", "\n".join(lines))
+
+        return exec_manager.procedure_run(procedure, "Configure Database", verbose=True)
+
+    def cluster_cache_key(self) -> str:
+        """Hash everything a migrated cluster depends on, to find it in the cluster cache.
+
+        That is the Postgres version, the database settings and credentials,
+        `setup-db.sql`, `refinery.toml` and every file in the migrations directory.
+
+        :return: The cache key.
+        :rtype: str
+        """
+        digest = hashlib.sha256()
+        settings = [
+            exec_manager.tool_version("initdb --version"),
+            *(
+                str(getattr(self.args, name))
+                for name in (
+                    "dbname",
+                    "dbuser",
+                    "dbuserpw",
+                    "dbsuperuser",
+                    "dbsuperuserpw",
+                    "dbdescription",
+                    "dbauthmethod",
+                    "dbcollation",
+                )
+            ),
+        ]
+        for setting in settings:
+            digest.update(setting.encode() + b"\0")
+
+        migrations = Path(self.args.dbmigrations)
+        files = [Path(self.args.setupdbsql), Path(self.args.dbrefinerytoml)]
+        files += sorted(path for path in migrations.rglob("*") if path.is_file())
+        for path in files:
+            digest.update(str(path.relative_to(migrations) if path.is_relative_to(migrations) else path).encode())
+            digest.update(b"\0" + (hashlib.sha256(path.read_bytes()).digest() if path.is_file() else b"missing"))
+
+        return digest.hexdigest()
+
+    def restore_cluster(self) -> exec_manager.Result | None:
+        """Restore a migrated cluster from the cluster cache, instead of creating it.
+
+        :return: The result of copying the cached cluster into `dbpath`,
+            None if there is no cluster cache or it holds no cluster for our migrations.
+        :rtype: exec_manager.Result | None
+        """
+        if not self.args.dbclustercache:
+            return None
+        cached = Path(self.args.dbclustercache) / self.cluster_cache_key()
+        if not cached.is_dir():
+            return None
+
+        # Mark the cluster as recently used.
+        cached.touch()
+        Path(self.args.dbpath).mkdir(parents=True, exist_ok=True)
+        res = exec_manager.cli_run(
+            f'cp -a --reflink=auto "{cached}/." "{self.args.dbpath}/"',
+            name="Restore Cached Database",
+        )
+        if not res.ok():
+            # Leave an empty data directory, so it can be initialized instead.
+            for path in Path(self.args.dbpath).iterdir():
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+        return res
+
+    def save_cluster(self, timeout: float | None = None) -> list[exec_manager.Result]:
+        """Save the migrated cluster in the cluster cache, for `restore_cluster`.
+
+        The server is stopped while its data directory is copied, and started again.
+        Only the `CLUSTER_CACHE_KEEP` most recently used clusters are kept.
+
+        Args:
+            timeout: The maximum number of seconds to wait for the database to be ready again.
+
+        Returns:
+            list[exec_manager.Result]: The results of saving the cluster.
+
+        """
+        cache = Path(self.args.dbclustercache)
+        cache.mkdir(parents=True, exist_ok=True)
+        cached = cache / self.cluster_cache_key()
+        staging = cache / f"{cached.name}.tmp-{os.getpid()}"
+
+        results = [self.stop()]
+        if results[-1].ok():
+            results.append(
+                exec_manager.cli_run(
+                    f'cp -a --reflink=auto "{self.args.dbpath}" "{staging}"',
+                    name="Save Cached Database",
+                ),
+            )
+            if results[-1].ok():
+                # Another build may have saved the same cluster meanwhile, either is fine.
+                try:
+                    staging.rename(cached)
+                except OSError:
+                    shutil.rmtree(staging, ignore_errors=True)
+            else:
+                shutil.rmtree(staging, ignore_errors=True)
+
+            self.start()
+            results.append(self.wait_ready(timeout))
+
+        clusters = sorted(
+            (path for path in cache.iterdir() if path.is_dir() and ".tmp-" not in path.name),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True,
+        )
+        for path in clusters[CLUSTER_CACHE_KEEP:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+        return results
+
     def __start(self) -> None:
         """Start the database.
 
@@ -159,7 +708,30 @@ class DBOps:
 
         proc = threading.Thread(target=self.__start, daemon=True)
         proc.start()
-        time.sleep(0.1)  # Give the thread a chance to actually run.
+
+    def stop(self) -> exec_manager.Result:
+        """Stop the database server, once all sessions have been terminated.
+
+        :return: The result of the `pg_ctl stop` command.
+        :rtype: exec_manager.Result
+        """
+        self.close()
+        self.stop_workers()
+        return exec_manager.cli_run(
+            f'pg_ctl -D "{self.args.dbpath}" stop -m fast',
+            name="Stopping Database",
+            verbose=True,
+        )
+
+    def stop_workers(self) -> list[exec_manager.Result]:
+        """Stop the clusters of the test workers, if they have their own.
+
+        :return: The results of stopping them.
+        :rtype: list[exec_manager.Result]
+        """
+        results = [worker.stop() for worker in self.workers if worker.args.dbpath != self.args.dbpath]
+        self.workers = []
+        return results
 
     def db_ready(self) -> exec_manager.Result:
         """Check if the database is ready for use.
@@ -168,27 +740,231 @@ class DBOps:
         """
         return exec_manager.cli_run(f"pg_isready -d {self.superuser_connection()}", name="Database Ready")
 
-    def wait_ready(self, timeout: int | None = None) -> exec_manager.Result:
+    @exec_manager.subprocess_bound
+    def wait_ready(self, timeout: float | None = None) -> exec_manager.Result:
         """Wait for the database to be ready within the specified timeout period.
 
+        While the server in `dbpath` is still starting up or stopping, mostly its `postmaster.pid`
+        is read, and it is only probed every READY_PROBE_FALLBACK seconds.  In any other state,
+        like `ready` or `standby`, the server is probed directly over the protocol, with an exponential
+        backoff starting at a few milliseconds, so this returns as soon as the server is up.
+
         Args:
             timeout: The maximum number of seconds to wait for the database to be ready.
-                     Defaults to None.
+                     Defaults to None, wait forever.
 
         Returns:
         -------
-            exec_manager.Result: An object representing the result of the database readiness check.
+            exec_manager.Result: An object representing the result of the database readiness check,
+                its runtime is the time it took for the database to become ready.
 
         """
-        start_time = time.perf_counter()
+        host, port = self.args.dbhost, int(self.args.dbport)
 
-        while not self.db_ready().ok() and (time is None or time.perf_counter() - start_time < timeout):
-            time.sleep(1)
+        def procedure() -> exec_manager.ProcedureResult:
+            deadline = None if timeout is None else time.perf_counter() + float(timeout)
+            delay = READY_PROBE_FIRST_DELAY
+            probes = 0
+            rc = PROBE_NO_RESPONSE
+            last_status = None
+            last_probe = float("-inf")
+            while True:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                status = postmaster_status(self.args.dbpath)
+                if status != last_status:
+                    # The server moved on, so start probing quickly again.
+                    delay = READY_PROBE_FIRST_DELAY
+                    last_status = status
+                now = time.perf_counter()
+                if status not in POSTMASTER_NOT_READY or now - last_probe >= READY_PROBE_FALLBACK:
+                    last_probe = now
+                    probes += 1
+                    rc = probe_server(
+                        host,
+                        port,
+                        self.args.dbsuperuser,
+                        self.args.dbnamesuperuser,
+                        max(0.01, min(1.0, remaining)) if remaining is not None else 1.0,
+                    )
+                    if rc == PROBE_ACCEPTING:
+                        break
+                if remaining is not None and remaining <= 0:
+                    break
+                time.sleep(delay if remaining is None else max(0.0, min(delay, remaining)))
+                delay = min(delay * 2, READY_PROBE_MAX_DELAY)
 
-        res = self.db_ready()
-        res.runtime = time.perf_counter() - start_time
+            state = ["accepting connections", "rejecting connections", "no response"][rc]
+            return exec_manager.ProcedureResult(
+                rc, f"wait_ready {host}:{port}", f"{host}:{port} - {state} ({probes} probes)"
+            )
 
-        return res
+        return exec_manager.procedure_run(procedure, "Database Ready")
+
+    def connection(self, role: str = "user") -> psycopg.Connection:
+        """Get the pooled connection of a role, connecting if there is none yet.
+
+        Connections are in autocommit mode, like `psql`.
+
+        Args:
+            role (str, optional): `superuser` or `user`. Defaults to "user".
+
+        Returns:
+            psycopg.Connection: The connection.
+
+        """
+        conn = self.connections.get(role)
+        if conn is None or conn.closed or conn.broken:
+            conn = self.connect(role, self.notices)
+            self.connections[role] = conn
+        return conn
+
+    def connect(self, role: str, notices: list[str]) -> psycopg.Connection:
+        """Open a new connection of a role, outside the pool, in autocommit mode.
+
+        Args:
+            role (str): `superuser` or `user`.
+            notices (list[str]): The list notices from the server are added to.
+
+        Returns:
+            psycopg.Connection: The connection, the caller closes it.
+
+        """
+        conn = psycopg.connect(
+            self.superuser_connection() if role == "superuser" else self.user_connection(),
+            autocommit=True,
+        )
+        conn.add_notice_handler(lambda diag: notices.append(f"{diag.severity}: {diag.message_primary}"))
+        return conn
+
+    def close(self, role: str | None = None) -> None:
+        """Close the pooled connections, or only the one of a role.
+
+        Args:
+            role (str | None, optional): The role to close the connection of. Defaults to None, all of them.
+
+        """
+        for name in [role] if role else list(self.connections):
+            conn = self.connections.pop(name, None)
+            if conn is not None:
+                conn.close()
+
+    def execute(
+        self,
+        conn: psycopg.Connection,
+        commands: list[sql_script.Statement | sql_script.MetaCommand],
+        out: list[str],
+        timings: list[tuple[float, sql_script.Statement]],
+        notices: list[str] | None = None,
+    ) -> None:
+        r"""Execute the statements of a script over a connection, one at a time.
+
+        The output of `\echo` and any notices are added to `out`, and the time taken
+        by each statement is added to `timings`.
+
+        Args:
+            conn (psycopg.Connection): The connection to use.
+            commands (list[sql_script.Statement | sql_script.MetaCommand]): The parsed script.
+            out (list[str]): The output of the script.
+            timings (list[tuple[float, sql_script.Statement]]): The time each statement took.
+            notices (list[str] | None, optional): Where the connection collects its notices.
+                Defaults to None, the notices of the pooled connections.
+
+        Raises:
+            ValueError: If the script uses a meta-command other than `\echo`.
+            psycopg.Error: If a statement fails, with a note of which one.
+
+        """
+        notices = self.notices if notices is None else notices
+        for command in commands:
+            if isinstance(command, sql_script.MetaCommand):
+                if command.command != "echo":
+                    msg = f"line {command.line}: unsupported psql meta-command \\{command.command}"
+                    raise ValueError(msg)
+                out.append(" ".join(command.args))
+                continue
+
+            start = time.perf_counter()
+            try:
+                with conn.cursor() as cursor:
+                    if command.copy_data is not None:
+                        with cursor.copy(command.sql) as copy:
+                            copy.write(command.copy_data)
+                    else:
+                        cursor.execute(command.sql)
+            except psycopg.Error as exc:
+                exc.add_note(f"line {command.line}: {command.summary()}")
+                raise
+            finally:
+                out.extend(notices)
+                notices.clear()
+            timings.append((time.perf_counter() - start, command))
+
+    @staticmethod
+    def format_timings(timings: list[tuple[float, sql_script.Statement]]) -> list[str]:
+        """Format statement timings, one line per statement.
+
+        :return: The lines, with the time taken, the line and a summary of each statement.
+        :rtype: list[str]
+        """
+        return [
+            f"{exec_manager.format_execution_time(elapsed):>12} : line {statement.line:>4} : {statement.summary()}"
+            for elapsed, statement in timings
+        ]
+
+    @exec_manager.subprocess_bound
+    def run_sql(  # noqa: PLR0913
+        self,
+        script: str | Path,
+        name: str,
+        *,
+        role: str = "user",
+        variables: dict[str, str] | None = None,
+        single_transaction: bool = False,
+        own_connection: bool = False,
+    ) -> exec_manager.Result:
+        """Run a SQL script over the pooled connection of a role, like `psql -v ON_ERROR_STOP=on -f`.
+
+        The output lists the time taken by every statement.
+        Scripts run on a `ParallelRunner` must use `own_connection`, the pooled connections are not shared
+        between threads.
+
+        Args:
+            script (str | Path): The SQL script, or the file holding it.
+            name (str): The name of the step.
+            role (str, optional): `superuser` or `user`. Defaults to "user".
+            variables (dict[str, str] | None, optional): The psql variables of the script. Defaults to None.
+            single_transaction (bool, optional): Run the whole script in one transaction, like `psql -1`.
+                Defaults to False.
+            own_connection (bool, optional): Run the script over a new connection, closed when it is done.
+                Defaults to False.
+
+        Returns:
+            exec_manager.Result: The result of running the script.
+
+        """
+
+        def procedure() -> exec_manager.ProcedureResult:
+            out = []
+            timings = []
+            notices = [] if own_connection else self.notices
+            rc = 0
+            try:
+                text = script.read_text() if isinstance(script, Path) else script
+                commands = sql_script.parse(text, variables)
+                conn = self.connect(role, notices) if own_connection else self.connection(role)
+                with (
+                    conn if own_connection else contextlib.nullcontext(),
+                    conn.transaction() if single_transaction else contextlib.nullcontext(),
+                ):
+                    self.execute(conn, commands, out, timings, notices)
+            except (OSError, ValueError, psycopg.Error) as exc:
+                rc = 1
+                out.extend([str(exc), *getattr(exc, "__notes__", [])])
+            out.extend(self.format_timings(timings))
+            source = script if isinstance(script, Path) else "SQL"
+            return exec_manager.ProcedureResult(rc, f"{role}: {source}", "\n".join(out))
+
+        return exec_manager.procedure_run(procedure, name, verbose=True)
 
     def setup(self) -> exec_manager.Result:
         """Configure the default User and Database.
@@ -201,6 +977,22 @@ class DBOps:
         # Setup the default User and Database
         # WARNING: Will destroy all data in the DB
 
+        if self.in_process:
+            # The database is dropped, so we can't stay connected to it.
+            self.close("user")
+            return self.run_sql(
+                Path(self.args.setupdbsql),
+                "Setup Database",
+                role="superuser",
+                variables={
+                    "dbName": self.args.dbname,
+                    "dbDescription": self.args.dbdescription,
+                    "dbUser": self.args.dbuser,
+                    "dbUserPw": self.args.dbuserpw,
+                    "dbSuperUser": self.args.dbsuperuser,
+                },
+            )
+
         return exec_manager.cli_run(
             "psql -v ON_ERROR_STOP=on"
             f" -d {self.superuser_connection()} "
@@ -219,6 +1011,9 @@ class DBOps:
 
         :return: A exec_manager.Result object representing the result of running the migrations.
         """
+        if self.in_process or self.args.dbmigrationreport:
+            return exec_manager.procedure_run(self.__migrate, "Migrate Schema", verbose=True)
+
         # Run schema migrations
         return exec_manager.cli_run(
             f"DATABASE_URL={self.user_connection()}"
@@ -228,3 +1023,569 @@ class DBOps:
             name="Migrate Schema",
             verbose=True,
         )
+
+    def __migrate(self) -> exec_manager.ProcedureResult:
+        """Apply the migrations which are not applied yet over the user connection, like `refinery migrate`.
+
+        Each migration runs in its own transaction, together with recording it in
+        refinery's schema history table, so `refinery` sees them as applied.
+        Migrations marked with `-- refinery:noTransaction` run without one, statement by statement.
+        Like `refinery`, this fails if an applied migration was changed or removed, or a versioned
+        migration older than the last applied one was not applied.
+
+        If `dbmigrationreport` is set, a `MigrationReport` of every migration is added to
+        the output and written to that file as JSON, even if a migration fails.
+        """
+        out = []
+        reports = []
+        rc = 0
+        try:
+            migrations = refinery.find_migrations(self.args.dbmigrations)
+            conn = self.connection("user")
+            conn.execute(refinery.CREATE_HISTORY_TABLE)
+            self.notices.clear()  # It usually exists already.
+            applied = dict(conn.execute(f"SELECT version, checksum FROM {refinery.HISTORY_TABLE}").fetchall())  # noqa: S608
+            refinery.check_applied(migrations, applied)
+
+            for migration in migrations:
+                if migration.version in applied:
+                    continue
+
+                timings = []
+                start = time.perf_counter()
+                try:
+                    with contextlib.nullcontext() if migration.no_transaction() else conn.transaction():
+                        before = self.relation_state(conn) if self.args.dbmigrationreport else None
+                        self.execute(conn, sql_script.parse(migration.sql), out, timings)
+                        if before is not None:
+                            reports.append(self.migration_report(conn, migration, before, time.perf_counter() - start))
+                        conn.execute(
+                            f"INSERT INTO {refinery.HISTORY_TABLE} (version, name, applied_on, checksum)"  # noqa: S608
+                            " VALUES (%s, %s, %s, %s)",
+                            (migration.version, migration.name, refinery.applied_on(), migration.checksum()),
+                        )
+                finally:
+                    elapsed = exec_manager.format_execution_time(time.perf_counter() - start)
+                    out.append(f"Applying {migration.label()} : {elapsed}")
+                    out.extend(self.format_timings(timings))
+        except (OSError, ValueError, psycopg.Error) as exc:
+            rc = 1
+            out.extend([str(exc), *getattr(exc, "__notes__", [])])
+
+        if self.args.dbmigrationreport:
+            out.append("Migration Report:")
+            for report in reports:
+                out.extend(report.summary())
+            try:
+                Path(self.args.dbmigrationreport).write_text(
+                    json.dumps([asdict(report) for report in reports], indent=2)
+                )
+            except OSError as exc:
+                rc = 1
+                out.append(str(exc))
+
+        return exec_manager.ProcedureResult(rc, f"migrate {self.args.dbmigrations}", "\n".join(out))
+
+    @staticmethod
+    def relation_state(conn: psycopg.Connection) -> tuple[list[tuple[int, str, int, int]], dict[str, int]]:
+        """Snapshot the tables and the rows changed by a connection, before it applies a migration.
+
+        :return: The result of `RELATIONS_QUERY`, and the rows changed by each table from `ROWS_QUERY`.
+        :rtype: tuple[list[tuple[int, str, int, int]], dict[str, int]]
+        """
+        return conn.execute(RELATIONS_QUERY).fetchall(), dict(conn.execute(ROWS_QUERY).fetchall())
+
+    def migration_report(
+        self,
+        conn: psycopg.Connection,
+        migration: refinery.Migration,
+        before: tuple[list[tuple[int, str, int, int]], dict[str, int]],
+        duration: float,
+    ) -> MigrationReport:
+        """Report what a migration did, from inside its transaction once all its statements ran.
+
+        Table locks are held until the transaction ends, so they are all still in `pg_locks`.
+        A table was rewritten if it has a new data file. The rows changed are counted in
+        `pg_stat_xact_user_tables`, which also holds those of earlier transactions
+        until they are reported, so the counts from `before` are subtracted.
+
+        Args:
+            conn (psycopg.Connection): The connection the migration is running on.
+            migration (refinery.Migration): The migration.
+            before (tuple[list[tuple[int, str, int, int]], dict[str, int]]): The `relation_state`
+                before the migration ran.
+            duration (float): How long the migration took, in seconds.
+
+        Returns:
+            MigrationReport: The report.
+
+        """
+        relations, rows = before
+        report = MigrationReport(migration.label(), duration)
+        for table, changed in conn.execute(ROWS_QUERY):
+            if table != refinery.HISTORY_TABLE and changed > rows.get(table, 0):
+                report.rows[table] = changed - rows.get(table, 0)
+
+        sizes = {oid: size for oid, _, _, size in relations}
+        files = {oid: relfilenode for oid, _, relfilenode, _ in relations}
+        report.rewrites = [
+            name
+            for oid, name, relfilenode, _ in conn.execute(RELATIONS_QUERY)
+            if files.get(oid, relfilenode) != relfilenode
+        ]
+
+        large = int(self.args.dblargetablemb) * 1024 * 1024
+        for oid, relation, mode in conn.execute(LOCKS_QUERY):
+            report.locks.setdefault(relation, []).append(mode)
+            if mode == "AccessExclusiveLock" and sizes.get(oid, 0) >= large:
+                rewrite = " and rewritten" if relation in report.rewrites else ""
+                report.warnings.append(
+                    f"{relation} ({exec_manager.format_size(sizes[oid])}) is locked with ACCESS EXCLUSIVE{rewrite},"
+                    " blocking all reads and writes of it until the migration commits",
+                )
+        return report
+
+    def table_oids(self, tables: list[str]) -> dict[str, int | None]:
+        """Look up tables by their SQL names.
+
+        :return: The oid of each table, None for tables which do not exist.
+        :rtype: dict[str, int | None]
+        """
+        return dict(
+            self.connection("user")
+            .execute("SELECT name, to_regclass(name)::oid FROM unnest(%s::text[]) AS name", (tables,))
+            .fetchall(),
+        )
+
+    def foreign_keys(self, oids: list[int]) -> dict[int, set[int]]:
+        """Look up the foreign keys between tables.
+
+        :return: The tables each table references, by oid.
+        :rtype: dict[int, set[int]]
+        """
+        references: dict[int, set[int]] = {}
+        for table, referenced in self.connection("user").execute(
+            "SELECT conrelid, confrelid FROM pg_constraint"
+            " WHERE contype = 'f' AND conrelid <> confrelid AND conrelid = ANY(%s) AND confrelid = ANY(%s)",
+            (oids, oids),
+        ):
+            references.setdefault(table, set()).add(referenced)
+        return references
+
+    def defer_schema(self, oids: list[int]) -> tuple[exec_manager.Result, DeferredSchema]:
+        """Drop the secondary indexes and foreign keys of tables, so loading data into them is faster.
+
+        Indexes backing a constraint (primary keys, unique constraints and the targets of foreign keys)
+        are kept, as are unique indexes, which seed data may upsert against with `ON CONFLICT`,
+        and the indexes and foreign keys of partitions and tables the user does not own.
+        If they can't be dropped, nothing is dropped and the data is loaded with them in place.
+
+        Args:
+            oids (list[int]): The tables.
+
+        Returns:
+            tuple[exec_manager.Result, DeferredSchema]: The result, and what was dropped.
+
+        """
+        deferred = DeferredSchema()
+
+        def procedure() -> exec_manager.ProcedureResult:
+            out = []
+            conn = self.connection("user")
+            try:
+                with conn.transaction():
+                    foreign_keys = conn.execute(
+                        "SELECT c.conrelid::regclass::text, c.conname, pg_get_constraintdef(c.oid), c.convalidated"
+                        " FROM pg_constraint c JOIN pg_class r ON r.oid = c.conrelid"
+                        " WHERE c.contype = 'f' AND c.conparentid = 0 AND c.conrelid = ANY(%s)"
+                        " AND r.relkind = 'r' AND pg_has_role(r.relowner, 'MEMBER')"
+                        " ORDER BY 1, 2",
+                        (oids,),
+                    ).fetchall()
+                    indexes = conn.execute(
+                        "SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)"
+                        " FROM pg_index i JOIN pg_class r ON r.oid = i.indrelid"
+                        " WHERE i.indrelid = ANY(%s) AND r.relkind = 'r' AND pg_has_role(r.relowner, 'MEMBER')"
+                        " AND NOT i.indisunique"
+                        " AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)"
+                        " AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.indexrelid)"
+                        " ORDER BY 1",
+                        (oids,),
+                    ).fetchall()
+                    for table, name, _, _ in foreign_keys:
+                        conn.execute(f"ALTER TABLE {table} DROP CONSTRAINT {sql_script.quote_ident(name)}")
+                        out.append(f"Dropped foreign key {name} of {table}")
+                    for name, _ in indexes:
+                        conn.execute(f"DROP INDEX {name}")
+                        out.append(f"Dropped index {name}")
+            except psycopg.Error as exc:
+                out = [f"Loading with all indexes and foreign keys in place: {exc}"]
+            else:
+                deferred.foreign_keys = foreign_keys
+                deferred.indexes = indexes
+            return exec_manager.ProcedureResult(0, "defer indexes and foreign keys", "\n".join(out))
+
+        return exec_manager.procedure_run(procedure, "Defer Indexes and Constraints", verbose=True), deferred
+
+    def restore_schema(self, deferred: DeferredSchema) -> list[exec_manager.Result]:
+        """Recreate the indexes and foreign keys dropped by `defer_schema`.
+
+        The indexes are built in parallel. The foreign keys are added without checking them,
+        and then checked in parallel, one table at a time.
+
+        :return: The results of recreating them.
+        :rtype: list[exec_manager.Result]
+        """
+        results = []
+        if deferred.indexes:
+            with exec_manager.ParallelRunner("Recreate Indexes") as runner:
+                for name, definition in deferred.indexes:
+                    runner.run(self.run_sql, definition, name=f"Create Index {name}", own_connection=True)
+                results.extend(runner.get_results().results)
+
+        if deferred.foreign_keys:
+            results.append(
+                self.run_sql(
+                    "".join(
+                        f"ALTER TABLE {table} ADD CONSTRAINT {sql_script.quote_ident(name)} {definition}"
+                        f"{' NOT VALID' if validated else ''};\n"
+                        for table, name, definition, validated in deferred.foreign_keys
+                    ),
+                    "Add Foreign Keys",
+                    single_transaction=True,
+                ),
+            )
+            validate: dict[str, list[str]] = {}
+            for table, name, _, validated in deferred.foreign_keys:
+                if validated:
+                    validate.setdefault(table, []).append(name)
+            if results[-1].ok() and validate:
+                with exec_manager.ParallelRunner("Validate Foreign Keys") as runner:
+                    for table, names in validate.items():
+                        runner.run(
+                            self.run_sql,
+                            "".join(
+                                f"ALTER TABLE {table} VALIDATE CONSTRAINT {sql_script.quote_ident(name)};\n"
+                                for name in names
+                            ),
+                            name=f"Validate Foreign Keys of {table}",
+                            own_connection=True,
+                        )
+                    results.extend(runner.get_results().results)
+
+        return results
+
+    @exec_manager.subprocess_bound
+    def load_seed_file(self, seed: SeedFile) -> exec_manager.Result:
+        """Load a seed data file over a connection of its own.
+
+        CSV files are streamed with `COPY ... FROM STDIN`, SQL files run in a single transaction.
+
+        :return: The result of loading the file.
+        :rtype: exec_manager.Result
+        """
+        name = f"Seed {seed.path.name}"
+        if not self.in_process:
+            copy = f" -c {shlex.quote(seed.copy_statement())} < {seed.path}" if seed.columns else f" -f {seed.path}"
+            return exec_manager.cli_run(
+                f"psql -v ON_ERROR_STOP=on -1 -d {self.user_connection()}{copy}",
+                name=name,
+                verbose=True,
+            )
+        if not seed.columns:
+            return self.run_sql(seed.path, name, single_transaction=True, own_connection=True)
+
+        def procedure() -> exec_manager.ProcedureResult:
+            notices = []
+            try:
+                with (
+                    self.connect("user", notices) as conn,
+                    conn.cursor() as cursor,
+                    seed.path.open("rb") as data,
+                ):
+                    with cursor.copy(seed.copy_statement()) as copy:
+                        while chunk := data.read(SEED_COPY_CHUNK):
+                            copy.write(chunk)
+                    out = [*notices, f"{seed.tables[0]} : {cursor.rowcount} rows"]
+                    rc = 0
+            except (OSError, psycopg.Error) as exc:
+                out = [*notices, str(exc)]
+                rc = 1
+            return exec_manager.ProcedureResult(rc, f"user: {seed.copy_statement()}", "\n".join(out))
+
+        return exec_manager.procedure_run(procedure, name, verbose=True)
+
+    def seed_database(self) -> list[exec_manager.Result]:
+        """Load the seed data selected by `with_seed_data`, if any.
+
+        The `*.sql` and `*.csv` files in the seed data directory are loaded in parallel, each over
+        a connection of its own, in the order the foreign keys between their tables need.
+        While they load, the secondary indexes and foreign keys of their tables are dropped,
+        they are recreated once all the data is loaded, even if some of it failed to load.
+
+        :return: The results of every step, a failed result if the directory does not exist.
+        :rtype: list[exec_manager.Result]
+        """
+        if not self.args.with_seed_data:
+            return []
+
+        seed_dir = Path(self.args.dbseeddatasrc) / self.args.with_seed_data
+        if not seed_dir.is_dir():
+            return [
+                exec_manager.procedure_run(
+                    lambda: exec_manager.ProcedureResult(1, f"seed {seed_dir}", "Seed Data Directory not found"),
+                    "Seed Database",
+                ),
+            ]
+
+        plan = []
+        oids = {}
+
+        def order() -> exec_manager.ProcedureResult:
+            try:
+                seeds = [
+                    SeedFile.from_file(path)
+                    for path in sorted(seed_dir.iterdir())
+                    if path.suffix in (".sql", ".csv") and path.is_file()
+                ]
+                oids.update(self.table_oids(sorted({table for seed in seeds for table in seed.tables})))
+                references = self.foreign_keys([oid for oid in oids.values() if oid is not None])
+                plan.extend(seed_order(seeds, oids, references))
+            except (OSError, psycopg.Error) as exc:
+                return exec_manager.ProcedureResult(1, f"seed {seed_dir}", str(exc))
+            out = [
+                f"{seed.path.name} : {', '.join(seed.tables) or 'no tables found'}"
+                + (f" : after {', '.join(plan[dep][0].path.name for dep in after)}" if after else "")
+                for seed, after in plan
+            ]
+            return exec_manager.ProcedureResult(0, f"seed {seed_dir}", "\n".join(out))
+
+        results = [exec_manager.procedure_run(order, "Order Seed Data", verbose=True)]
+        if not results[-1].ok() or not plan:
+            return results
+
+        result, deferred = self.defer_schema(sorted({oid for oid in oids.values() if oid is not None}))
+        results.append(result)
+        try:
+            with exec_manager.ParallelRunner("Seed Database", fail_fast=True) as runner:
+                tasks = []
+                for seed, after in plan:
+                    tasks.append(
+                        runner.schedule(
+                            exec_manager.Task(self.load_seed_file, (seed,), after=[tasks[dep] for dep in after]),
+                        ),
+                    )
+                results.extend(runner.get_results().results)
+        finally:
+            results.extend(self.restore_schema(deferred))
+        return results
+
+    def template_name(self) -> str:
+        """Return the name of the template database holding the migrated schema."""
+        return f"{self.args.dbname}_template"
+
+    def create_template(self) -> exec_manager.Result:
+        """Snapshot the migrated database into a template database, for `reset_database`.
+
+        :return: The result of creating the template database.
+        :rtype: exec_manager.Result
+        """
+        # Nobody can be connected to the database the template is copied from.
+        self.close("user")
+        template = sql_script.quote_ident(self.template_name())
+        # A template database can't be dropped, so an earlier template is made a plain database first.
+        return self.run_sql(
+            "DO $template$ BEGIN\n"
+            f"  IF EXISTS (SELECT FROM pg_database WHERE datname = {sql_script.quote_literal(self.template_name())})"
+            f" THEN ALTER DATABASE {template} IS_TEMPLATE false; END IF;\n"
+            "END $template$;\n"
+            f"DROP DATABASE IF EXISTS {template};\n"
+            f"CREATE DATABASE {template}"
+            f" TEMPLATE {sql_script.quote_ident(self.args.dbname)} IS_TEMPLATE true;\n",
+            "Create Template Database",
+            role="superuser",
+        )
+
+    def reset_database(self) -> exec_manager.Result:
+        """Recreate the database from its template, instead of replaying setup and migrations.
+
+        :return: The result of recreating the database.
+        :rtype: exec_manager.Result
+        """
+        self.close("user")
+        return self.run_sql(
+            f"DROP DATABASE IF EXISTS {sql_script.quote_ident(self.args.dbname)} WITH (FORCE);\n"
+            f"CREATE DATABASE {sql_script.quote_ident(self.args.dbname)}"
+            f" TEMPLATE {sql_script.quote_ident(self.template_name())}"
+            f" OWNER {sql_script.quote_ident(self.args.dbuser)};\n"
+            f"COMMENT ON DATABASE {sql_script.quote_ident(self.args.dbname)}"
+            f" IS {sql_script.quote_literal(self.args.dbdescription)};\n",
+            "Reset Database",
+            role="superuser",
+        )
+
+    def worker(self, index: int) -> Self:
+        """Describe the database of a test worker, see `provision_workers`.
+
+        In `database` mode it is the database `<dbname>_<index>` on this cluster, in `cluster` mode
+        it is `dbname` on a copy of this cluster in `<dbpath>-<index>`, listening on `dbport + index`.
+
+        :return: The operations of the worker database.
+        :rtype: DBOps
+        """
+        args = argparse.Namespace(**vars(self.args))
+        if self.args.dbworkermode == "cluster":
+            args.dbpath = f"{self.args.dbpath}-{index}"
+            args.dbport = int(self.args.dbport) + index
+        else:
+            args.dbname = f"{self.args.dbname}_{index}"
+        # The data directory is already on tmpfs if it should be.
+        args.dbtmpfs = False
+        return type(self)(args)
+
+    def provision_workers(self, timeout: float | None = None) -> list[exec_manager.Result]:
+        """Provision an isolated copy of the migrated database for each of `dbworkers` test workers, in parallel.
+
+        In `database` mode each worker gets a database created from the template database.
+        In `cluster` mode the server is stopped, its data directory is copied for each worker,
+        and all of them are started. The user connection strings of the workers are listed,
+        one per line, in the `dbworkerurls` file if set.
+
+        Args:
+            timeout: The maximum number of seconds to wait for the worker clusters to be ready.
+
+        Returns:
+            list[exec_manager.Result]: The results of every step.
+
+        """
+        self.stop_workers()
+        mode = self.args.dbworkermode
+        if mode not in ("database", "cluster"):
+            return [
+                exec_manager.procedure_run(
+                    lambda: exec_manager.ProcedureResult(1, f"workers {mode}", "Unknown worker mode"),
+                    "Provision Workers",
+                ),
+            ]
+
+        workers = [self.worker(index) for index in range(1, int(self.args.dbworkers) + 1)]
+        if mode == "database":
+            results = self.__create_worker_databases(workers)
+        else:
+            results = self.__copy_worker_clusters(workers, timeout)
+        if not all(result.ok() for result in results):
+            return results
+
+        self.workers = workers
+        urls = [worker.user_connection() for worker in workers]
+
+        def write_urls() -> exec_manager.ProcedureResult:
+            try:
+                if self.args.dbworkerurls:
+                    Path(self.args.dbworkerurls).write_text("".join(f"{url}\n" for url in urls))
+            except OSError as exc:
+                return exec_manager.ProcedureResult(1, f"workers {mode}", str(exc))
+            return exec_manager.ProcedureResult(0, f"workers {mode}", "\n".join(urls))
+
+        results.append(exec_manager.procedure_run(write_urls, "Worker Connections", verbose=True))
+        return results
+
+    def __create_worker_databases(self, workers: list[Self]) -> list[exec_manager.Result]:
+        """Create the database of each worker from the template database, in parallel."""
+        self.close("user")
+        with exec_manager.ParallelRunner("Provision Worker Databases") as runner:
+            for worker in workers:
+                name = sql_script.quote_ident(worker.args.dbname)
+                runner.run(
+                    self.run_sql,
+                    f"DROP DATABASE IF EXISTS {name} WITH (FORCE);\n"
+                    f"CREATE DATABASE {name} TEMPLATE {sql_script.quote_ident(self.template_name())}"
+                    f" OWNER {sql_script.quote_ident(self.args.dbuser)};\n",
+                    name=f"Create Database {worker.args.dbname}",
+                    role="superuser",
+                    own_connection=True,
+                )
+            return runner.get_results().results
+
+    def __copy_worker_clusters(self, workers: list[Self], timeout: float | None) -> list[exec_manager.Result]:
+        """Copy this cluster for each worker while it is stopped, then start them all, in parallel."""
+        results = [self.stop()]
+        if not results[-1].ok():
+            return results
+        with exec_manager.ParallelRunner("Copy Worker Clusters") as runner:
+            for worker in workers:
+                shutil.rmtree(worker.args.dbpath, ignore_errors=True)
+                runner.run(
+                    exec_manager.cli_run,
+                    f'cp -a --reflink=auto "{self.args.dbpath}" "{worker.args.dbpath}"',
+                    name=f"Copy Cluster {worker.args.dbpath}",
+                )
+            results.extend(runner.get_results().results)
+
+        # Start this cluster again whatever happened, it was running before.
+        servers = [self, *workers] if all(result.ok() for result in results) else [self]
+        for server in servers[1:]:
+            with Path(server.args.dbpath, "postgresql.auto.conf").open("a") as file:
+                file.write(f"port = '{server.args.dbport}'\n")
+        for server in servers:
+            server.start()
+        with exec_manager.ParallelRunner("Start Worker Clusters") as runner:
+            for server in servers:
+                runner.run(server.wait_ready, timeout)
+            results.extend(runner.get_results().results)
+
+        # Don't leave some of the worker clusters running if they can't all be used.
+        if not all(result.ok() for result in results):
+            for server in servers[1:]:
+                server.stop()
+        return results
+
+    def bring_up(self, timeout: float | None = None) -> list[exec_manager.Result]:
+        """Bring up a running database with all migrations applied.
+
+        If the cluster cache holds a cluster for the current migrations it is restored and
+        started. Otherwise the cluster is initialized, set up and migrated from scratch,
+        and saved in the cluster cache, if there is one.
+        Either way it runs with the settings of the `dbprofile` profile.
+        If `dbworkers` is set, a copy of the database is then provisioned for each test worker.
+
+        Args:
+            timeout: The maximum number of seconds to wait for the database to be ready.
+
+        Returns:
+            list[exec_manager.Result]: The results of every step, it stops at the first failure.
+
+        """
+        results = self.__bring_up(timeout)
+        if int(self.args.dbworkers or 0) > 0 and all(result.ok() for result in results):
+            results.extend(self.provision_workers(timeout))
+        return results
+
+    def __bring_up(self, timeout: float | None) -> list[exec_manager.Result]:
+        """Bring up the database of this cluster, see `bring_up`."""
+        results = []
+        restored = self.restore_cluster()
+        if restored is not None:
+            results.append(restored)
+        if restored is None or not restored.ok():
+            results.append(self.init_database())
+            if not results[-1].ok():
+                return results
+
+        results.append(self.configure())
+        if not results[-1].ok():
+            return results
+
+        self.start()
+        results.append(self.wait_ready(timeout))
+        if not results[-1].ok() or (restored is not None and restored.ok()):
+            return results
+
+        for step in (self.setup, self.migrate_schema, self.create_template):
+            results.append(step())
+            if not results[-1].ok():
+                return results
+
+        if self.args.dbclustercache:
+            results.extend(self.save_cluster(timeout))
+        return results
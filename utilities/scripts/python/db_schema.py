@@ -0,0 +1,386 @@
+"""Database Schema Documentation.
+
+Reads the schema of a Postgres database from `pg_catalog` in a few bulk queries,
+and writes it as D2 entity relationship diagrams and a markdown page per table.
+"""
+
+# cspell: words psycopg relkind relnamespace nspname relispartition attrelid attnum attname
+# cspell: words attnotnull attisdropped atttypid atttypmod adrelid adnum adbin conrelid confrelid
+# cspell: words conname contype conkey confkey conparentid indexrelid indrelid indisprimary indisunique regclass
+
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import psycopg
+
+# The schemas of Postgres itself are not documented.
+TABLES_QUERY = """SELECT c.oid, n.nspname, c.relname, c.relkind, obj_description(c.oid, 'pg_class')
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f') AND NOT c.relispartition
+    AND n.nspname NOT IN ('pg_catalog', 'information_schema', 'pg_toast') AND n.nspname NOT LIKE 'pg_temp%'
+ORDER BY n.nspname, c.relname"""
+
+COLUMNS_QUERY = """SELECT a.attrelid, a.attnum, a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull,
+    pg_get_expr(d.adbin, d.adrelid), col_description(a.attrelid, a.attnum)
+FROM pg_attribute a LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+WHERE a.attrelid = ANY(%s) AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY a.attrelid, a.attnum"""
+
+CONSTRAINTS_QUERY = """SELECT conrelid, conname, contype, conkey,
+    confrelid, NULLIF(confrelid, 0)::regclass::text, confkey, pg_get_constraintdef(oid)
+FROM pg_constraint
+WHERE conrelid = ANY(%s) AND conparentid = 0 AND contype IN ('p', 'u', 'f', 'c', 'x')
+ORDER BY conrelid, contype, conname"""
+
+INDEXES_QUERY = """SELECT i.indrelid, c.relname, i.indisprimary, i.indisunique, pg_get_indexdef(i.indexrelid)
+FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+WHERE i.indrelid = ANY(%s)
+ORDER BY i.indrelid, c.relname"""
+
+RELATION_KINDS = {
+    "r": "Table",
+    "p": "Partitioned Table",
+    "v": "View",
+    "m": "Materialized View",
+    "f": "Foreign Table",
+}
+
+CONSTRAINT_KINDS = {
+    "p": "Primary Key",
+    "u": "Unique",
+    "f": "Foreign Key",
+    "c": "Check",
+    "x": "Exclusion",
+}
+
+# D2 keys which don't need to be quoted.
+D2_PLAIN_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# File names the table pages can safely have.
+UNSAFE_FILE_CHARACTERS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+@dataclass
+class Column:
+    """A column of a table.
+
+    Attributes:
+        name: The name of the column.
+        type: The type of the column, as Postgres formats it.
+        not_null: If the column can't be NULL.
+        default: The default value expression, None if it has none.
+        comment: The comment on the column, None if it has none.
+
+    """
+
+    name: str
+    type: str
+    not_null: bool
+    default: str | None
+    comment: str | None
+
+
+@dataclass
+class Constraint:
+    """A constraint on a table.
+
+    Attributes:
+        name: The name of the constraint.
+        kind: The `pg_constraint.contype` of the constraint.
+        columns: The columns of the table it constrains.
+        definition: The definition of the constraint, as Postgres formats it.
+        references: The table a foreign key references, None for other constraints.
+        referenced_columns: The columns a foreign key references.
+
+    """
+
+    name: str
+    kind: str
+    columns: list[str]
+    definition: str
+    references: str | None = None
+    referenced_columns: list[str] = field(default_factory=list)
+
+
+@dataclass
+class Index:
+    """An index on a table.
+
+    Attributes:
+        name: The name of the index.
+        primary: If it is the index of the primary key.
+        unique: If it is a unique index.
+        definition: The `CREATE INDEX` statement of the index.
+
+    """
+
+    name: str
+    primary: bool
+    unique: bool
+    definition: str
+
+
+@dataclass
+class Table:
+    """A table, or view, of the database.
+
+    Attributes:
+        name: The name of the table, qualified with its schema if that isn't `public`.
+        kind: The `pg_class.relkind` of the table.
+        comment: The comment on the table, None if it has none.
+        columns: The columns of the table, in order.
+        constraints: The constraints on the table.
+        indexes: The indexes on the table.
+
+    """
+
+    name: str
+    kind: str
+    comment: str | None
+    columns: list[Column] = field(default_factory=list)
+    constraints: list[Constraint] = field(default_factory=list)
+    indexes: list[Index] = field(default_factory=list)
+
+    def foreign_keys(self) -> list[Constraint]:
+        """Return the foreign keys of the table."""
+        return [constraint for constraint in self.constraints if constraint.kind == "f"]
+
+    def column_keys(self, column: str) -> list[str]:
+        """Return the D2 constraints of a column: `primary_key`, `foreign_key` and `unique`."""
+        keys = []
+        for kind, key in (("p", "primary_key"), ("f", "foreign_key"), ("u", "unique")):
+            if any(c.kind == kind and column in c.columns for c in self.constraints) and key not in keys:
+                keys.append(key)
+        return keys
+
+    def page_name(self) -> str:
+        """Return the file name of the markdown page of the table."""
+        return UNSAFE_FILE_CHARACTERS.sub("_", self.name) + ".md"
+
+
+def introspect(conn: psycopg.Connection) -> list[Table]:
+    """Read the tables, columns, constraints and indexes of the database.
+
+    Each kind of object is read in one query for the whole database, rather than per table.
+
+    Args:
+        conn (psycopg.Connection): The connection to the database.
+
+    Returns:
+        list[Table]: The tables and views, ordered by schema and name.
+
+    """
+    tables: dict[int, Table] = {}
+    for oid, schema, name, kind, comment in conn.execute(TABLES_QUERY):
+        tables[oid] = Table(name if schema == "public" else f"{schema}.{name}", kind, comment)
+
+    oids = list(tables)
+    columns: dict[int, dict[int, str]] = {oid: {} for oid in oids}
+    for oid, number, name, column_type, not_null, default, comment in conn.execute(COLUMNS_QUERY, (oids,)):
+        tables[oid].columns.append(Column(name, column_type, not_null, default, comment))
+        columns[oid][number] = name
+
+    rows = conn.execute(CONSTRAINTS_QUERY, (oids,))
+    for oid, name, kind, keys, referenced_oid, referenced_name, referenced_keys, definition in rows:
+        constraint = Constraint(name, kind, [columns[oid].get(key, str(key)) for key in keys or []], definition)
+        if kind == "f":
+            # The referenced table is not documented if it is a partition.
+            referenced = tables.get(referenced_oid)
+            constraint.references = referenced.name if referenced else referenced_name
+            constraint.referenced_columns = [
+                columns.get(referenced_oid, {}).get(key, str(key)) for key in referenced_keys or []
+            ]
+        tables[oid].constraints.append(constraint)
+
+    for oid, name, primary, unique, definition in conn.execute(INDEXES_QUERY, (oids,)):
+        tables[oid].indexes.append(Index(name, primary, unique, definition))
+
+    return list(tables.values())
+
+
+def d2_key(name: str) -> str:
+    """Quote a name as a D2 key, if it needs to be."""
+    if D2_PLAIN_KEY.match(name):
+        return name
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def d2_block(lines: list[str], indent: str) -> list[str]:
+    """Format lines as a D2 markdown block string, with a delimiter which isn't in the text."""
+    pipes = max((len(run) for line in lines for run in re.findall(r"\|+", line)), default=0)
+    delimiter = "|" * (pipes + 1)
+    return [f"{delimiter}md", *[f"{indent}\t{line}" for line in lines], f"{indent}{delimiter}"]
+
+
+def table_to_d2(table: Table) -> str:
+    """Format a table as a D2 `sql_table` shape, like `cql-to-d2` does for Cassandra tables.
+
+    The comments on the table and its columns are shown in the tooltip of the shape.
+    """
+    tooltip = []
+    if table.comment:
+        tooltip.append(f"-- {table.comment}\n")
+    tooltip.extend(f"{column.name} -- {column.comment}" for column in table.columns if column.comment)
+
+    lines = [d2_key(table.name) + ": {", "\tshape: sql_table"]
+    if tooltip:
+        block = d2_block(tooltip, "\t")
+        lines.append(f"\ttooltip: {block[0]}")
+        lines.extend(block[1:])
+    lines.append("")
+    for column in table.columns:
+        keys = table.column_keys(column.name)
+        constraint = " {constraint: [" + "; ".join(keys) + "]}" if keys else ""
+        lines.append(f"\t{d2_key(column.name)}: {d2_key(column.type)}{constraint}")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def relations_to_d2(tables: list[Table]) -> list[str]:
+    """Format the foreign keys between tables as D2 connections, column to column."""
+    names = {table.name for table in tables}
+    lines = []
+    for table in tables:
+        for key in table.foreign_keys():
+            if key.references not in names:
+                continue
+            for column, referenced in zip(key.columns, key.referenced_columns, strict=False):
+                lines.append(
+                    f"{d2_key(table.name)}.{d2_key(column)} -> {d2_key(key.references)}.{d2_key(referenced)}",
+                )
+    return lines
+
+
+def to_d2(tables: list[Table]) -> str:
+    """Format the tables, and the foreign keys between them, as a D2 diagram."""
+    return "\n\n".join([*(table_to_d2(table) for table in tables), "\n".join(relations_to_d2(tables))]).strip() + "\n"
+
+
+def related(table: Table, tables: list[Table]) -> list[Table]:
+    """Return the table and the tables it references, or which reference it, for a diagram of its neighbourhood."""
+    neighbours = {key.references for key in table.foreign_keys()}
+    neighbours.update(
+        other.name for other in tables if any(key.references == table.name for key in other.foreign_keys())
+    )
+    return [other for other in tables if other.name == table.name or other.name in neighbours]
+
+
+def markdown_cell(value: str | None) -> str:
+    """Format a value for a markdown table cell."""
+    if value is None:
+        return ""
+    return value.replace("|", "\\|").replace("\n", "<br>")
+
+
+def table_markdown(table: Table, tables: list[Table]) -> str:
+    """Format the markdown page of a table.
+
+    Args:
+        table (Table): The table.
+        tables (list[Table]): All the tables, to show those related to it.
+
+    Returns:
+        str: The markdown page.
+
+    """
+    kind = RELATION_KINDS.get(table.kind, "Table")
+    lines = [f"# {table.name}", "", f"*{kind}*", ""]
+    if table.comment:
+        lines += [table.comment, ""]
+
+    lines += ["```d2", to_d2(related(table, tables)).rstrip(), "```", ""]
+
+    lines += ["## Columns", "", "| Column | Type | Nullable | Default | Comment |", "| --- | --- | --- | --- | --- |"]
+    lines += [
+        f"| {markdown_cell(column.name)} | `{markdown_cell(column.type)}` | {'' if column.not_null else 'yes'} "
+        f"| {markdown_cell(column.default)} | {markdown_cell(column.comment)} |"
+        for column in table.columns
+    ]
+    lines.append("")
+
+    if table.constraints:
+        lines += ["## Constraints", "", "| Name | Type | Definition |", "| --- | --- | --- |"]
+        lines += [
+            f"| {markdown_cell(c.name)} | {CONSTRAINT_KINDS[c.kind]} | `{markdown_cell(c.definition)}` |"
+            for c in table.constraints
+        ]
+        lines.append("")
+
+    if table.indexes:
+        lines += ["## Indexes", "", "| Name | Definition |", "| --- | --- |"]
+        lines += [f"| {markdown_cell(i.name)} | `{markdown_cell(i.definition)}` |" for i in table.indexes]
+        lines.append("")
+
+    referenced_by = sorted(
+        {other.name for other in tables for key in other.foreign_keys() if key.references == table.name},
+    )
+    if referenced_by:
+        lines += ["## Referenced By", ""]
+        lines += [f"* [{name}]({page_of(name, tables)})" for name in referenced_by]
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def page_of(name: str, tables: list[Table]) -> str:
+    """Return the page of the table with a name."""
+    return next(table.page_name() for table in tables if table.name == name)
+
+
+def overview_markdown(tables: list[Table], directory: str) -> str:
+    """Format the overview page of the schema, with the diagram of all the tables and a link to each of them.
+
+    Args:
+        tables (list[Table]): All the tables.
+        directory (str): The directory of the table pages, relative to the overview page.
+
+    Returns:
+        str: The markdown page.
+
+    """
+    lines = [
+        "---",
+        "icon: material/database",
+        "---",
+        "",
+        "# Database Schema",
+        "",
+        "```d2",
+        to_d2(tables).rstrip(),
+        "```",
+        "",
+        "| Table | Type | Columns | Comment |",
+        "| --- | --- | --- | --- |",
+    ]
+    lines += [
+        f"| [{markdown_cell(table.name)}]({directory}/{table.page_name()}) | {RELATION_KINDS.get(table.kind, 'Table')} "
+        f"| {len(table.columns)} | {markdown_cell(table.comment)} |"
+        for table in tables
+    ]
+    lines.append("")
+    return "\n".join(lines)
+
+
+def write_docs(tables: list[Table], directory: Path, overview: Path) -> list[Path]:
+    """Write the diagram of the schema, the markdown page of each table and the overview page.
+
+    Args:
+        tables (list[Table]): All the tables.
+        directory (Path): The directory the diagram and table pages are written to.
+        overview (Path): The overview page.
+
+    Returns:
+        list[Path]: The files written.
+
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    diagram = directory / "schema.d2"
+    diagram.write_text(to_d2(tables))
+    written = [diagram]
+    for table in tables:
+        page = directory / table.page_name()
+        page.write_text(table_markdown(table, tables))
+        written.append(page)
+    overview.write_text(overview_markdown(tables, directory.relative_to(overview.parent).as_posix()))
+    written.append(overview)
+    return written
@@ -1,6 +1,23 @@
 """Diff Operations."""
 
+import difflib
+import io
+from collections.abc import Iterator
 from dataclasses import dataclass
+from typing import TextIO
+
+COLORS = {
+    "red": "\033[91m",
+    "green": "\033[92m",
+    "yellow": "\033[93m",
+}
+COLOR_RESET = "\033[0m"
+
+# Keys which identify the tables of an array, like `[[bin]] name` or `[[licenses.clarify]] crate`.
+# Arrays of tables which all have one of them are matched up by it, ignoring their order.
+LIST_KEYS = ("name", "crate")
+# The JSON-Pointer index of array elements which are missing, and would be appended.
+LIST_END = "-"
 
 
 @dataclass
@@ -19,6 +36,19 @@ class DiffEntry:
     add_or_remove_flag: bool
 
 
+class ListDiff(dict):
+    """The difference between two arrays, by the index of the elements in the provided array.
+
+    Elements missing from the provided array are at the index they would be inserted at,
+    or at `LIST_END` if they are matched by key.
+    """
+
+
+def pointer_segment(key: str | int) -> str:
+    """Escape a key as a JSON-Pointer segment."""
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
 @dataclass
 class DiffResult:
     """Represents the difference between two dictionaries."""
@@ -29,68 +59,183 @@ class DiffResult:
         """Has Diff."""
         return bool(self.diff)
 
-    def to_ascii_colored_string(  # noqa: C901
-        self,
-        obj_name_to_add: str,
-        obj_name_to_remove: str,
-    ) -> str:
-        """Generate an ascii colored string representation of the diff.
+    def entries(self) -> Iterator[tuple[str, DiffEntry]]:
+        """Iterate over every entry of the diff, with the JSON-Pointer path of where it is.
+
+        Returns:
+            Iterator[tuple[str, DiffEntry]]: The path, like `/workspace/members/3`, and the entry.
+
+        """
+
+        def impl(diff: dict | tuple | DiffEntry, path: str) -> Iterator[tuple[str, DiffEntry]]:
+            if isinstance(diff, DiffEntry):
+                yield path, diff
+            elif isinstance(diff, dict):
+                for key, value in diff.items():
+                    yield from impl(value, f"{path}/{pointer_segment(key)}")
+            elif isinstance(diff, tuple):
+                for val in diff:
+                    yield from impl(val, path)
+
+        return impl(self.diff, "")
+
+    def get(self, path: str) -> dict | tuple | DiffEntry | None:
+        """Get the part of the diff at a JSON-Pointer path.
 
         Args:
+            path (str): The path, like `/workspace/members/3`, or "" for the whole diff.
+
+        Returns:
+            dict | tuple | DiffEntry | None: The differences at the path, None if there are none.
+
+        """
+        node = self.diff
+        for segment in path.split("/")[1:] if path else []:
+            key = segment.replace("~1", "/").replace("~0", "~")
+            if isinstance(node, ListDiff) and key != LIST_END:
+                if not key.isdigit():
+                    return None
+                key = int(key)
+            if not isinstance(node, dict) or key not in node:
+                return None
+            node = node[key]
+        return node or None
+
+    def write_ascii_colored(self, out: TextIO, obj_name_to_add: str, obj_name_to_remove: str) -> None:
+        """Write an ascii colored representation of the diff, a piece at a time.
+
+        Array elements are shown by their index, like `[3]`.
+
+        Args:
+            out (TextIO): Where to write it, like a file or an `io.StringIO`.
             obj_name_to_add (str): The name of the object to add.
             obj_name_to_remove (str): The name of the object to remove.
 
         """
 
-        def impl(
-            diff: dict,
-            obj_name_to_add: str,
-            obj_name_to_remove: str,
-            ident: str = "",
-            path: str = "",
-        ) -> str:
-            def add_color(val: str, color: str) -> str:
-                if color == "red":
-                    return f"\033[91m{val}\033[0m"
-                if color == "green":
-                    return f"\033[92m{val}\033[0m"
-                if color == "yellow":
-                    return f"\033[93m{val}\033[0m"
-                return val
-
-            result = ""
+        def add_color(val: str, color: str) -> str:
+            return f"{COLORS[color]}{val}{COLOR_RESET}"
+
+        def impl(diff: dict | tuple | DiffEntry, ident: str, path: str) -> None:
             if isinstance(diff, DiffEntry):
                 color = "green" if diff.add_or_remove_flag else "red"
                 minus_or_plus = "+" if diff.add_or_remove_flag else "-"
                 obj_name = obj_name_to_add if diff.add_or_remove_flag else obj_name_to_remove
 
-                result += "\n------\n"
-                result += add_color(obj_name, "yellow")
-                result += f"{path}\n"
-                result += add_color(f"{minus_or_plus}{ident} {diff.val}", color)
+                out.write("\n------\n")
+                out.write(add_color(obj_name, "yellow"))
+                out.write(f"{path}\n")
+                out.write(add_color(f"{minus_or_plus}{ident} {diff.val}", color))
 
             if isinstance(diff, dict):
                 for key, value in diff.items():
-                    result += impl(
-                        value,
-                        obj_name_to_add,
-                        obj_name_to_remove,
-                        ident + " ",
-                        path + "\n" + f"{ident}  {key}",
-                    )
+                    label = f"[{key}]" if isinstance(diff, ListDiff) else key
+                    impl(value, ident + " ", path + "\n" + f"{ident}  {label}")
 
             if isinstance(diff, tuple):
                 for val in diff:
-                    result += impl(val, obj_name_to_add, obj_name_to_remove, ident, path)
+                    impl(val, ident, path)
 
-            return result
+        impl(self.diff, "", "")
 
-        return impl(self.diff, obj_name_to_add, obj_name_to_remove)
+    def to_ascii_colored_string(
+        self,
+        obj_name_to_add: str,
+        obj_name_to_remove: str,
+    ) -> str:
+        """Generate an ascii colored string representation of the diff.
+
+        Args:
+            obj_name_to_add (str): The name of the object to add.
+            obj_name_to_remove (str): The name of the object to remove.
+
+        """
+        out = io.StringIO()
+        self.write_ascii_colored(out, obj_name_to_add, obj_name_to_remove)
+        return out.getvalue()
+
+
+def list_key(*lists: list) -> str | None:
+    """Find the key which identifies every table of some arrays, if there is one.
+
+    Returns:
+        str | None: The first of `LIST_KEYS` which all the elements are tables with,
+            with a different value in each table of an array, or None.
+
+    """
+    if not all(isinstance(element, dict) for values in lists for element in values):
+        return None
+    for key in LIST_KEYS:
+        try:
+            if all(len({element[key] for element in values}) == len(values) for values in lists):
+                return key
+        except (KeyError, TypeError):
+            continue
+    return None
+
+
+def common_ends(expected: list, provided: list) -> tuple[int, int]:
+    """Count the elements which are the same at the start and at the end of two arrays.
+
+    Returns:
+        tuple[int, int]: How many are the same at the start, and then at the end.
+
+    """
+    shortest = min(len(expected), len(provided))
+    start = 0
+    while start < shortest and expected[start] == provided[start]:
+        start += 1
+    end = 0
+    while end < shortest - start and expected[-1 - end] == provided[-1 - end]:
+        end += 1
+    return start, end
+
+
+def freeze(value: any) -> any:
+    """Convert a value into a hashable one, which is equal for values with no strict diff."""
+    if isinstance(value, dict):
+        return frozenset((key, freeze(val)) for key, val in value.items())
+    if isinstance(value, list):
+        if list_key(value) is not None:
+            return ("keyed", frozenset(freeze(element) for element in value))
+        return tuple(freeze(element) for element in value)
+    return value
+
+
+def unified_diff(expected: list[str], provided: list[str], expected_name: str, provided_name: str) -> str:
+    """Generate a colored unified diff of two texts, like `colordiff -u`, without running it.
+
+    Args:
+        expected (list[str]): The lines the text should have.
+        provided (list[str]): The lines the text has.
+        expected_name (str): The name of the expected text.
+        provided_name (str): The name of the provided text.
+
+    Returns:
+        str: The diff, turning the provided text into the expected one, or "" if they are the same.
+
+    """
+    prefix_colors = {"---": "red", "+++": "green", "@@": "yellow", "-": "red", "+": "green"}
+    out = io.StringIO()
+    for line in difflib.unified_diff(provided, expected, provided_name, expected_name):
+        # The last line of a text may have no newline.
+        text = line.rstrip("\n")
+        color = next((color for prefix, color in prefix_colors.items() if text.startswith(prefix)), None)
+        out.write(f"{COLORS[color]}{text}{COLOR_RESET}\n" if color else f"{text}\n")
+    return out.getvalue()
 
 
 @dataclass
 class Diff:
-    """Calculates the difference between two dictionaries."""
+    """Calculates the difference between two dictionaries.
+
+    In a strict diff 'a' and 'b' must be the same, otherwise 'b' must include everything in 'a'.
+    Both are walked once, together.
+
+    Arrays are compared element by element, and their elements strictly.
+    Arrays of tables with a key from `LIST_KEYS` are matched up by it,
+    other arrays are lined up by their longest common subsequence.
+    """
 
     a: dict
     b: dict
@@ -98,61 +243,129 @@ class Diff:
 
     def get_diff(self) -> DiffResult:
         """Get Diff."""
-        if self.strict:
-            return self._strict_diff_()
-        return self._inclusion_diff_()
+        return DiffResult(self._diff_(self.a, self.b, strict=self.strict))
 
-    def _inclusion_diff_(self, *, reverse: bool = False) -> DiffResult:
-        """Calculate an inclusion diff between the 'a' and 'b' dicts in a recursive manner.
+    def equal(self) -> bool:
+        """Check if there is no difference, stopping at the first one found.
 
-        Checks that 'a' has an inclusion of 'b'.
+        Cheaper than `get_diff` for callers which only need to know if there is a difference.
+        """
+        return self._equal_(self.a, self.b, strict=self.strict)
 
-        Args:
-            reverse (bool): An inclusion diff calculation flag.
-                If 'True' evaluates that 'a' as an inclusion of 'b'.
-                If 'False' evaluates that 'b' as an inclusion of 'a'.
+    def _diff_(self, expected: dict, provided: dict, *, strict: bool) -> dict:
+        """Calculate the diff of two dicts in a recursive manner.
 
+        Entries of 'expected' are added (True), entries of 'provided' are removed (False).
+        Mismatched values are listed expected first, or provided first in a strict diff.
+        Keys only in 'provided' are only a difference in a strict diff.
         """
-
-        def impl(expected: dict, provided: dict) -> dict:
-            diff = {}
-            for key, expect in expected.items():
-                if key not in provided:
-                    diff[key] = DiffEntry(expect, add_or_remove_flag=True)
-                elif not isinstance(expect, dict):
-                    if expect != provided[key]:
-                        diff[key] = (
-                            DiffEntry(expect, add_or_remove_flag=True),
-                            DiffEntry(provided[key], add_or_remove_flag=False),
-                        )
-                else:
-                    res = impl(expect, provided[key])
-                    if res != {}:
-                        diff[key] = res
-            return diff
-
-        diff = impl(self.a, self.b) if not reverse else impl(self.b, self.a)
-        return DiffResult(diff)
-
-    def _strict_diff_(self) -> DiffResult:
-        """Calculate the strict diff between  the expected and provided inputs."""
-
-        def change_flags(diff: DiffResult) -> None:
-            if isinstance(diff, DiffEntry):
-                diff.add_or_remove_flag = not diff.add_or_remove_flag
-            if isinstance(diff, tuple):
-                for val in diff:
-                    change_flags(val)
-            if isinstance(diff, dict):
-                for key in diff:
-                    change_flags(diff[key])
-
-        # Finds two inclusion diffs and concatenate the results
-        # Also it is important to update a result from the second inclusion diff result
-        # Because it's result has a "reverse" add_or_remove_flag meaning
-        incl_diff_1 = self._inclusion_diff_()
-        incl_diff_2 = self._inclusion_diff_(reverse=True)
-        change_flags(incl_diff_2.diff)
-        incl_diff_1.diff.update(incl_diff_2.diff)
-
-        return incl_diff_1
+        diff = {}
+        for key, expect in expected.items():
+            if key not in provided:
+                diff[key] = DiffEntry(expect, add_or_remove_flag=True)
+            else:
+                res = self._diff_value_(expect, provided[key], strict=strict)
+                if res:
+                    diff[key] = res
+
+        if strict:
+            for key, value in provided.items():
+                if key not in expected:
+                    diff[key] = DiffEntry(value, add_or_remove_flag=False)
+        return diff
+
+    def _diff_value_(self, expected: any, provided: any, *, strict: bool) -> dict | tuple | None:
+        """Calculate the diff of two values, recursing into tables and arrays."""
+        if isinstance(expected, dict) and isinstance(provided, dict):
+            return self._diff_(expected, provided, strict=strict)
+        if isinstance(expected, list) and isinstance(provided, list):
+            return self._diff_list_(expected, provided)
+        if expected != provided:
+            added = DiffEntry(expected, add_or_remove_flag=True)
+            removed = DiffEntry(provided, add_or_remove_flag=False)
+            return (removed, added) if strict else (added, removed)
+        return None
+
+    def _diff_list_(self, expected: list, provided: list) -> ListDiff:
+        """Calculate the diff of two arrays, element by element."""
+        key = list_key(expected, provided)
+        if key is not None:
+            return self._diff_keyed_list_(expected, provided, key)
+
+        diff = ListDiff()
+
+        def add(index: int, entry: dict | tuple | DiffEntry) -> None:
+            if index not in diff:
+                diff[index] = entry
+            else:
+                existing = diff[index]
+                diff[index] = (*existing, entry) if isinstance(existing, tuple) else (existing, entry)
+
+        # Only the middle of arrays which differ in a few places needs to be lined up.
+        start, end = common_ends(expected, provided)
+        expected_middle = [freeze(element) for element in expected[start : len(expected) - end]]
+        provided_middle = [freeze(element) for element in provided[start : len(provided) - end]]
+
+        # Elements repeated all over long arrays are not used to line them up, it would take quadratic time.
+        matcher = difflib.SequenceMatcher(None, expected_middle, provided_middle)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            # Replaced elements are compared in pairs, the rest were inserted or deleted.
+            pairs = min(i2 - i1, j2 - j1)
+            for offset in range(pairs):
+                res = self._diff_value_(expected[start + i1 + offset], provided[start + j1 + offset], strict=True)
+                if res:
+                    add(start + j1 + offset, res)
+            for index in range(j1 + pairs, j2):
+                add(start + index, DiffEntry(provided[start + index], add_or_remove_flag=False))
+            for index in range(i1 + pairs, i2):
+                add(start + j2, DiffEntry(expected[start + index], add_or_remove_flag=True))
+        return ListDiff(sorted(diff.items()))
+
+    def _diff_keyed_list_(self, expected: list, provided: list, key: str) -> ListDiff:
+        """Calculate the diff of two arrays of tables, matching the tables up by a key."""
+        diff = ListDiff()
+        provided_by_key = {element[key]: index for index, element in enumerate(provided)}
+        missing = []
+        for element in expected:
+            index = provided_by_key.pop(element[key], None)
+            if index is None:
+                missing.append(DiffEntry(element, add_or_remove_flag=True))
+                continue
+            res = self._diff_(element, provided[index], strict=True)
+            if res:
+                diff[index] = res
+        for index in provided_by_key.values():
+            diff[index] = DiffEntry(provided[index], add_or_remove_flag=False)
+
+        diff = ListDiff(sorted(diff.items()))
+        if missing:
+            diff[LIST_END] = missing[0] if len(missing) == 1 else tuple(missing)
+        return diff
+
+    def _equal_(self, expected: dict, provided: dict, *, strict: bool) -> bool:
+        """Check two dicts have no diff in a recursive manner, returning at the first difference."""
+        if strict and len(expected) != len(provided):
+            return False
+        for key, expect in expected.items():
+            if key not in provided or not self._equal_value_(expect, provided[key], strict=strict):
+                return False
+        return True
+
+    def _equal_value_(self, expected: any, provided: any, *, strict: bool) -> bool:
+        """Check two values have no diff, returning at the first difference."""
+        if isinstance(expected, dict) and isinstance(provided, dict):
+            return self._equal_(expected, provided, strict=strict)
+        if isinstance(expected, list) and isinstance(provided, list):
+            if len(expected) != len(provided):
+                return False
+            key = list_key(expected, provided)
+            if key is None:
+                return all(self._equal_value_(e, p, strict=True) for e, p in zip(expected, provided, strict=True))
+            provided_by_key = {element[key]: element for element in provided}
+            return all(
+                element[key] in provided_by_key and self._equal_(element, provided_by_key[element[key]], strict=True)
+                for element in expected
+            )
+        return expected == provided
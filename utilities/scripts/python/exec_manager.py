@@ -1,19 +1,67 @@
 """Exec Manager."""
-# cspell: words rtype
+# cspell: words rtype sysconf jobserver MAKEFLAGS maxrss testsuites testsuite testcase classname
+# cspell: words utime stime inblock oublock statm meminfo iowait
 
+import collections
 import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import json
 import multiprocessing
+import os
+import re
+import resource
+import signal
 import subprocess
+import tempfile
 import textwrap
+import threading
 import time
 import types
-from dataclasses import dataclass
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from pathlib import Path
 from typing import Any, Self
 
-from rich import print  # noqa: A004
+from rich import (
+    get_console,
+    print,  # noqa: A004
+)
+from rich.live import Live
 from rich.table import Table
 from rich.text import Text
 
+# Number of trailing output lines kept in memory by a streaming `cli_run`.
+DEFAULT_TAIL_LINES = 1000
+
+# If set, `Results.save` exports the results into this directory.
+RESULTS_DIR_ENV = "CI_RESULTS_DIR"
+
+# If set, `cli_run` steps with a `CacheSpec` are cached in this directory.
+STEP_CACHE_DIR_ENV = "CI_STEP_CACHE_DIR"
+# The maximum size of the step cache in MiB, the least recently used entries are evicted.
+STEP_CACHE_SIZE_ENV = "CI_STEP_CACHE_SIZE_MB"
+DEFAULT_STEP_CACHE_SIZE_MB = 256
+# Directories never hashed as step cache inputs, they hold build output or VCS data.
+STEP_CACHE_IGNORED_DIRS = frozenset({".git", "target"})
+
+# Seconds between samples of the memory of a running command, to find its peak.
+PEAK_MEMORY_SAMPLE_INTERVAL = 0.1
+
+# Seconds between asking commands to terminate, and killing them.
+TERMINATE_GRACE_PERIOD = 5.0
+
+# How often the live view of a `ParallelRunner` is redrawn on a terminal, per second.
+LIVE_REFRESH_PER_SECOND = 2
+# Seconds between the status lines printed instead of the live view, when not on a terminal.
+STATUS_LINE_INTERVAL = 30.0
+# Number of CPU samples shown in the rolling CPU gauge.
+GAUGE_HISTORY = 20
+
+# The task being run by the current thread of a `ParallelRunner`, so its progress can be shown.
+_current_task = threading.local()
+
 
 def status_for_rc(rc: int) -> str:
     """Return a status emoji based on the given RC (return code) value.
@@ -50,6 +98,111 @@ def format_execution_time(execution_time: float) -> str:
     return f"{execution_time:.4f} {unit}"
 
 
+def available_memory_mb() -> int:
+    """Return the memory available to this process tree, in MiB.
+
+    This is the physical memory of the machine, or the cgroup v2 memory limit
+    if we are running inside a container which has a lower one.
+
+    Returns:
+        int: The available memory in MiB.
+
+    """
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    with contextlib.suppress(OSError, ValueError):
+        memory = min(memory, int(Path("/sys/fs/cgroup/memory.max").read_text().strip()))
+
+    return memory // (1024 * 1024)
+
+
+def format_size(size: float) -> str:
+    """Format a size in bytes into a human-readable string representation.
+
+    Args:
+        size (float): The size in bytes.
+
+    Returns:
+        str: The formatted size string.
+
+    """
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:  # noqa: PLR2004
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def cgroup_path() -> Path | None:
+    """Return the cgroup v2 directory of this process, if there is one."""
+    with contextlib.suppress(OSError):
+        for line in Path("/proc/self/cgroup").read_text().splitlines():
+            # cgroup v2 has a single hierarchy, with the ID 0.
+            if line.startswith("0::"):
+                path = Path("/sys/fs/cgroup") / line[3:].lstrip("/")
+                if path.is_dir():
+                    return path
+    return None
+
+
+def cgroup_memory() -> tuple[int, int | None] | None:
+    """Read the current and peak memory use of our cgroup v2, in bytes.
+
+    This covers every process in the cgroup, which inside a CI container is the whole build.
+
+    Returns:
+        tuple[int, int | None] | None: The current and peak memory.  The peak is None
+            on kernels which do not report it, and the result is None without cgroup v2.
+
+    """
+    path = cgroup_path()
+    if path is None:
+        return None
+
+    try:
+        current = int((path / "memory.current").read_text())
+    except (OSError, ValueError):
+        return None
+
+    peak = None
+    with contextlib.suppress(OSError, ValueError):
+        peak = int((path / "memory.peak").read_text())
+
+    return current, peak
+
+
+def process_tree_rss(pid: int) -> int:
+    """Return the total resident memory of a process and all its descendants, in bytes."""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        with contextlib.suppress(OSError, ValueError, IndexError):
+            total += int(Path(f"/proc/{pid}/statm").read_text().split()[1]) * page_size
+            for task in Path(f"/proc/{pid}/task").iterdir():
+                pids.extend(int(child) for child in (task / "children").read_text().split())
+    return total
+
+
+def format_elapsed(seconds: float) -> str:
+    """Format elapsed seconds compactly, for progress reporting.
+
+    Args:
+        seconds (float): The elapsed time in seconds.
+
+    Returns:
+        str: The elapsed time, like `42.1s` or `3m07s`.
+
+    """
+    if seconds < 60:  # noqa: PLR2004
+        return f"{seconds:.1f}s"
+    minutes, secs = divmod(int(seconds), 60)
+    if minutes < 60:  # noqa: PLR2004
+        return f"{minutes}m{secs:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m"
+
+
 def indent(text: str, first: str, rest: str) -> str:
     """Indent the given text using the specified indentation strings.
 
@@ -65,6 +218,49 @@ def indent(text: str, first: str, rest: str) -> str:
     return first + textwrap.indent(text, rest)[len(first) :]
 
 
+@dataclass
+class Usage:
+    """Resource usage of a child process, and everything it waited for.
+
+    CPU time and I/O come from `getrusage`.  Memory does not, as `ru_maxrss` starts
+    from the memory of the Python process the command was forked from.
+
+    Attributes:
+        user_time: User CPU time in seconds.
+        sys_time: System CPU time in seconds.
+        read_bytes: Bytes read from block devices.
+        write_bytes: Bytes written to block devices.
+        peak_rss: The peak resident memory of the whole process tree, sampled while it ran,
+            in bytes.  None if it was not sampled.
+        memory_samples: If sampling was enabled, `(seconds since start, bytes)` pairs
+            of the resident memory of the whole process tree.
+
+    """
+
+    user_time: float
+    sys_time: float
+    read_bytes: int
+    write_bytes: int
+    peak_rss: int | None = None
+    memory_samples: list[tuple[float, int]] = field(default_factory=list)
+
+    @classmethod
+    def from_rusage(cls, usage: resource.struct_rusage) -> Self:
+        """Create from the result of `os.wait4` or `resource.getrusage`."""
+        return cls(
+            usage.ru_utime,
+            usage.ru_stime,
+            # Block I/O is counted in 512 byte units.
+            usage.ru_inblock * 512,
+            usage.ru_oublock * 512,
+        )
+
+    @property
+    def cpu_time(self) -> float:
+        """The total user + system CPU time in seconds."""
+        return self.user_time + self.sys_time
+
+
 @dataclass
 class ProcedureResult:
     """Procedure Result."""
@@ -72,17 +268,37 @@ class ProcedureResult:
     rc: int
     cmd: str
     out: str
+    log_file: str | None = None
+    usage: Usage | None = None
+    out_size: int | None = None
+    cached: bool = False
 
 
 @dataclass
 class Result:
-    """Result."""
+    """Result.
+
+    `start` and `end` are `time.perf_counter()` timestamps, which are comparable
+    between processes on the same machine.  `queue_wait` is how long the step
+    waited to start after it was submitted to a `ParallelRunner`, and `usage` is the
+    resource usage of the child process, if there was one.
+    `out_size` is the size of the full output in bytes, even if
+    only its tail is kept in `out`.  `cached` is True if the result was replayed
+    from the step cache instead of being run.
+    """
 
     rc: int
     cmd: str
     out: str
     runtime: float
     name: str | None = None
+    log_file: str | None = None
+    start: float | None = None
+    end: float | None = None
+    queue_wait: float = 0.0
+    usage: Usage | None = None
+    out_size: int = 0
+    cached: bool = False
 
     def get_command(self) -> str:
         """Return the command of the object.
@@ -122,7 +338,45 @@ class Result:
         :return: A string representing the formatted execution time.
         :rtype: str
         """
-        return format_execution_time(self.runtime)
+        return format_execution_time(self.runtime) + (" (cached)" if self.cached else "")
+
+    def cpu(self) -> str:
+        """Return the CPU time of the child process.
+
+        :return: A string representing the formatted CPU time, or "-" if it is not known.
+        :rtype: str
+        """
+        return "-" if self.usage is None else format_execution_time(self.usage.cpu_time)
+
+    def cpu_split(self) -> str:
+        """Return the user and system CPU time of the child process.
+
+        :return: A string representing the formatted user / system CPU time, or "-" if it is not known.
+        :rtype: str
+        """
+        if self.usage is None:
+            return "-"
+        return f"{format_execution_time(self.usage.user_time)} / {format_execution_time(self.usage.sys_time)}"
+
+    def memory(self) -> str:
+        """Return the peak memory of the child process.
+
+        :return: A string representing the formatted peak memory, or "-" if it is not known.
+        :rtype: str
+        """
+        if self.usage is None or self.usage.peak_rss is None:
+            return "-"
+        return format_size(self.usage.peak_rss)
+
+    def io(self) -> str:
+        """Return the block I/O of the child process.
+
+        :return: A string representing the formatted bytes read and written, or "-" if it is not known.
+        :rtype: str
+        """
+        if self.usage is None:
+            return "-"
+        return f"{format_size(self.usage.read_bytes)} in / {format_size(self.usage.write_bytes)} out"
 
     def print(self, *, verbose: bool = False, verbose_errors: bool = False, name_width: int = 0) -> None:
         """Print the information about the task, including its name, duration, and status.
@@ -142,6 +396,441 @@ class Result:
             print(Text(indent(self.out, "  > ", "  . ")))
 
 
+def wait_with_usage(proc: subprocess.Popen) -> resource.struct_rusage:
+    """Wait for a process to exit, and return its resource usage.
+
+    The usage includes all the descendants the process waited for, so for a shell
+    it covers the commands it ran.  The return code is stored on `proc` as usual.
+    """
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return usage
+
+
+def signal_process_group(proc: subprocess.Popen, sig: signal.Signals) -> None:
+    """Send a signal to the process group of a command, which includes everything it started."""
+    with contextlib.suppress(ProcessLookupError, PermissionError):
+        os.killpg(proc.pid, sig)
+
+
+def terminate_process_group(proc: subprocess.Popen, grace: float = TERMINATE_GRACE_PERIOD) -> None:
+    """Send the process group of a command SIGTERM, and SIGKILL if it has not exited `grace` seconds later."""
+    signal_process_group(proc, signal.SIGTERM)
+    with contextlib.suppress(subprocess.TimeoutExpired):
+        proc.wait(grace)
+    # Anything it started may still be running, even once it has exited.
+    signal_process_group(proc, signal.SIGKILL)
+
+
+class DeferredInterrupt:
+    """Hold back `Ctrl-C` while a command starts, until it can be terminated.
+
+    A `KeyboardInterrupt` raised inside `subprocess.Popen` leaves the command running,
+    without its pid to terminate it by.  Only the main thread is ever interrupted,
+    and only the default `SIGINT` handler is replaced.
+    """
+
+    def __init__(self) -> None:
+        """Init."""
+        self.interrupted = False
+        self.previous = None
+
+    def __enter__(self) -> Self:
+        """Start holding back `SIGINT`."""
+        if threading.current_thread() is threading.main_thread() and (
+            signal.getsignal(signal.SIGINT) is signal.default_int_handler
+        ):
+            self.previous = signal.signal(signal.SIGINT, self.interrupt)
+        return self
+
+    def interrupt(self, _signum: int, _frame: types.FrameType | None) -> None:
+        """Remember `SIGINT` was received."""
+        self.interrupted = True
+
+    def release(self) -> None:
+        """Stop holding back `SIGINT`, raising `KeyboardInterrupt` if it was received meanwhile."""
+        if self.previous is not None:
+            signal.signal(signal.SIGINT, self.previous)
+            self.previous = None
+        if self.interrupted:
+            self.interrupted = False
+            raise KeyboardInterrupt
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: types.TracebackType | None,
+    ) -> None:
+        """Exit."""
+        self.release()
+
+
+class ChildProcesses:
+    """The commands started by `stream_run` for the tasks of one runner, which are still running.
+
+    Each `ParallelRunner` has its own, so cancelling one never terminates the commands of another.
+    Once terminated, commands which start later are terminated as soon as they are added, as a
+    running task may not have started its command yet when the runner is cancelled.
+    """
+
+    def __init__(self) -> None:
+        """Init."""
+        self.lock = threading.Lock()
+        self.running: set[subprocess.Popen] = set()
+        self.grace: float | None = None
+
+    def add(self, proc: subprocess.Popen) -> None:
+        """Track a command which has started, terminating it if the others already were."""
+        with self.lock:
+            self.running.add(proc)
+            grace = self.grace
+        if grace is not None:
+            self._stop({proc}, grace)
+
+    def discard(self, proc: subprocess.Popen) -> None:
+        """Stop tracking a command which has finished."""
+        with self.lock:
+            self.running.discard(proc)
+
+    def terminate(self, grace: float = TERMINATE_GRACE_PERIOD) -> int:
+        """Terminate every tracked command which is still running.
+
+        Each process group is sent SIGTERM, and any still running `grace` seconds later are sent SIGKILL.
+        This does not wait, the commands return as normal with the signal as their failure.
+
+        Args:
+            grace (float, optional): Seconds to wait before killing. Defaults to TERMINATE_GRACE_PERIOD.
+
+        Returns:
+            int: The number of commands signalled.
+
+        """
+        with self.lock:
+            self.grace = grace
+            children = set(self.running)
+
+        self._stop(children, grace)
+        return len(children)
+
+    def _stop(self, children: set[subprocess.Popen], grace: float) -> None:
+        """Send commands SIGTERM, and SIGKILL to those still tracked `grace` seconds later."""
+        for proc in children:
+            signal_process_group(proc, signal.SIGTERM)
+
+        def kill() -> None:
+            with self.lock:
+                remaining = children & self.running
+            for proc in remaining:
+                signal_process_group(proc, signal.SIGKILL)
+
+        if children:
+            killer = threading.Timer(grace, kill)
+            killer.daemon = True
+            killer.start()
+
+
+def stream_run(  # noqa: C901, PLR0912, PLR0913, PLR0915
+    command: str,
+    *,
+    timeout: float | None = None,
+    env: Any = None,  # noqa: ANN401
+    tail_lines: int | None = DEFAULT_TAIL_LINES,
+    spill_dir: str | None = None,
+    sample_interval: float | None = None,
+) -> ProcedureResult:
+    """Run a command, streaming its output instead of buffering all of it.
+
+    Every line of output is written to a spill file as it is produced, and only
+    the last `tail_lines` lines are kept in memory.  This keeps memory use flat
+    no matter how much output the command generates.
+
+    The command runs in its own process group, so it and everything it starts can
+    be terminated together.  When run by a task of a `ParallelRunner`, it is tracked
+    by the runner, see `ChildProcesses`.  As the group does not get the signals of
+    the terminal, it is terminated if the caller is interrupted while it runs.
+
+    Args:
+        command (str): The shell command to run.
+        timeout (float | None, optional): Seconds before the command is killed. Defaults to None.
+        env (Any, optional): The environment to run the command in. Defaults to None.
+        tail_lines (int | None, optional): Number of trailing lines kept in memory. Defaults to DEFAULT_TAIL_LINES.
+            If None, all output is kept in memory and no spill file is written.
+        spill_dir (str | None, optional): Where to write the spill file. Defaults to the system temp dir.
+        sample_interval (float | None, optional): If set, record the memory of the process tree
+            every `sample_interval` seconds. Defaults to None.
+            Its peak is always sampled, every PEAK_MEMORY_SAMPLE_INTERVAL seconds.
+
+    Returns:
+        ProcedureResult: The result, `out` holds the tail of the output.
+            If output was truncated, `log_file` is the path to the full output.
+
+    Raises:
+        subprocess.TimeoutExpired: If the command did not finish within `timeout`.
+
+    """
+    tail = collections.deque(maxlen=tail_lines)
+    lines = 0
+    out_size = 0
+    timed_out = threading.Event()
+    finished = threading.Event()
+    samples = []
+    peak_rss = 0
+
+    spill = None
+    log_file = None
+    try:
+        with (
+            tempfile.NamedTemporaryFile(
+                "w",
+                prefix="exec-",
+                suffix=".log",
+                dir=spill_dir,
+                delete=False,
+            )
+            if tail_lines is not None
+            else contextlib.nullcontext() as spill,
+            DeferredInterrupt() as held,
+            subprocess.Popen(  # noqa: S602
+                command,
+                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="replace",
+                env=env,
+                start_new_session=True,
+            ) as proc,
+        ):
+            task = getattr(_current_task, "task", None)
+            children = task.children if task is not None else None
+
+            def expire() -> None:
+                timed_out.set()
+                signal_process_group(proc, signal.SIGKILL)
+
+            def sample() -> None:
+                nonlocal peak_rss
+                interval = min(sample_interval or PEAK_MEMORY_SAMPLE_INTERVAL, PEAK_MEMORY_SAMPLE_INTERVAL)
+                start = time.perf_counter()
+                recorded = None
+                while True:
+                    rss = process_tree_rss(proc.pid)
+                    peak_rss = max(peak_rss, rss)
+                    now = time.perf_counter() - start
+                    if sample_interval and (recorded is None or now - recorded >= sample_interval):
+                        samples.append((now, rss))
+                        recorded = now
+                    if finished.wait(interval):
+                        break
+
+            timer = threading.Timer(timeout, expire) if timeout is not None else None
+            sampler = threading.Thread(target=sample, daemon=True)
+            try:
+                held.release()
+                if children is not None:
+                    children.add(proc)
+                if timer is not None:
+                    timer.start()
+                sampler.start()
+                for line in proc.stdout:
+                    if spill is not None:
+                        spill.write(line)
+                    if task is not None and not line.isspace():
+                        task.last_line = line.rstrip()
+                    tail.append(line)
+                    lines += 1
+                    out_size += len(line.encode())
+                usage = Usage.from_rusage(wait_with_usage(proc))
+            except BaseException:
+                # The command is in a session of its own, so nothing else stops it if we are interrupted.
+                terminate_process_group(proc)
+                raise
+            finally:
+                if children is not None:
+                    children.discard(proc)
+                if timer is not None:
+                    timer.cancel()
+                finished.set()
+                if sampler.is_alive():
+                    sampler.join()
+            usage.peak_rss = peak_rss or None
+            usage.memory_samples = samples
+
+        out = "".join(tail)
+        if lines > len(tail):
+            # The output of a command which timed out is not returned, so neither is its spill file.
+            log_file = None if timed_out.is_set() else spill.name
+            where = f", full output in {log_file}" if log_file else ""
+            out = f"... {lines - len(tail)} lines omitted{where} ...\n" + out
+    finally:
+        # The spill file is only kept when the full output is returned in it.
+        if spill is not None and log_file is None:
+            Path(spill.name).unlink(missing_ok=True)
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(command, timeout, output=out)
+
+    return ProcedureResult(
+        proc.returncode,
+        command,
+        out,
+        log_file,
+        usage=usage,
+        out_size=out_size,
+    )
+
+
+def subprocess_bound(func: callable) -> callable:
+    """Mark a function as only waiting on subprocesses.
+
+    `ParallelRunner` runs tasks for marked functions on a thread instead of a worker
+    process, as they do not need a Python interpreter of their own.
+    The function and its arguments do not need to be picklable, and it must not
+    change process wide state (like `os.environ`).
+    """
+    func.subprocess_bound = True
+    return func
+
+
+@dataclass
+class CacheSpec:
+    """Declares everything the outcome of a cached `cli_run` step depends on, besides its command.
+
+    Attributes:
+        inputs: Files or directories whose contents are inputs to the step.
+            `.git` and `target` directories are never hashed.
+        env: Names of environment variables the step depends on.
+        tools: Commands which print the version of each tool the step uses, e.g. `cargo deny --version`.
+        max_age: Seconds a cached result stays valid, for steps which also depend on
+            external data.  None means it is valid until the inputs change.
+
+    """
+
+    inputs: list[str] = field(default_factory=list)
+    env: list[str] = field(default_factory=list)
+    tools: list[str] = field(default_factory=list)
+    max_age: float | None = None
+
+
+@functools.cache
+def tool_version(command: str) -> str:
+    """Return the output of a tool version command, only running it once per process."""
+    result = subprocess.run(command, shell=True, capture_output=True, text=True, check=False)  # noqa: S602
+    return f"{result.returncode}:{result.stdout}{result.stderr}"
+
+
+class StepCache:
+    """A content addressed, size bounded cache of `cli_run` step results on local disk."""
+
+    def __init__(self, directory: str, max_size_mb: int = DEFAULT_STEP_CACHE_SIZE_MB) -> None:
+        """Initialize the cache.
+
+        Args:
+            directory (str): Where the cache entries are stored.
+            max_size_mb (int, optional): The maximum total size of all entries in MiB.
+                Defaults to DEFAULT_STEP_CACHE_SIZE_MB.
+
+        Returns:
+            None
+
+        """
+        self.directory = Path(directory)
+        self.max_size = max_size_mb * 1024 * 1024
+
+    @classmethod
+    def from_env(cls) -> Self | None:
+        """Return the cache configured by the environment, or None if caching is not enabled."""
+        directory = os.environ.get(STEP_CACHE_DIR_ENV)
+        if not directory:
+            return None
+        return cls(directory, int(os.environ.get(STEP_CACHE_SIZE_ENV, DEFAULT_STEP_CACHE_SIZE_MB)))
+
+    def key(self, command: str, spec: CacheSpec, env: dict[str, str] | None = None) -> str:
+        """Calculate the cache key of a step, from the command and everything it depends on.
+
+        The `spec.env` variables are looked up in `env`, the environment the command runs in,
+        or in the environment of this process if it is None.
+        """
+        digest = hashlib.sha256()
+        environ = os.environ if env is None else env
+
+        def update(*parts: str) -> None:
+            for part in parts:
+                digest.update(part.encode())
+                digest.update(b"\0")
+
+        update("command", command, "cwd", str(Path.cwd()))
+        for name in sorted(spec.env):
+            update("env", name, environ.get(name, "\0unset"))
+        for tool in sorted(spec.tools):
+            update("tool", tool, tool_version(tool))
+        for path in sorted(spec.inputs):
+            update("input", path)
+            for file in self._files(Path(path)):
+                update("file", str(file))
+                with file.open("rb") as data:
+                    digest.update(hashlib.file_digest(data, "sha256").digest())
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def _files(path: Path) -> list[Path]:
+        """List the files under an input path in a stable order."""
+        if path.is_file():
+            return [path]
+
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if name not in STEP_CACHE_IGNORED_DIRS)
+            files.extend(Path(root) / name for name in sorted(names))
+        return files
+
+    def get(self, key: str, max_age: float | None = None) -> ProcedureResult | None:
+        """Return the cached result for a key, if there is one and it is not too old."""
+        entry = self.directory / f"{key}.json"
+        try:
+            data = json.loads(entry.read_text())
+        except (OSError, ValueError):
+            return None
+
+        if max_age is not None and time.time() - data["created"] > max_age:
+            return None
+
+        # Mark the entry as recently used.
+        with contextlib.suppress(OSError):
+            entry.touch()
+
+        return ProcedureResult(data["rc"], data["cmd"], data["out"], out_size=data["out_size"], cached=True)
+
+    def put(self, key: str, result: ProcedureResult) -> None:
+        """Store a result in the cache, then evict old entries until it is within its size limit."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = {"rc": result.rc, "cmd": result.cmd, "out": result.out, "out_size": result.out_size}
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as file:
+            json.dump({**entry, "created": time.time()}, file)
+        # Atomic, so concurrent runs never see a partial entry.
+        Path(file.name).replace(self.directory / f"{key}.json")
+
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries until the cache is within its size limit."""
+        entries = []
+        for entry in self.directory.glob("*.json"):
+            with contextlib.suppress(OSError):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry in sorted(entries, key=lambda e: e[0]):
+            if size <= self.max_size:
+                break
+            entry.unlink(missing_ok=True)
+            size -= entry_size
+
+
+@subprocess_bound
 def cli_run(  # noqa: PLR0913
     command: str,
     name: str | None = None,
@@ -150,21 +839,47 @@ def cli_run(  # noqa: PLR0913
     timeout: float | None = None,
     verbose: bool = False,
     env: Any = None,  # noqa: ANN401
+    stream: bool = False,
+    tail_lines: int = DEFAULT_TAIL_LINES,
+    cache: CacheSpec | None = None,
+    sample_interval: float | None = None,
 ) -> Result:
-    """CLI Run."""
+    """CLI Run.
+
+    If `stream` is True, output is read incrementally and only the last `tail_lines`
+    lines are kept in memory, see `stream_run`.
+
+    If `cache` is given and the step cache is enabled by `CI_STEP_CACHE_DIR`, the output
+    of a previous successful run is replayed when none of the declared inputs changed.
+
+    If `sample_interval` is set, the memory of the command is sampled over time.
+    """
 
     def procedure() -> ProcedureResult:
-        result = subprocess.run(  # noqa: S602
+        task = getattr(_current_task, "task", None)
+        if task is not None:
+            task.label = name or command
+
+        store = StepCache.from_env() if cache is not None else None
+        if store is not None:
+            key = store.key(command, cache, env)
+            cached = store.get(key, cache.max_age)
+            if cached is not None:
+                return cached
+
+        result = stream_run(
             command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
             timeout=timeout,
             env=env,
-            check=False,
+            tail_lines=tail_lines if stream else None,
+            sample_interval=sample_interval,
         )
-        return ProcedureResult(result.returncode, command, result.stdout)
+
+        # Failures are not cached, they may be caused by something the spec does not cover.
+        if store is not None and result.rc == 0:
+            store.put(key, result)
+
+        return result
 
     return procedure_run(procedure, name, log=log, verbose=verbose)
 
@@ -203,9 +918,21 @@ def procedure_run(
 
     result = procedure()
 
-    execution_time = time.perf_counter() - start_time
-
-    res = Result(result.rc, result.cmd, result.out, execution_time, name)
+    end_time = time.perf_counter()
+
+    res = Result(
+        result.rc,
+        result.cmd,
+        result.out,
+        end_time - start_time,
+        name,
+        result.log_file,
+        start=start_time,
+        end=end_time,
+        usage=result.usage,
+        out_size=len(result.out.encode()) if result.out_size is None else result.out_size,
+        cached=result.cached,
+    )
 
     if log:
         res.print(verbose_errors=True, verbose=verbose)
@@ -228,6 +955,9 @@ class Results:
         """
         self.title = title
         self.results = []
+        # Set by `ParallelRunner`, used to report how well the steps ran in parallel.
+        self.slots: int | None = None
+        self.critical_path: list[Result] = []
 
     def add(self, result: Result | list[Result]) -> None:
         """Add a result to the list of results.
@@ -259,20 +989,265 @@ class Results:
         table = Table(title=self.title)
         table.add_column("Step", style="cyan")
         table.add_column("Duration", style="magenta")
+        table.add_column("CPU", style="blue")
+        table.add_column("User / Sys", style="blue")
+        table.add_column("Memory", style="blue")
+        table.add_column("I/O", style="blue")
         table.add_column("OK", style="green")
 
         total_rc = 0
         total_runtime = 0.0
+        total_cpu = 0.0
+        peak_memory = 0
         for result in self.results:
-            table.add_row(result.get_name(), result.duration(), result.status())
+            table.add_row(
+                result.get_name(),
+                result.duration(),
+                result.cpu(),
+                result.cpu_split(),
+                result.memory(),
+                result.io(),
+                result.status(),
+            )
             total_rc += result.rc
             total_runtime += result.runtime
+            if result.usage is not None:
+                total_cpu += result.usage.cpu_time
+                peak_memory = max(peak_memory, result.usage.peak_rss or 0)
+
+        # The peak memory of the whole container is more useful than the largest step, when we can get it.
+        cgroup = cgroup_memory()
+        if cgroup is not None and cgroup[1] is not None:
+            peak_memory = cgroup[1]
 
         table.add_section()
-        table.add_row("Summary", format_execution_time(total_runtime), status_for_rc(total_rc))
+        table.add_row(
+            "Summary",
+            format_execution_time(total_runtime),
+            format_execution_time(total_cpu),
+            "",
+            format_size(peak_memory),
+            "",
+            status_for_rc(total_rc),
+        )
 
         print(table)
 
+        if self.slots is not None:
+            self.print_timeline()
+
+    def print_timeline(self, width: int = 40) -> None:
+        """Print a Gantt style timeline of the results, and how well they ran in parallel.
+
+        Steps on the critical path are highlighted.
+
+        Args:
+            width (int, optional): The width of the timeline bars. Defaults to 40.
+
+        Returns:
+            None
+
+        """
+        timed = sorted((result for result in self.results if result.start is not None), key=lambda r: r.start)
+        if not timed:
+            return
+
+        origin = timed[0].start
+        wall_clock = max(result.end for result in timed) - origin
+        scale = width / wall_clock if wall_clock > 0 else 0.0
+        critical = {id(result) for result in self.critical_path}
+
+        table = Table(title=f"{self.title} Timeline")
+        table.add_column("Step", style="cyan")
+        table.add_column("Timeline")
+        table.add_column("Wait", style="yellow")
+        table.add_column("Duration", style="magenta")
+        for result in timed:
+            offset = min(int((result.start - origin) * scale), width - 1)
+            length = min(max(1, round(result.runtime * scale)), width - offset)
+            bar = (" " * offset + "█" * length).ljust(width)
+            table.add_row(
+                result.get_name(),
+                Text(bar, style="bold red" if id(result) in critical else "green"),
+                format_execution_time(result.queue_wait),
+                result.duration(),
+            )
+        print(table)
+
+        busy = sum(result.runtime for result in timed)
+        parallelism = busy / wall_clock if wall_clock > 0 else 1.0
+        print(
+            f"Wall clock: [magenta]{format_execution_time(wall_clock)}[/magenta]"
+            f" : Busy: [magenta]{format_execution_time(busy)}[/magenta]"
+            f" : Average parallelism: [magenta]{parallelism:.2f}[/magenta]"
+            f" : Parallel efficiency: [magenta]{parallelism / (self.slots or 1):.1%}[/magenta]",
+        )
+        if self.critical_path:
+            length = sum(result.runtime for result in self.critical_path)
+            steps = " -> ".join(result.get_name() for result in self.critical_path)
+            print(f"Critical path ([magenta]{format_execution_time(length)}[/magenta]): [bold red]{steps}[/bold red]")
+
+    def records(self) -> list[dict[str, Any]]:
+        """Return the results as a list of plain records, suitable for serializing.
+
+        Start and end are converted to Unix timestamps, so runs can be compared.
+
+        :return: A list with one dict per result.
+        :rtype: list[dict[str, Any]]
+        """
+        # `perf_counter` has an arbitrary origin, so map it onto the wall clock.
+        epoch = time.time() - time.perf_counter()
+        return [
+            {
+                "step": result.get_name(),
+                "command": result.get_command(),
+                "rc": result.rc,
+                "start": None if result.start is None else epoch + result.start,
+                "end": None if result.end is None else epoch + result.end,
+                "duration": result.runtime,
+                "queue_wait": result.queue_wait,
+                "cpu_time": None if result.usage is None else result.usage.cpu_time,
+                "user_time": None if result.usage is None else result.usage.user_time,
+                "sys_time": None if result.usage is None else result.usage.sys_time,
+                "peak_rss": None if result.usage is None else result.usage.peak_rss,
+                "read_bytes": None if result.usage is None else result.usage.read_bytes,
+                "write_bytes": None if result.usage is None else result.usage.write_bytes,
+                "memory_samples": [] if result.usage is None else result.usage.memory_samples,
+                "out_size": result.out_size,
+                "cached": result.cached,
+            }
+            for result in self.results
+        ]
+
+    def write_jsonl(self, path: str) -> None:
+        """Write the results as JSON Lines, one record per step.
+
+        Args:
+            path (str): The file to write.
+
+        Returns:
+            None
+
+        """
+        with Path(path).open("w") as file:
+            file.writelines(json.dumps({"title": self.title, **record}) + "\n" for record in self.records())
+
+    def write_junit(self, path: str) -> None:
+        """Write the results as a JUnit XML report, one test case per step.
+
+        The output of failed steps is included in the failure element.
+
+        Args:
+            path (str): The file to write.
+
+        Returns:
+            None
+
+        """
+
+        def xml_text(text: str) -> str:
+            # Remove terminal color codes and anything else XML can not hold.
+            return re.sub(r"\x1b\[[0-9;]*m|[^\x09\x0a\x0d\x20-\ud7ff\ue000-\ufffd]", "", text)
+
+        failures = sum(not result.ok() for result in self.results)
+        suites = ET.Element("testsuites", tests=str(len(self.results)), failures=str(failures))
+        suite = ET.SubElement(
+            suites,
+            "testsuite",
+            name=self.title,
+            tests=str(len(self.results)),
+            failures=str(failures),
+            time=f"{sum(result.runtime for result in self.results):.6f}",
+        )
+        for result in self.results:
+            case = ET.SubElement(
+                suite,
+                "testcase",
+                name=result.get_name(),
+                classname=self.title,
+                time=f"{result.runtime:.6f}",
+            )
+            if not result.ok():
+                failure = ET.SubElement(case, "failure", message=f"rc={result.rc}: {xml_text(result.get_command())}")
+                failure.text = xml_text(result.out)
+
+        ET.ElementTree(suites).write(path, encoding="utf-8", xml_declaration=True)
+
+    def write_chrome_trace(self, path: str) -> None:
+        """Write the results in the Chrome trace event format, viewable in Perfetto or `chrome://tracing`.
+
+        Overlapping steps are placed on separate tracks.
+
+        Args:
+            path (str): The file to write.
+
+        Returns:
+            None
+
+        """
+        events = []
+        track_ends: list[float] = []
+        for record in sorted((rec for rec in self.records() if rec["start"] is not None), key=lambda r: r["start"]):
+            # Use the first track which is free by the time this step starts.
+            track = next((i for i, end in enumerate(track_ends) if end <= record["start"]), len(track_ends))
+            if track == len(track_ends):
+                track_ends.append(record["end"])
+            else:
+                track_ends[track] = record["end"]
+            events.append(
+                {
+                    "name": record["step"],
+                    "cat": self.title,
+                    "ph": "X",
+                    "ts": record["start"] * 1e6,
+                    "dur": record["duration"] * 1e6,
+                    "pid": 1,
+                    "tid": track,
+                    "args": {
+                        key: record[key]
+                        for key in ("command", "rc", "queue_wait", "cpu_time", "peak_rss", "read_bytes", "write_bytes")
+                    },
+                },
+            )
+            # Sampled memory is shown as a counter track.
+            events.extend(
+                {
+                    "name": f"{record['step']} memory",
+                    "ph": "C",
+                    "ts": (record["start"] + offset) * 1e6,
+                    "pid": 1,
+                    "args": {"rss": rss},
+                }
+                for offset, rss in record["memory_samples"]
+            )
+
+        with Path(path).open("w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    def save(self, directory: str | None = None) -> None:
+        """Export the results as JSON Lines, JUnit XML and a Chrome trace.
+
+        The files are named after the title of the results.
+
+        Args:
+            directory (str | None, optional): Where to write the files.
+                Defaults to the directory named by the `CI_RESULTS_DIR` environment variable.
+                If neither is set, nothing is written.
+
+        Returns:
+            None
+
+        """
+        directory = directory or os.environ.get(RESULTS_DIR_ENV)
+        if not directory:
+            return
+
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        stem = str(Path(directory) / re.sub(r"[^A-Za-z0-9]+", "_", self.title).strip("_").lower())
+        self.write_jsonl(f"{stem}.jsonl")
+        self.write_junit(f"{stem}.junit.xml")
+        self.write_chrome_trace(f"{stem}.trace.json")
+
     def ok(self) -> bool:
         """Check if all results in the list are ok.
 
@@ -283,17 +1258,331 @@ class Results:
         return all(result.ok() for result in self.results)
 
 
-class ParallelRunner:
-    """Parallel Runner."""
+@dataclass(eq=False)
+class Task:
+    """A step scheduled on a `ParallelRunner`.
+
+    Attributes:
+        func: The callable to run, it must return a `Result` or a list of `Result`.
+        args: Positional arguments for `func`.
+        kwargs: Keyword arguments for `func`.
+        after: Tasks which must finish successfully before this one can start.
+            If any of them fail, this task is skipped, unless it is `always` run.
+        always: Run the task once the tasks in `after` have finished, even if some of them failed,
+            so `after` only orders it.
+        tags: Resource tags.  Tasks which share a tag never run at the same time.
+        slots: The number of CPU slots the task occupies while it runs.
+        memory_mb: An estimate of the peak memory the task needs, in MiB.
+        started: When the task was submitted to run, as a `time.perf_counter` value.
+        label: The name of the step it is currently running, set by `cli_run`.
+        last_line: The latest line of output of the running step, set by `stream_run`.
+        children: The running commands of the runner the task is scheduled on, set by `ParallelRunner`.
+
+    """
 
-    def __init__(self, name: str, max_workers: int | None = None) -> None:
+    func: callable
+    args: tuple = ()
+    kwargs: dict[str, Any] = field(default_factory=dict)
+    after: list["Task"] = field(default_factory=list)  # noqa: UP037
+    always: bool = False
+    tags: set[str] = field(default_factory=set)
+    slots: int = 1
+    memory_mb: int = 0
+    result: Result | list[Result] | None = None
+    skipped: bool = False
+    queued: float | None = None
+    started: float | None = None
+    label: str | None = None
+    last_line: str = ""
+    children: ChildProcesses | None = None
+
+    def name(self) -> str:
+        """Return a name for the task, to show its progress.
+
+        :return: The name of the running step, the `name` argument, or the function name.
+        :rtype: str
+        """
+        return self.label or self.kwargs.get("name") or getattr(self.func, "__name__", "task")
+
+    def results(self) -> list[Result]:
+        """Return the results of the task as a list.
+
+        :return: The results, empty if the task has not run.
+        :rtype: list[Result]
+        """
+        if self.result is None:
+            return []
+        return self.result if isinstance(self.result, list) else [self.result]
+
+    def done(self) -> bool:
+        """Check if the task has finished, or will never run.
+
+        :return: True if the task has a result or was skipped.
+        :rtype: bool
+        """
+        return self.skipped or self.result is not None
+
+    def ok(self) -> bool:
+        """Check if the task finished successfully.
+
+        :return: True if the task ran and all of its results are ok.
+        :rtype: bool
+        """
+        if self.skipped or self.result is None:
+            return False
+        return all(res.ok() for res in self.results())
+
+
+def run_task(task: Task) -> Result | list[Result]:
+    """Run a task on the current thread, so `cli_run` and `stream_run` can report its progress."""
+    _current_task.task = task
+    try:
+        return task.func(*task.args, **task.kwargs)
+    finally:
+        _current_task.task = None
+
+
+class ResourceGauge:
+    """Rolling CPU and memory use of the machine, or the cgroup of the build if it has one."""
+
+    def __init__(self) -> None:
         """Init."""
+        self.cpu = collections.deque(maxlen=GAUGE_HISTORY)
+        self.last = self._cpu_times()
+        self.memory_limit = available_memory_mb() * 1024 * 1024
+
+    @staticmethod
+    def _cpu_times() -> tuple[int, int] | None:
+        """Read the busy and total CPU time of the machine from `/proc/stat`."""
+        try:
+            fields = [int(value) for value in Path("/proc/stat").read_text().split("\n", 1)[0].split()[1:]]
+        except (OSError, ValueError):
+            return None
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)  # noqa: PLR2004
+        return sum(fields) - idle, sum(fields)
+
+    @staticmethod
+    def memory() -> int | None:
+        """Return the memory currently in use, in bytes."""
+        usage = cgroup_memory()
+        if usage is not None:
+            return usage[0]
+        try:
+            meminfo = dict(line.split(":", 1) for line in Path("/proc/meminfo").read_text().splitlines())
+            return (int(meminfo["MemTotal"].split()[0]) - int(meminfo["MemAvailable"].split()[0])) * 1024
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def sample(self) -> None:
+        """Take a CPU sample, the busy fraction since the previous one."""
+        now = self._cpu_times()
+        if now is not None and self.last is not None and now[1] > self.last[1]:
+            self.cpu.append((now[0] - self.last[0]) / (now[1] - self.last[1]))
+        self.last = now
+
+    def spark(self) -> str:
+        """Draw the recent CPU samples as a sparkline."""
+        bars = "▁▂▃▄▅▆▇█"
+        return "".join(bars[min(len(bars) - 1, int(cpu * len(bars)))] for cpu in self.cpu)
+
+    def summary(self, *, spark: bool = False) -> str:
+        """Describe the current CPU and memory use."""
+        cpu = f"CPU {self.cpu[-1]:.0%}" if self.cpu else "CPU -"
+        if spark:
+            cpu = f"CPU {self.spark()} {self.cpu[-1]:.0%}" if self.cpu else cpu
+        memory = self.memory()
+        memory = f"Memory {format_size(memory)} / {format_size(self.memory_limit)}" if memory is not None else ""
+        return f"{cpu} : {memory}" if memory else cpu
+
+
+class LiveStatus:
+    """Show the progress of the tasks of a `ParallelRunner` while they run.
+
+    On a terminal this is a live view of the running, queued and finished steps,
+    with the latest output line of each running step and a rolling CPU/memory gauge.
+    Otherwise, like in CI logs, a compact status line is printed periodically.
+    """
+
+    def __init__(self, runner: "ParallelRunner") -> None:  # noqa: UP037
+        """Init."""
+        self.runner = runner
+        self.console = get_console()
+        self.gauge = ResourceGauge()
+        self.start = time.perf_counter()
+        self.stopped = threading.Event()
+        self.live = None
+        self.thread = None
+
+    def __enter__(self) -> Self:
+        """Start showing progress."""
+        if self.console.is_terminal:
+            self.live = Live(
+                console=self.console,
+                get_renderable=self.render,
+                refresh_per_second=LIVE_REFRESH_PER_SECOND,
+                transient=True,
+            )
+            self.live.start()
+            interval = 1 / LIVE_REFRESH_PER_SECOND
+        else:
+            interval = STATUS_LINE_INTERVAL
+        self.thread = threading.Thread(target=self._update, args=(interval,), daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: types.TracebackType | None,
+    ) -> None:
+        """Stop showing progress."""
+        self.stopped.set()
+        self.thread.join()
+        if self.live is not None:
+            self.live.stop()
+
+    def _update(self, interval: float) -> None:
+        """Sample the gauge, and print a status line when there is no live view."""
+        while not self.stopped.wait(interval):
+            self.gauge.sample()
+            if self.live is None:
+                self.console.print(self.status_line(), soft_wrap=True, highlight=False)
+
+    def _snapshot(self) -> tuple[list[Task], list[Task], list[Task]]:
+        """Return the running, queued and finished tasks."""
+        running = list(self.runner.running.values())
+        queued = list(self.runner.pending)
+        finished = [task for task in list(self.runner.tasks) if task.result is not None]
+        return running, queued, finished
+
+    def status_line(self) -> str:
+        """Describe the progress in one line."""
+        running, queued, finished = self._snapshot()
+        now = time.perf_counter()
+        steps = ", ".join(f"{task.name()} {format_elapsed(now - task.started)}" for task in running if task.started)
+        failed = sum(not task.ok() for task in finished)
+        return (
+            f"{self.runner.results.title} [{format_elapsed(now - self.start)}] : "
+            f"{len(running)} running ({steps}) : {len(queued)} queued : "
+            f"{len(finished)} done, {failed} failed : {self.gauge.summary()}"
+        )
+
+    def render(self) -> Table:
+        """Render the live view."""
+        running, queued, finished = self._snapshot()
+        now = time.perf_counter()
+        failed = sum(not task.ok() for task in finished)
+
+        table = Table(
+            title=f"{self.runner.results.title} [{format_elapsed(now - self.start)}]",
+            caption=self.gauge.summary(spark=True),
+            expand=True,
+        )
+        table.add_column("Step", no_wrap=True)
+        table.add_column("Elapsed", no_wrap=True)
+        table.add_column("Output", no_wrap=True, overflow="ellipsis", ratio=1)
+
+        for task in running:
+            elapsed = format_elapsed(now - task.started) if task.started else ""
+            table.add_row(task.name(), elapsed, Text(task.last_line, style="dim"))
+        if queued:
+            table.add_row(f"{len(queued)} queued", "", Text(", ".join(task.name() for task in queued), style="dim"))
+        table.add_row(
+            f"{len(finished)} done",
+            "",
+            Text(f"{failed} failed", style="bold red") if failed else Text("all ok", style="green"),
+            end_section=True,
+        )
+        return table
+
+
+class ParallelRunner:
+    """Parallel Runner.
+
+    Tasks start as soon as all the tasks they were scheduled `after` have finished,
+    so dependent chains of steps overlap with everything else being run.
+
+    Tasks are admitted against a budget of `max_workers` CPU slots and `memory_mb`
+    MiB of memory, so heavy steps do not all start at once and oversubscribe the machine.
+    A task which on its own exceeds the budget still runs, but only when nothing else is.
+
+    Tasks for functions marked with `subprocess_bound` (like `cli_run`) run on a thread pool,
+    everything else runs in a process pool, which is only started if it is needed.
+
+    By default every task runs even if others fail, for full visibility of all problems.
+    With `fail_fast`, the first failure cancels all queued tasks and terminates the
+    commands of running `cli_run` tasks.
+
+    While waiting for results, progress is shown with a `LiveStatus`, unless `progress` is False.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        name: str,
+        max_workers: int | None = None,
+        *,
+        memory_mb: int | None = None,
+        jobserver: bool = False,
+        fail_fast: bool = False,
+        progress: bool = True,
+    ) -> None:
+        """Init.
+
+        Args:
+            name (str): The title of the results.
+            max_workers (int | None, optional): The CPU slot budget. Defaults to the CPU count.
+            memory_mb (int | None, optional): The memory budget in MiB. Defaults to the available memory.
+            jobserver (bool, optional): Share a GNU make jobserver with `max_workers` tokens with
+                all child processes, so tools like `cargo` limit their own parallel jobs globally.
+                Defaults to False.
+            fail_fast (bool, optional): Cancel everything else as soon as one task fails. Defaults to False.
+            progress (bool, optional): Show the progress of the tasks while they run. Defaults to True.
+
+        """
         self.max_workers = max_workers if max_workers else multiprocessing.cpu_count()
+        self.memory_mb = memory_mb or available_memory_mb()
         self.results = Results(name)
-        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
-        self.processes = []
+        self.fail_fast = fail_fast
+        self.progress = progress
+        self.cancelling = False
+        self.cancelled: list[Task] = []
+        self.jobserver = None
+        if jobserver:
+            self._start_jobserver()
+        self.executor: concurrent.futures.ProcessPoolExecutor | None = None
+        self.thread_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        self.tasks: list[Task] = []
+        self.pending: list[Task] = []
+        self.running: dict[concurrent.futures.Future, Task] = {}
+        self.children = ChildProcesses()
         self.start_time = time.perf_counter()
 
+    def _start_jobserver(self) -> None:
+        """Create a named pipe jobserver, and advertise it to child processes through `MAKEFLAGS`.
+
+        Every client holds one implicit token, so the pipe holds one less than the slot budget.
+        """
+        fifo = Path(tempfile.mkdtemp(prefix="jobserver-")) / "fifo"
+        os.mkfifo(fifo)
+        # Opening read/write keeps the tokens alive and never blocks.
+        fd = os.open(fifo, os.O_RDWR)
+        os.write(fd, b"+" * (self.max_workers - 1))
+        self.jobserver = (fifo, fd, os.environ.get("MAKEFLAGS"))
+        os.environ["MAKEFLAGS"] = f"-j{self.max_workers} --jobserver-auth=fifo:{fifo}"
+
+    def _stop_jobserver(self) -> None:
+        """Remove the jobserver, and restore the original `MAKEFLAGS`."""
+        fifo, fd, makeflags = self.jobserver
+        if makeflags is None:
+            os.environ.pop("MAKEFLAGS", None)
+        else:
+            os.environ["MAKEFLAGS"] = makeflags
+        os.close(fd)
+        fifo.unlink(missing_ok=True)
+        fifo.parent.rmdir()
+        self.jobserver = None
+
     def __enter__(self) -> Self:
         """Enter."""
         return self
@@ -305,34 +1594,177 @@ class ParallelRunner:
         exc_tb: types.TracebackType | None,
     ) -> None:
         """Exit."""
+        # If we are leaving because of an error, don't leave commands running behind us.
+        if exc_type is not None:
+            self.cancel()
+
         # Stop the multiprocessing pool when done.
-        self.executor.shutdown()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=exc_type is not None)
+        self.thread_executor.shutdown(cancel_futures=exc_type is not None)
+        if self.jobserver is not None:
+            self._stop_jobserver()
+
+    def schedule(self, task: Task) -> Task:
+        """Schedule a task, it starts as soon as its dependencies allow.
 
-    def run(self, func: callable, *args: tuple, **kwargs: dict[str, Any]) -> None:
+        Returns the task, so it can be used in the `after` list of other tasks.
+        """
+        task.queued = time.perf_counter()
+        task.children = self.children
+        self.tasks.append(task)
+        if self.cancelling:
+            task.skipped = True
+            self.cancelled.append(task)
+            return task
+        self.pending.append(task)
+        self._dispatch()
+        return task
+
+    def run(self, func: callable, *args: tuple, **kwargs: dict[str, Any]) -> Task:
         """Run tasks in parallel."""
-        self.processes.append(self.executor.submit(func, *args, **kwargs))
+        return self.schedule(Task(func, args, kwargs))
 
-    def get_results(self) -> Results:
-        """Calculate the execution time of each process in self.processes and add the results to the Results object.
+    def run_after(self, after: list[Task | None], func: callable, *args: tuple, **kwargs: dict[str, Any]) -> Task:
+        """Run a task in parallel, once all the tasks in `after` have finished successfully.
 
-        As execution time overlaps, the recalculated execution time is based on
-        when tasks complete vs how long they ran internally.
+        `None` entries in `after` are ignored, to simplify optional steps.
+        """
+        return self.schedule(Task(func, args, kwargs, after=[task for task in after if task is not None]))
 
-        Returns a Results object.
+    def cancel(self) -> None:
+        """Cancel all queued tasks, and terminate the commands of running tasks.
+
+        Only the commands of this runner are terminated, not those of any other runner in the process.
+
+        Running tasks still produce a result, the commands fail because they were terminated.
+        Tasks in the process pool which already started run to completion.
         """
-        start_time = self.start_time
-        for complete in concurrent.futures.as_completed(self.processes):
-            res = complete.result()
-            end_time = time.perf_counter()
-            execution_time = end_time - start_time
-            start_time = end_time
-            if isinstance(res, list):
-                for r in res:
-                    r.runtime = execution_time
-                    execution_time = 0.0
+        self.cancelling = True
+        cancelled = self.pending
+        self.pending = []
+        for future, task in list(self.running.items()):
+            if future.cancel():
+                del self.running[future]
+                cancelled.append(task)
+
+        for task in cancelled:
+            task.skipped = True
+        self.cancelled.extend(cancelled)
+
+        self.children.terminate()
+
+    def _submit(self, task: Task) -> concurrent.futures.Future:
+        """Submit a task to the executor which suits it."""
+        task.started = time.perf_counter()
+        if getattr(task.func, "subprocess_bound", False):
+            return self.thread_executor.submit(run_task, task)
+
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.executor.submit(task.func, *task.args, **task.kwargs)
+
+    def _fits(self, task: Task, slots: int, memory_mb: int) -> bool:
+        """Check if a task fits in the budget, given the slots and memory already in use."""
+        if not self.running:
+            # Always admit something, or an oversized task would never run.
+            return True
+        return slots + task.slots <= self.max_workers and memory_mb + task.memory_mb <= self.memory_mb
+
+    def _dispatch(self) -> None:
+        """Submit every pending task whose dependencies and resources are available."""
+        busy_tags = set().union(*(task.tags for task in self.running.values()))
+        slots = sum(task.slots for task in self.running.values())
+        memory_mb = sum(task.memory_mb for task in self.running.values())
+        waiting = []
+        for task in self.pending:
+            if not task.always and any(dep.skipped or (dep.done() and not dep.ok()) for dep in task.after):
+                # A dependency failed, so this task can never run.
+                task.skipped = True
+            elif (
+                all(dep.done() for dep in task.after)
+                and not task.tags & busy_tags
+                and self._fits(task, slots, memory_mb)
+            ):
+                self.running[self._submit(task)] = task
+                busy_tags |= task.tags
+                slots += task.slots
+                memory_mb += task.memory_mb
             else:
-                res.runtime = execution_time
+                waiting.append(task)
+        self.pending = waiting
+
+    def _skipped_result(self, task: Task) -> Result:
+        """Make the failed result of a task which never ran, saying why."""
+        failed = [dep.name() for dep in task.after if not dep.ok()]
+        if task in self.cancelled or not failed:
+            reason = "Cancelled, because another step failed"
+        else:
+            reason = f"Skipped, because {', '.join(failed)} failed"
+        return Result(1, "skipped", reason, 0.0, task.name())
+
+    def _critical_path(self) -> list[Result]:
+        """Find the chain of dependent tasks with the longest total runtime.
 
-            self.results.add(res)
+        No schedule can finish faster than this chain, whatever the number of workers.
+        """
+        longest: dict[int, tuple[float, list[Task]]] = {}
+        # Dependencies are always scheduled before the tasks that depend on them.
+        for task in self.tasks:
+            if task.result is None:
+                continue
+            runtime, chain = max(
+                (longest[id(dep)] for dep in task.after if id(dep) in longest),
+                key=lambda path: path[0],
+                default=(0.0, []),
+            )
+            longest[id(task)] = (runtime + sum(res.runtime for res in task.results()), [*chain, task])
+
+        if not longest:
+            return []
+        _, chain = max(longest.values(), key=lambda path: path[0])
+        return [res for task in chain for res in task.results()]
+
+    def get_results(self) -> Results:
+        """Wait for all scheduled tasks to finish and add their results to the Results object.
+
+        Each result keeps the runtime it measured itself.  The time each task waited
+        between being ready to run and starting is recorded as its `queue_wait`, and the
+        critical path through the tasks is recorded on the Results object.
+        Tasks skipped because a dependency failed, or cancelled by `fail_fast`, get a failed result
+        saying why, so every scheduled step is in the report.
+
+        Returns a Results object.
+        """
+        with LiveStatus(self) if self.progress else contextlib.nullcontext():
+            while self.running:
+                completed, _ = concurrent.futures.wait(self.running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for complete in completed:
+                    task = self.running.pop(complete)
+                    task.result = complete.result()
+                    results = task.results()
+                    if results and results[0].start is not None:
+                        # A task is only waiting in the queue once all its dependencies are done.
+                        ready = max(
+                            [task.queued, *(res.end for dep in task.after for res in dep.results() if res.end)],
+                        )
+                        results[0].queue_wait = max(0.0, results[0].start - ready)
+
+                    self.results.add(task.result)
+
+                    if self.fail_fast and not task.ok() and not self.cancelling:
+                        print("[bold red]A step failed, cancelling the remaining steps.[/bold red]")
+                        self.cancel()
+
+                self._dispatch()
+
+        if self.cancelled:
+            print(f"[yellow]{len(self.cancelled)} steps were cancelled before they started.[/yellow]")
+        for task in self.tasks:
+            if task.skipped and task.result is None:
+                self.results.add(self._skipped_result(task))
+
+        self.results.slots = self.max_workers
+        self.results.critical_path = self._critical_path()
 
         return self.results
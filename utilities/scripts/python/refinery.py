@@ -0,0 +1,202 @@
+"""Refinery Migrations.
+
+Reads migrations the same way the `refinery` CLI does, so they can be applied
+in-process while staying compatible with its schema history table.
+"""
+
+# cspell: words siphash refinery rotl
+
+import datetime as dt
+import re
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Self
+
+# The table refinery records applied migrations in.
+HISTORY_TABLE = "refinery_schema_history"
+
+CREATE_HISTORY_TABLE = f"""CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+    version INT4 PRIMARY KEY,
+    name VARCHAR(255),
+    applied_on VARCHAR(255),
+    checksum VARCHAR(255)
+)"""
+
+# Migration file names: `V1__create_table.sql` for versioned, `U2__seed.sql` for unversioned.
+MIGRATION_PATTERN = re.compile(r"^([UV])(\d+)__(\w+)$")
+
+# A line marking a migration to be run outside of a transaction, like `CREATE INDEX CONCURRENTLY` needs.
+NO_TRANSACTION = re.compile(r"^-{2,}\s?refinery:noTransaction$", re.MULTILINE)
+
+MASK_64 = (1 << 64) - 1
+
+
+def _rotl(value: int, bits: int) -> int:
+    return ((value << bits) | (value >> (64 - bits))) & MASK_64
+
+
+def siphash13(data: bytes, k0: int = 0, k1: int = 0) -> int:
+    """Compute the SipHash-1-3 of some data, as used by refinery for migration checksums.
+
+    Args:
+        data (bytes): The data to hash.
+        k0 (int, optional): The first half of the key. Defaults to 0.
+        k1 (int, optional): The second half of the key. Defaults to 0.
+
+    Returns:
+        int: The 64 bit hash.
+
+    """
+    v0 = k0 ^ 0x736F6D6570736575
+    v1 = k1 ^ 0x646F72616E646F6D
+    v2 = k0 ^ 0x6C7967656E657261
+    v3 = k1 ^ 0x7465646279746573
+
+    def sip_round() -> None:
+        nonlocal v0, v1, v2, v3
+        v0 = (v0 + v1) & MASK_64
+        v1 = _rotl(v1, 13) ^ v0
+        v0 = _rotl(v0, 32)
+        v2 = (v2 + v3) & MASK_64
+        v3 = _rotl(v3, 16) ^ v2
+        v0 = (v0 + v3) & MASK_64
+        v3 = _rotl(v3, 21) ^ v0
+        v2 = (v2 + v1) & MASK_64
+        v1 = _rotl(v1, 17) ^ v2
+        v2 = _rotl(v2, 32)
+
+    tail = len(data) % 8
+    for (block,) in struct.iter_unpack("<Q", data[: len(data) - tail]):
+        v3 ^= block
+        sip_round()
+        v0 ^= block
+
+    last = int.from_bytes(data[len(data) - tail :], "little") | ((len(data) & 0xFF) << 56)
+    v3 ^= last
+    sip_round()
+    v0 ^= last
+
+    v2 ^= 0xFF
+    for _ in range(3):
+        sip_round()
+    return v0 ^ v1 ^ v2 ^ v3
+
+
+@dataclass
+class Migration:
+    """A migration file.
+
+    Attributes:
+        prefix: `V` for versioned, `U` for unversioned migrations.
+        version: The version of the migration.
+        name: The name of the migration.
+        path: The file it was read from.
+        sql: The SQL of the migration.
+
+    """
+
+    prefix: str
+    version: int
+    name: str
+    path: Path
+    sql: str
+
+    @classmethod
+    def from_file(cls, path: Path) -> Self | None:
+        """Read a migration from a file.
+
+        :return: The migration, or None if the file name is not a migration name.
+        :rtype: Migration | None
+        """
+        match = MIGRATION_PATTERN.match(path.stem)
+        if path.suffix != ".sql" or match is None:
+            return None
+        return cls(match.group(1), int(match.group(2)), match.group(3), path, path.read_text())
+
+    def label(self) -> str:
+        """Return the name of the migration, as its file is named."""
+        return f"{self.prefix}{self.version}__{self.name}"
+
+    def no_transaction(self) -> bool:
+        """Check if the migration is marked with `-- refinery:noTransaction`.
+
+        :return: True if it must not be run in a transaction.
+        :rtype: bool
+        """
+        return NO_TRANSACTION.search(self.sql) is not None
+
+    def checksum(self) -> str:
+        """Compute the checksum refinery records for the migration.
+
+        Refinery hashes the name, version and SQL with the Rust `Hash` trait,
+        strings are their bytes followed by `0xff` and the version is an `i32`.
+
+        :return: The checksum, as refinery stores it.
+        :rtype: str
+        """
+        data = self.name.encode() + b"\xff" + struct.pack("<i", self.version) + self.sql.encode() + b"\xff"
+        return str(siphash13(data))
+
+
+def find_migrations(directory: str) -> list[Migration]:
+    """Find all migrations in a directory and its subdirectories, ordered by version.
+
+    Args:
+        directory (str): The migrations directory.
+
+    Returns:
+        list[Migration]: The migrations.
+
+    Raises:
+        ValueError: If two migrations have the same version.
+
+    """
+    migrations = {}
+    for path in sorted(Path(directory).rglob("*.sql")):
+        migration = Migration.from_file(path)
+        if migration is None:
+            continue
+        if migration.version in migrations:
+            msg = f"{path} has the same version as {migrations[migration.version].path}"
+            raise ValueError(msg)
+        migrations[migration.version] = migration
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def check_applied(migrations: list[Migration], applied: dict[int, str]) -> None:
+    """Check the applied migrations still match the migration files, like refinery does.
+
+    Versioned migrations must be applied in order, so one which is not applied yet
+    can't have a lower version than the last applied migration.  Unversioned ones can.
+
+    Args:
+        migrations (list[Migration]): The migration files.
+        applied (dict[int, str]): The checksums of the applied migrations, by version.
+
+    Raises:
+        ValueError: If an applied migration was changed, or is missing, or a versioned
+            migration was added before the last applied one.
+
+    """
+    by_version = {migration.version: migration for migration in migrations}
+    for version, checksum in sorted(applied.items()):
+        if version not in by_version:
+            msg = f"Migration version {version} was applied, but its file is missing"
+            raise ValueError(msg)
+        if by_version[version].checksum() != checksum:
+            msg = f"Migration {by_version[version].label()} was changed after it was applied"
+            raise ValueError(msg)
+
+    if not applied:
+        return
+    last = max(applied)
+    for migration in migrations:
+        if migration.prefix == "V" and migration.version not in applied and migration.version < last:
+            msg = f"Migration {migration.label()} was not applied, but the later version {last} was"
+            raise ValueError(msg)
+
+
+def applied_on() -> str:
+    """Return the current time, formatted like refinery records when a migration was applied."""
+    return dt.datetime.now(dt.UTC).isoformat().replace("+00:00", "Z")
@@ -0,0 +1,252 @@
+"""SQL Scripts.
+
+Splits SQL scripts into statements the way `psql` does, so they can be run
+one at a time over a connection, with the same variable interpolation.
+"""
+
+# cspell: words psql stdin
+
+import re
+from dataclasses import dataclass
+
+# A psql variable name.
+VARIABLE_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# The tag of a dollar quoted string, like `$$` or `$body$`.
+DOLLAR_TAG = re.compile(r"\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$")
+# A string literal, those prefixed with E allow backslash escapes.
+STRING = r"(?<=(?<!\w)[eE])'[^'\\]*(?:(?:\\.|'')[^'\\]*)*'|'[^']*(?:''[^']*)*'"
+STRINGS = re.compile(STRING)
+# A run of string literals and characters with no special meaning, scanned in one go.
+RUN = re.compile(rf"(?:[^'\"$:\\;/-]+|{STRING}|/(?!\*)|-(?!-))+")
+# A `COPY ... FROM STDIN` statement, its data follows it in the script.
+COPY_FROM_STDIN = re.compile(r"^\s*COPY\b.*\bFROM\s+STDIN\b", re.IGNORECASE | re.DOTALL)
+
+
+@dataclass
+class Statement:
+    """A SQL statement of a script.
+
+    Attributes:
+        sql: The statement, with variables interpolated.
+        line: The line of the script it starts on.
+        copy_data: The data of a `COPY ... FROM STDIN` statement, None for other statements.
+
+    """
+
+    sql: str
+    line: int
+    copy_data: str | None = None
+
+    def summary(self, width: int = 60) -> str:
+        """Summarize the statement in a single line.
+
+        :return: The statement with whitespace collapsed, shortened to `width` characters.
+        :rtype: str
+        """
+        text = " ".join(self.sql.split())
+        return text if len(text) <= width else text[: width - 3] + "..."
+
+
+@dataclass
+class MetaCommand:
+    r"""A psql meta-command of a script, like `\echo`.
+
+    Attributes:
+        command: The command, without the backslash.
+        args: The arguments, with variables interpolated and quotes removed.
+        line: The line of the script it is on.
+
+    """
+
+    command: str
+    args: list[str]
+    line: int
+
+
+def quote_literal(value: str) -> str:
+    """Quote a value as a SQL string literal, like psql does for `:'name'`."""
+    if "\\" in value:
+        return "E'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+    return "'" + value.replace("'", "''") + "'"
+
+
+def quote_ident(value: str) -> str:
+    """Quote a value as a SQL identifier, like psql does for `:"name"`."""
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _interpolate(text: str, pos: int, variables: dict[str, str]) -> tuple[str, int] | None:
+    """Interpolate the variable reference starting with the `:` at `pos`.
+
+    Returns:
+        tuple[str, int] | None: The replacement text and the position after the reference,
+            or None if it is not a reference to a known variable.
+
+    """
+    quote = text[pos + 1 : pos + 2]
+    if quote in ("'", '"'):
+        match = VARIABLE_NAME.match(text, pos + 2)
+        if match is None or text[match.end() : match.end() + 1] != quote or match.group() not in variables:
+            return None
+        value = variables[match.group()]
+        return (quote_literal(value) if quote == "'" else quote_ident(value)), match.end() + 1
+
+    match = VARIABLE_NAME.match(text, pos + 1)
+    if match is None or match.group() not in variables:
+        return None
+    return variables[match.group()], match.end()
+
+
+def _meta_command(text: str, line: int, variables: dict[str, str]) -> MetaCommand:
+    """Parse a meta-command line, from just after the backslash."""
+    args = []
+    for word in re.findall(r"'(?:[^']|'')*'|\S+", text):
+        if word.startswith("'"):
+            args.append(word[1:-1].replace("''", "'"))
+        elif word.startswith(":") and (value := _interpolate(word, 0, variables)) is not None:
+            args.append(value[0] + word[value[1] :])
+        else:
+            args.append(word)
+    return MetaCommand(args[0] if args else "", args[1:], line)
+
+
+def parse(script: str, variables: dict[str, str] | None = None) -> list[Statement | MetaCommand]:  # noqa: C901, PLR0912, PLR0915
+    r"""Split a SQL script into statements and meta-commands, like psql.
+
+    Comments, quoted strings, quoted identifiers and dollar quoted strings are respected.
+    `:name`, `:'name'` and `:"name"` are replaced by the value of known variables,
+    as a raw value, a string literal or an identifier.
+    The data of `COPY ... FROM STDIN` statements, up to the `\.` line, is kept with them.
+
+    Plain text and string literals are scanned with a single regular expression,
+    so large seed data scripts split quickly.
+
+    Args:
+        script (str): The SQL script.
+        variables (dict[str, str] | None, optional): The psql variables. Defaults to None.
+
+    Returns:
+        list[Statement | MetaCommand]: The statements and meta-commands, in order.
+
+    Raises:
+        ValueError: If the script ends inside a quoted string or comment.
+
+    """
+    variables = variables or {}
+    commands = []
+    buf = []
+    has_code = False
+    start_line = line = 1
+    depth = 0
+    pos = 0
+    end = len(script)
+
+    def take(stop: int) -> None:
+        """Add the script up to `stop` to the current statement."""
+        nonlocal pos, line
+        if stop < 0:
+            msg = f"Unterminated quote or comment starting on line {line}"
+            raise ValueError(msg)
+        buf.append(script[pos:stop])
+        line += script.count("\n", pos, stop)
+        pos = stop
+
+    def begin() -> None:
+        """Start a statement, dropping the whitespace and comments before it."""
+        nonlocal has_code, start_line, buf
+        has_code = True
+        start_line = line
+        buf = []
+
+    while pos < end:
+        run = RUN.match(script, pos)
+        if run is not None:
+            text = run.group()
+            if not has_code:
+                code = text.lstrip()
+                if not code:
+                    take(run.end())
+                    continue
+                take(run.end() - len(code))
+                begin()
+            if "(" in text or ")" in text:
+                code = STRINGS.sub("", text)
+                depth += code.count("(") - code.count(")")
+            take(run.end())
+            continue
+
+        char = script[pos]
+        pair = script[pos : pos + 2]
+        if not has_code and pair not in ("--", "/*") and char not in "\\;":
+            begin()
+
+        if pair == "--":
+            newline = script.find("\n", pos)
+            take(end if newline < 0 else newline)
+        elif pair == "/*":
+            nesting = 0
+            scan = pos
+            while True:
+                opening = script.find("/*", scan)
+                closing = script.find("*/", scan)
+                if closing < 0:
+                    take(-1)
+                if 0 <= opening < closing:
+                    nesting += 1
+                    scan = opening + 2
+                else:
+                    nesting -= 1
+                    scan = closing + 2
+                    if nesting == 0:
+                        break
+            take(scan)
+        elif char == "'":
+            # Any complete string literal is part of a run.
+            take(-1)
+        elif char == '"':
+            scan = pos + 1
+            while True:
+                closing = script.find('"', scan)
+                if closing < 0:
+                    take(-1)
+                if script[closing + 1 : closing + 2] != '"':
+                    break
+                scan = closing + 2
+            take(closing + 1)
+        elif char == "$" and (match := DOLLAR_TAG.match(script, pos)) and not (pos and script[pos - 1].isalnum()):
+            closing = script.find(match.group(), match.end())
+            take(-1 if closing < 0 else closing + len(match.group()))
+        elif pair == "::":
+            take(pos + 2)
+        elif char == ":" and (value := _interpolate(script, pos, variables)) is not None:
+            buf.append(value[0])
+            pos = value[1]
+        elif char == "\\":
+            newline = script.find("\n", pos)
+            newline = end if newline < 0 else newline
+            commands.append(_meta_command(script[pos + 1 : newline], line, variables))
+            pos = newline
+        elif char == ";" and depth == 0:
+            pos += 1
+            statement = Statement("".join(buf).strip(), start_line)
+            if has_code and COPY_FROM_STDIN.match(statement.sql):
+                # The data starts on the next line, and ends with a `\.` line.
+                data_start = script.find("\n", pos)
+                data_start = end if data_start < 0 else data_start + 1
+                data_end = script.find("\n\\.", data_start - 1)
+                data_end = end if data_end < 0 else data_end + 1
+                statement.copy_data = script[data_start:data_end]
+                line += script.count("\n", pos, data_end)
+                pos = script.find("\n", data_end)
+                pos = end if pos < 0 else pos
+            if has_code:
+                commands.append(statement)
+            buf = []
+            has_code = False
+        else:
+            take(pos + 1)
+
+    if has_code:
+        commands.append(Statement("".join(buf).strip(), start_line))
+
+    return commands
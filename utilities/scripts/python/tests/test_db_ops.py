@@ -0,0 +1,157 @@
+"""Test the Postgres Database Operations which do not need a server."""
+
+import argparse
+import itertools
+import socket
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from python import db_ops
+
+# An `AuthenticationOk` message, what a server accepting connections answers first.
+AUTHENTICATION_OK = b"R\0\0\0\x08\0\0\0\0"
+
+
+def database(**args: str) -> db_ops.DBOps:
+    """Make a `DBOps` from its command line arguments."""
+    parser = argparse.ArgumentParser()
+    db_ops.add_args(parser)
+    return db_ops.DBOps(parser.parse_args([f"--{name}={value}" for name, value in args.items()]))
+
+
+class WaitReadyTest(unittest.TestCase):
+    """Waiting for a server, given the status in its `postmaster.pid`."""
+
+    def setUp(self) -> None:
+        """Start a fake server which accepts every connection."""
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(self.listener.close)
+        threading.Thread(target=self.accept, daemon=True).start()
+        data = tempfile.TemporaryDirectory()
+        self.addCleanup(data.cleanup)
+        self.dbpath = Path(data.name)
+
+    def accept(self) -> None:
+        """Answer every startup message as if the login succeeded."""
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            with conn:
+                conn.recv(1024)
+                conn.sendall(AUTHENTICATION_OK)
+
+    def wait(self, status: str) -> db_ops.exec_manager.Result:
+        """Wait for the fake server, while its `postmaster.pid` reports `status`."""
+        (self.dbpath / "postmaster.pid").write_text("\n".join(["1", str(self.dbpath), "0", "0", "", "", "0", status]))
+        port = self.listener.getsockname()[1]
+        return database(dbhost="127.0.0.1", dbport=str(port), dbpath=str(self.dbpath)).wait_ready(timeout=5)
+
+    def test_ready(self) -> None:
+        """A ready server is probed straight away."""
+        result = self.wait("ready")
+
+        self.assertEqual(result.rc, db_ops.PROBE_ACCEPTING)
+        self.assertLess(result.runtime, db_ops.READY_PROBE_FALLBACK)
+
+    def test_standby(self) -> None:
+        """A hot standby accepts connections, so it is probed like a ready server."""
+        result = self.wait("standby")
+
+        self.assertEqual(result.rc, db_ops.PROBE_ACCEPTING)
+        self.assertLess(result.runtime, db_ops.READY_PROBE_FALLBACK)
+
+    def test_stale_starting(self) -> None:
+        """A server is still found if its `postmaster.pid` claims it is starting forever."""
+        result = self.wait("starting")
+
+        self.assertEqual(result.rc, db_ops.PROBE_ACCEPTING)
+
+
+class SeedOrderTest(unittest.TestCase):
+    """Seed data files are loaded after the files loading the tables theirs reference."""
+
+    # The oids of the tables, `event` <- `objective` <- `proposal` <- `review`.
+    OIDS = {"event": 1, "objective": 2, "proposal": 3, "review": 4, "voter": 5, "staging": None}  # noqa: RUF012
+    REFERENCES = {2: {1}, 3: {2}, 4: {3}}  # noqa: RUF012
+
+    def order(self, *files: tuple[str, list[str]]) -> list[tuple[str, list[str]]]:
+        """Order seed files, given by name and the tables they load, returning each with the files it waits for."""
+        seeds = [db_ops.SeedFile(Path(name), tables) for name, tables in files]
+        plan = db_ops.seed_order(seeds, self.OIDS, self.REFERENCES)
+        return [(seed.path.name, [plan[dep][0].path.name for dep in after]) for seed, after in plan]
+
+    def assert_loads_in_order(self, plan: list[tuple[str, list[str]]], *names: str) -> None:
+        """Check files are loaded in order, each waiting for the one before it, directly or not."""
+        position = {name: index for index, (name, _) in enumerate(plan)}
+        waits = {name: set(after) for name, after in plan}
+        for earlier, later in itertools.pairwise(names):
+            self.assertLess(position[earlier], position[later])
+            reachable = set(waits[later])
+            while (
+                not reachable >= waits.keys()
+                and (more := set().union(*(waits[name] for name in reachable))) - reachable
+            ):
+                reachable |= more
+            self.assertIn(earlier, reachable, f"{later} does not wait for {earlier}")
+
+    def test_foreign_key_chain(self) -> None:
+        """A chain of foreign keys is loaded from the referenced end, whatever the file names."""
+        plan = self.order(
+            ("1_review.csv", ["review"]),
+            ("2_proposal.sql", ["proposal"]),
+            ("3_objective.sql", ["objective"]),
+            ("4_event.sql", ["event"]),
+            ("5_voter.sql", ["voter"]),
+        )
+
+        self.assertEqual(
+            plan,
+            [
+                ("4_event.sql", []),
+                ("5_voter.sql", []),
+                ("3_objective.sql", ["4_event.sql"]),
+                ("2_proposal.sql", ["3_objective.sql"]),
+                ("1_review.csv", ["2_proposal.sql"]),
+            ],
+        )
+
+    def test_same_table(self) -> None:
+        """Files loading the same table are loaded in name order."""
+        plan = self.order(("1_event.sql", ["event"]), ("2_event.csv", ["event"]), ("3_voter.sql", ["voter"]))
+
+        self.assertEqual(plan, [("1_event.sql", []), ("3_voter.sql", []), ("2_event.csv", ["1_event.sql"])])
+
+    def test_chain_through_unknown_table(self) -> None:
+        """A table loaded by a file which is loaded last still comes before the tables referencing it."""
+        plan = self.order(
+            ("1_review.sql", ["review"]),
+            ("2_proposal.sql", ["proposal"]),
+            ("3_objective.sql", ["objective", "staging"]),
+            ("4_event.sql", ["event"]),
+            ("5_voter.sql", ["voter"]),
+        )
+
+        self.assert_loads_in_order(plan, "4_event.sql", "3_objective.sql", "2_proposal.sql", "1_review.sql")
+        self.assert_loads_in_order(plan, "5_voter.sql", "3_objective.sql")
+
+    def test_cycle(self) -> None:
+        """Files in a cycle of references are loaded one after the other, before the files depending on them."""
+        references = {1: {3}, 3: {1}, 4: {3}}
+        seeds = [
+            db_ops.SeedFile(Path(name), [table])
+            for name, table in (("1_review.sql", "review"), ("2_event.sql", "event"), ("3_proposal.sql", "proposal"))
+        ]
+        plan = db_ops.seed_order(seeds, self.OIDS, references)
+
+        self.assertEqual(
+            [(seed.path.name, after) for seed, after in plan],
+            [("2_event.sql", []), ("3_proposal.sql", [0]), ("1_review.sql", [1])],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Test loading seed data into a throwaway Postgres server."""
+
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from pathlib import Path
+
+from python import db_ops, exec_manager
+
+# A table with unique indexes, one of them on an expression and partial, and a secondary index.
+# The seed data upserts against the unique indexes.
+SCHEMA = """CREATE TABLE item (id int PRIMARY KEY, code text NOT NULL, n int NOT NULL);
+CREATE UNIQUE INDEX item_code ON item (code);
+CREATE UNIQUE INDEX item_lower_code ON item (lower(code)) WHERE n > 0;
+CREATE INDEX item_n ON item (n);
+"""
+UPSERT = """INSERT INTO item VALUES (1, 'a', 1);
+INSERT INTO item VALUES (2, 'a', 2) ON CONFLICT (code) DO UPDATE SET n = excluded.n;
+INSERT INTO item VALUES (3, 'B', 3) ON CONFLICT (lower(code)) WHERE n > 0 DO NOTHING;
+INSERT INTO item VALUES (4, 'b', 4) ON CONFLICT (lower(code)) WHERE n > 0 DO NOTHING;
+"""
+
+
+def free_port() -> int:
+    """Find a TCP port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@unittest.skipUnless(shutil.which("initdb") and shutil.which("pg_ctl"), "needs the Postgres server binaries")
+@unittest.skipIf(os.geteuid() == 0, "Postgres refuses to run as root")
+class SeedDatabaseTest(unittest.TestCase):
+    """Seed data is loaded while the secondary indexes of its tables are dropped."""
+
+    def setUp(self) -> None:
+        """Start a server with a database holding the `item` table."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = Path(directory.name)
+        data = self.dir / "data"
+        port = free_port()
+        initdb = exec_manager.cli_run(f'initdb -D "{data}" -U admin -A trust --no-sync', log=False)
+        self.assertTrue(initdb.ok(), initdb.out)
+        server = f"-p {port} -k '{self.dir}' -c fsync=off"
+        start = exec_manager.cli_run(f'pg_ctl -D "{data}" -l "{self.dir}/log" -w start -o "{server}"', log=False)
+        self.assertTrue(start.ok(), start.out)
+        self.addCleanup(exec_manager.cli_run, f'pg_ctl -D "{data}" -m immediate stop', log=False)
+
+        (self.dir / "seed" / "upsert").mkdir(parents=True)
+        (self.dir / "seed" / "upsert" / "1_item.sql").write_text(UPSERT)
+        parser = argparse.ArgumentParser()
+        db_ops.add_args(parser)
+        args = {
+            "dbhost": "127.0.0.1",
+            "dbport": port,
+            "dbname": "seed",
+            "dbuser": "admin",
+            "dbsuperuser": "admin",
+            "dbinprocess": "true",
+            "dbseeddatasrc": self.dir / "seed",
+            "with_seed_data": "upsert",
+        }
+        self.db = db_ops.DBOps(parser.parse_args([f"--{name}={value}" for name, value in args.items()]))
+        self.addCleanup(self.db.close)
+        self.assertTrue(self.db.run_sql("CREATE DATABASE seed", "Create Database", role="superuser").ok())
+        self.assertTrue(self.db.run_sql(SCHEMA, "Create Schema").ok())
+
+    def test_upsert_against_unique_index(self) -> None:
+        """Unique indexes are kept for `ON CONFLICT`, the other indexes are dropped and recreated."""
+        results = self.db.seed_database()
+
+        self.assertTrue(all(result.ok() for result in results), [result.out for result in results])
+        deferred = next(result for result in results if result.name == "Defer Indexes and Constraints")
+        self.assertEqual(deferred.out, "Dropped index item_n")
+        conn = self.db.connection()
+        self.assertEqual(
+            conn.execute("SELECT id, code, n FROM item ORDER BY id").fetchall(), [(1, "a", 2), (3, "B", 3)]
+        )
+        self.assertEqual(
+            conn.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'item' ORDER BY 1").fetchall(),
+            [("item_code",), ("item_lower_code",), ("item_n",), ("item_pkey",)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
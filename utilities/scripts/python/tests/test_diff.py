@@ -0,0 +1,113 @@
+"""Test diffing config trees, and finding the differences by their JSON-Pointer path."""
+
+import unittest
+
+from python.diff import LIST_END, Diff, DiffEntry
+
+
+def added(val: object) -> DiffEntry:
+    """Make an entry which is missing from the provided tree."""
+    return DiffEntry(val, add_or_remove_flag=True)
+
+
+def removed(val: object) -> DiffEntry:
+    """Make an entry which should not be in the provided tree."""
+    return DiffEntry(val, add_or_remove_flag=False)
+
+
+class ListDiffTest(unittest.TestCase):
+    """Arrays are diffed element by element, by the index of the elements in the provided array."""
+
+    def assert_diff(self, expected: list, provided: list, diff: dict) -> None:
+        """Check the diff of two arrays, and that `equal` agrees with it."""
+        differ = Diff({"list": expected}, {"list": provided}, strict=False)
+        self.assertEqual(differ.get_diff().diff, {"list": diff} if diff else {})
+        self.assertEqual(differ.equal(), not diff)
+
+    def test_same(self) -> None:
+        """Equal arrays have no diff."""
+        self.assert_diff(["a", "b"], ["a", "b"], {})
+
+    def test_insert(self) -> None:
+        """A missing element is added at the index it would be inserted at."""
+        self.assert_diff(["a", "b", "c", "d"], ["a", "c", "d"], {1: added("b")})
+
+    def test_extra(self) -> None:
+        """An extra element is removed at its index, even though the diff is not strict."""
+        self.assert_diff(["a", "c"], ["a", "b", "c"], {1: removed("b")})
+
+    def test_reorder(self) -> None:
+        """A moved element is removed where it is, and added where it should be."""
+        self.assert_diff([1, 2, 3], [3, 1, 2], {0: removed(3), 3: added(3)})
+
+    def test_replace(self) -> None:
+        """Replaced elements are compared, listing what is provided first."""
+        self.assert_diff(["a", {"x": 1}], ["a", {"x": 2, "y": 3}], {1: {"x": (removed(2), added(1)), "y": removed(3)}})
+
+
+class KeyedListDiffTest(unittest.TestCase):
+    """Arrays of tables with a key, like `[[bin]] name`, are matched up by the key."""
+
+    EXPECTED = {"bin": [{"name": "a", "v": 1}, {"name": "b"}, {"name": "d"}]}  # noqa: RUF012
+    PROVIDED = {"bin": [{"name": "b"}, {"name": "a", "v": 2}, {"name": "c"}]}  # noqa: RUF012
+
+    def test_reorder(self) -> None:
+        """Tables in another order are the same."""
+        differ = Diff({"bin": [{"name": "a"}, {"name": "b"}]}, {"bin": [{"name": "b"}, {"name": "a"}]}, strict=True)
+        self.assertEqual(differ.get_diff().diff, {})
+        self.assertTrue(differ.equal())
+
+    def test_matching(self) -> None:
+        """Tables are diffed with the table of the same key, missing tables are added at the end."""
+        differ = Diff(self.EXPECTED, self.PROVIDED, strict=False)
+
+        self.assertEqual(
+            differ.get_diff().diff,
+            {"bin": {1: {"v": (removed(2), added(1))}, 2: removed({"name": "c"}), LIST_END: added({"name": "d"})}},
+        )
+        self.assertFalse(differ.equal())
+
+    def test_duplicate_keys(self) -> None:
+        """Tables are lined up by position when the key doesn't tell them apart."""
+        differ = Diff({"bin": [{"name": "a", "v": 1}]}, {"bin": [{"name": "a"}, {"name": "a", "v": 1}]}, strict=False)
+        self.assertEqual(differ.get_diff().diff, {"bin": {0: removed({"name": "a"})}})
+
+
+class PointerTest(unittest.TestCase):
+    """Differences are found by their JSON-Pointer path."""
+
+    def test_entries(self) -> None:
+        """Every entry is listed with its path, array elements by their index."""
+        result = Diff(KeyedListDiffTest.EXPECTED, KeyedListDiffTest.PROVIDED, strict=False).get_diff()
+
+        self.assertEqual(
+            list(result.entries()),
+            [
+                ("/bin/1/v", removed(2)),
+                ("/bin/1/v", added(1)),
+                ("/bin/2", removed({"name": "c"})),
+                ("/bin/-", added({"name": "d"})),
+            ],
+        )
+
+    def test_get(self) -> None:
+        """The differences at a path are returned, None if there are none there."""
+        result = Diff(KeyedListDiffTest.EXPECTED, KeyedListDiffTest.PROVIDED, strict=False).get_diff()
+
+        self.assertEqual(result.get("/bin/1/v"), (removed(2), added(1)))
+        self.assertEqual(result.get("/bin/-"), added({"name": "d"}))
+        self.assertEqual(result.get(""), result.diff)
+        for path in ("/bin/0", "/bin/x", "/bin/1/v/0", "/package"):
+            with self.subTest(path=path):
+                self.assertIsNone(result.get(path))
+
+    def test_escaping(self) -> None:
+        """`/` and `~` in keys are escaped in paths as `~1` and `~0`."""
+        result = Diff({"a/b": {"c~d": 1}}, {"a/b": {}}, strict=False).get_diff()
+
+        self.assertEqual(list(result.entries()), [("/a~1b/c~0d", added(1))])
+        self.assertEqual(result.get("/a~1b/c~0d"), added(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
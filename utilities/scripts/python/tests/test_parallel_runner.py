@@ -0,0 +1,89 @@
+"""Test the scheduling of the Parallel Runner."""
+
+import unittest
+
+from python.exec_manager import ParallelRunner, Task, cli_run
+
+
+def run(command: str) -> Task:
+    """Make a task running a command, without logging it."""
+    return Task(cli_run, (command,), {"name": command, "log": False})
+
+
+class ParallelRunnerTest(unittest.TestCase):
+    """Dependencies, skipping and cancelling of tasks."""
+
+    def runner(self, *, fail_fast: bool = False) -> ParallelRunner:
+        """Make a quiet runner, closed at the end of the test."""
+        runner = ParallelRunner("test", 2, memory_mb=1024, fail_fast=fail_fast, progress=False)
+        self.addCleanup(runner.__exit__, None, None, None)
+        return runner
+
+    def test_runs_after_dependencies(self) -> None:
+        """A task starts only once everything it is scheduled after has finished."""
+        runner = self.runner()
+        first = runner.schedule(run("sleep 0.2"))
+        second = runner.schedule(Task(cli_run, ("true",), {"name": "second", "log": False}, after=[first]))
+        results = runner.get_results()
+
+        self.assertTrue(results.ok())
+        self.assertGreaterEqual(second.results()[0].start, first.results()[0].end)
+
+    def test_skips_dependents_of_failure(self) -> None:
+        """A failure skips the chain after it, and every skipped task is reported as failed."""
+        runner = self.runner()
+        failed = runner.schedule(run("false"))
+        skipped = runner.schedule(Task(cli_run, ("true",), {"name": "skipped", "log": False}, after=[failed]))
+        chained = runner.schedule(Task(cli_run, ("true",), {"name": "chained", "log": False}, after=[skipped]))
+        other = runner.schedule(run("true"))
+        results = runner.get_results()
+
+        self.assertTrue(skipped.skipped)
+        self.assertTrue(chained.skipped)
+        self.assertTrue(other.ok())
+        self.assertFalse(results.ok())
+        reported = {result.get_name(): result for result in results.results}
+        self.assertEqual(set(reported), {"false", "skipped", "chained", "true"})
+        self.assertEqual(reported["skipped"].out, "Skipped, because false failed")
+        self.assertFalse(reported["chained"].ok())
+
+    def test_always_runs_after_failure(self) -> None:
+        """An `always` task waits for its dependencies, but runs even if they failed."""
+        runner = self.runner()
+        failed = runner.schedule(run("sleep 0.1; false"))
+        last = runner.schedule(Task(cli_run, ("true",), {"name": "last", "log": False}, after=[failed], always=True))
+        runner.get_results()
+
+        self.assertTrue(last.ok())
+        self.assertGreaterEqual(last.results()[0].start, failed.results()[0].end)
+
+    def test_fail_fast_cancels_the_rest(self) -> None:
+        """With `fail_fast`, a failure terminates running commands and cancels queued ones."""
+        runner = self.runner(fail_fast=True)
+        runner.schedule(run("false"))
+        running = runner.schedule(run("sleep 30"))
+        queued = runner.schedule(run("sleep 30; true"))
+        results = runner.get_results()
+
+        self.assertFalse(running.ok())
+        self.assertTrue(queued.skipped)
+        self.assertIn(queued, runner.cancelled)
+        self.assertLess(results.results[-1].runtime + running.results()[0].runtime, 30)
+        self.assertEqual(len(results.results), 3)
+
+    def test_cancel_spares_other_runners(self) -> None:
+        """Cancelling one runner does not terminate the commands of another, like a nested one."""
+        outer = self.runner()
+        survivor = outer.schedule(run("sleep 0.5"))
+        inner = self.runner(fail_fast=True)
+        inner.schedule(run("false"))
+        cancelled = inner.schedule(run("sleep 30"))
+        inner.get_results()
+        outer.get_results()
+
+        self.assertFalse(cancelled.ok())
+        self.assertTrue(survivor.ok())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Test reading and checking migrations like refinery."""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import pytest
+
+from python import refinery
+
+MIGRATIONS = Path(__file__).parents[4] / "examples" / "postgresql" / "migrations"
+
+
+def migration(label: str, sql: str = "SELECT 1;\n") -> refinery.Migration:
+    """Make a migration from the name its file would have."""
+    match = refinery.MIGRATION_PATTERN.match(label)
+    return refinery.Migration(match.group(1), int(match.group(2)), match.group(3), Path(f"{label}.sql"), sql)
+
+
+class ChecksumTest(unittest.TestCase):
+    """Checksums match the ones refinery records, as computed by the Rust `SipHasher13` refinery uses."""
+
+    def test_siphash13(self) -> None:
+        """The hash of the empty name, version 0 and empty SQL."""
+        self.assertEqual(refinery.siphash13(b"\xff\0\0\0\0\xff"), 7633159278355933011)
+
+    def test_checksums(self) -> None:
+        """Names and SQL of every length, and non ASCII names."""
+        cases = [
+            ("V1__create_table", "CREATE TABLE t (id int);\n", "1153086685257741804"),
+            ("V42__seed_ünïcode", "SELECT 'x';", "4954922040427118256"),
+        ]
+        for label, sql, checksum in cases:
+            with self.subTest(label=label):
+                self.assertEqual(migration(label, sql).checksum(), checksum)
+
+    def test_example_migrations(self) -> None:
+        """The example migrations."""
+        self.assertEqual(
+            [(found.label(), found.checksum()) for found in refinery.find_migrations(str(MIGRATIONS))],
+            [("V1__users", "259728601290564192"), ("V2__addresses", "17457027881566611772")],
+        )
+
+
+class MigrationTest(unittest.TestCase):
+    """Finding migrations, and how they are run."""
+
+    def test_find_migrations(self) -> None:
+        """Migrations are found in subdirectories, ordered by version, and other files are ignored."""
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            (root / "nested").mkdir()
+            for name in ("V10__last.sql", "nested/U2__second.sql", "V1__first.sql", "README.md", "seed.sql"):
+                (root / name).write_text("SELECT 1;\n")
+
+            self.assertEqual(
+                [found.label() for found in refinery.find_migrations(directory)],
+                ["V1__first", "U2__second", "V10__last"],
+            )
+
+            (root / "nested" / "V10__again.sql").write_text("SELECT 1;\n")
+            with pytest.raises(ValueError, match="same version"):
+                refinery.find_migrations(directory)
+
+    def test_no_transaction(self) -> None:
+        """Only a line of its own marks a migration to run outside of a transaction."""
+        self.assertTrue(
+            migration("V1__index", "-- refinery:noTransaction\nCREATE INDEX CONCURRENTLY i ON t (a);").no_transaction()
+        )
+        self.assertTrue(migration("V1__index", "SELECT 1;\n---refinery:noTransaction\n").no_transaction())
+        self.assertFalse(migration("V1__index", "SELECT 1; -- refinery:noTransaction\n").no_transaction())
+        self.assertFalse(migration("V1__index", "CREATE INDEX i ON t (a);").no_transaction())
+
+
+class CheckAppliedTest(unittest.TestCase):
+    """Applied migrations are checked against the files like refinery, with `abort_divergent` and `abort_missing`."""
+
+    def setUp(self) -> None:
+        """Three versioned migrations and an unversioned one."""
+        self.migrations = [migration("V1__a"), migration("U2__b"), migration("V3__c"), migration("V4__d")]
+
+    def applied(self, *versions: int) -> dict[int, str]:
+        """Return the history table after applying some of the migrations."""
+        return {found.version: found.checksum() for found in self.migrations if found.version in versions}
+
+    def test_in_order(self) -> None:
+        """Applying the next migrations is fine, however many were applied."""
+        for applied in ((), (1,), (1, 2), (1, 2, 3), (1, 2, 3, 4)):
+            with self.subTest(applied=applied):
+                refinery.check_applied(self.migrations, self.applied(*applied))
+
+    def test_unversioned_out_of_order(self) -> None:
+        """An unversioned migration may be applied after later versions."""
+        refinery.check_applied(self.migrations, self.applied(1, 3))
+
+    def test_versioned_out_of_order(self) -> None:
+        """A versioned migration older than the last applied one is rejected."""
+        with pytest.raises(ValueError, match="V3__c"):
+            refinery.check_applied(self.migrations, self.applied(1, 4))
+
+    def test_missing(self) -> None:
+        """An applied migration without a file is rejected."""
+        with pytest.raises(ValueError, match="version 5"):
+            refinery.check_applied(self.migrations, {**self.applied(1, 2, 3, 4), 5: "0"})
+
+    def test_changed(self) -> None:
+        """An applied migration whose file changed is rejected."""
+        with pytest.raises(ValueError, match="V1__a"):
+            refinery.check_applied(self.migrations, {**self.applied(1), 1: "0"})
+
+
+if __name__ == "__main__":
+    unittest.main()
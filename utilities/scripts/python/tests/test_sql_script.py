@@ -0,0 +1,95 @@
+"""Test splitting SQL scripts into statements like psql."""
+
+import unittest
+
+import pytest
+
+from python.sql_script import MetaCommand, Statement, parse, quote_ident, quote_literal
+
+
+def statements(script: str, variables: dict[str, str] | None = None) -> list[str]:
+    """Split a script, returning just the SQL of each statement."""
+    return [command.sql for command in parse(script, variables) if isinstance(command, Statement)]
+
+
+class SplitTest(unittest.TestCase):
+    """Statements are split on the semicolons psql would split them on."""
+
+    def test_statements(self) -> None:
+        """Each statement starts on its own line, with the comments before it dropped."""
+        commands = parse("-- users\nCREATE TABLE a (id int);\n\n/* b */ INSERT INTO a VALUES (1);\nSELECT 1")
+
+        self.assertEqual(
+            commands,
+            [
+                Statement("CREATE TABLE a (id int)", 2),
+                Statement("INSERT INTO a VALUES (1)", 4),
+                Statement("SELECT 1", 5),
+            ],
+        )
+
+    def test_quotes(self) -> None:
+        """Semicolons in strings, quoted identifiers and comments do not end a statement."""
+        self.assertEqual(
+            statements("SELECT 'a;b', 'it''s;', E'\\';', \"x;y\" -- c;\nFROM t; /* d; /* e; */ */ SELECT 2;"),
+            ["SELECT 'a;b', 'it''s;', E'\\';', \"x;y\" -- c;\nFROM t", "SELECT 2"],
+        )
+
+    def test_dollar_quotes(self) -> None:
+        """Function bodies in dollar quotes are kept whole, whatever their tag."""
+        body = "CREATE FUNCTION f() RETURNS int AS $body$ BEGIN RETURN 1; END; $body$ LANGUAGE plpgsql"
+        self.assertEqual(statements(f"{body};\nSELECT $$;$$;"), [body, "SELECT $$;$$"])
+
+    def test_parentheses(self) -> None:
+        """Semicolons inside parentheses do not end a statement, as in `CREATE RULE`."""
+        rule = "CREATE RULE r AS ON INSERT TO t DO ALSO (INSERT INTO l VALUES (1); INSERT INTO l VALUES (2))"
+        self.assertEqual(statements(f"{rule}; SELECT ')';"), [rule, "SELECT ')'"])
+
+    def test_copy_data(self) -> None:
+        r"""The data of `COPY ... FROM STDIN` is kept with the statement, up to the `\.` line."""
+        commands = parse("COPY t (a, b) FROM STDIN;\n1\tx;y\n2\t'z\n\\.\nSELECT 1;\n")
+
+        self.assertEqual(
+            commands,
+            [Statement("COPY t (a, b) FROM STDIN", 1, "1\tx;y\n2\t'z\n"), Statement("SELECT 1", 5)],
+        )
+
+    def test_meta_commands(self) -> None:
+        """Meta-commands take the rest of their line, and are not part of a statement."""
+        commands = parse("\\echo 'Creating tables' :name\nSELECT 1;", {"name": "now"})
+
+        self.assertEqual(commands, [MetaCommand("echo", ["Creating tables", "now"], 1), Statement("SELECT 1", 2)])
+
+    def test_unterminated(self) -> None:
+        """A script ending inside a quote or comment is an error, like in psql."""
+        for script in ("SELECT 'a;", 'SELECT "a;', "SELECT $$a;", "SELECT /* a;"):
+            with self.subTest(script=script), pytest.raises(ValueError, match="Unterminated"):
+                parse(script)
+
+
+class InterpolateTest(unittest.TestCase):
+    """Variables are interpolated like `psql -v`."""
+
+    VARIABLES = {"user": "o'brien", "table": 'my"table', "count": "3", "path": "c:\\data"}  # noqa: RUF012
+
+    def test_forms(self) -> None:
+        """`:name` is the raw value, `:'name'` a string literal and `:"name"` an identifier."""
+        self.assertEqual(
+            statements("SELECT :count, :'user', :'path' FROM :\"table\";", self.VARIABLES),
+            ["SELECT 3, 'o''brien', E'c:\\\\data' FROM \"my\"\"table\""],
+        )
+
+    def test_not_interpolated(self) -> None:
+        """Unknown variables, casts and references in strings, identifiers and comments are left alone."""
+        script = "SELECT :unknown, 1::int, ':count', \":count\", $$:count$$ -- :count\n;"
+        self.assertEqual(statements(script, self.VARIABLES), [script[:-1].rstrip()])
+
+    def test_quoting(self) -> None:
+        """Values are quoted the same way psql quotes them."""
+        self.assertEqual(quote_literal("a'b"), "'a''b'")
+        self.assertEqual(quote_literal("a\\b"), "E'a\\\\b'")
+        self.assertEqual(quote_ident('a"b'), '"a""b"')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Test the Step Cache of `cli_run`."""
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from python.exec_manager import STEP_CACHE_DIR_ENV, CacheSpec, StepCache, cli_run
+
+
+class StepCacheTest(unittest.TestCase):
+    """Cache hits, misses and what is never cached."""
+
+    def setUp(self) -> None:
+        """Enable the cache in a temporary directory, with a counter the commands can bump."""
+        work = tempfile.TemporaryDirectory()
+        self.addCleanup(work.cleanup)
+        self.work = Path(work.name)
+        self.cache = self.work / "cache"
+        self.input = self.work / "input.txt"
+        self.input.write_text("one")
+        self.counter = self.work / "runs"
+        patcher = mock.patch.dict(os.environ, {STEP_CACHE_DIR_ENV: str(self.cache)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_step(self, rc: int = 0, env: dict[str, str] | None = None) -> str:
+        """Run a counting step, and return its output."""
+        result = cli_run(
+            f"echo run >> {self.counter}; echo $MODE; exit {rc}",
+            log=False,
+            env=env,
+            cache=CacheSpec(inputs=[str(self.input)], env=["MODE"]),
+        )
+        return result.out
+
+    def runs(self) -> int:
+        """Count how many times the step really ran."""
+        return len(self.counter.read_text().splitlines()) if self.counter.exists() else 0
+
+    def test_hit(self) -> None:
+        """An unchanged step is replayed from the cache."""
+        first = self.run_step()
+        second = self.run_step()
+
+        self.assertEqual(self.runs(), 1)
+        self.assertEqual(first, second)
+
+    def test_miss_on_changed_input(self) -> None:
+        """Changing the contents of an input runs the step again."""
+        self.run_step()
+        self.input.write_text("two")
+        self.run_step()
+
+        self.assertEqual(self.runs(), 2)
+
+    def test_miss_on_changed_env_argument(self) -> None:
+        """Declared variables are read from the environment the command runs in."""
+        first = self.run_step(env={**os.environ, "MODE": "debug"})
+        second = self.run_step(env={**os.environ, "MODE": "release"})
+
+        self.assertEqual(self.runs(), 2)
+        self.assertEqual((first, second), ("debug\n", "release\n"))
+        self.assertEqual(self.run_step(env={**os.environ, "MODE": "debug"}), "debug\n")
+        self.assertEqual(self.runs(), 2)
+
+    def test_failure_not_cached(self) -> None:
+        """A failed step runs again, as its failure may not be caused by its inputs."""
+        self.run_step(rc=1)
+        self.run_step(rc=1)
+
+        self.assertEqual(self.runs(), 2)
+        self.assertFalse(list(self.cache.glob("*.json")))
+
+    def test_max_age(self) -> None:
+        """An entry older than its `max_age` is a miss."""
+        store = StepCache(str(self.cache))
+        key = store.key("true", CacheSpec())
+        self.assertIsNone(store.get(key))
+        store.put(key, cli_run("true", log=False))
+
+        self.assertTrue(store.get(key).cached)
+        self.assertIsNone(store.get(key, max_age=-1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Test commands are cleaned up after, however `stream_run` returns."""
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import pytest
+
+from python.exec_manager import stream_run
+
+# Runs a command which writes the pid of a `sleep` it started, so the test can interrupt it.
+INTERRUPTED = """import sys
+from python.exec_manager import stream_run
+stream_run(f"sleep 30 & echo $! > {sys.argv[1]}; wait", spill_dir=sys.argv[2])
+"""
+
+
+def running(pid: int) -> bool:
+    """Check if a process is running, and not just waiting to be reaped."""
+    try:
+        state = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0]
+    except (OSError, IndexError):
+        return False
+    return state != "Z"
+
+
+def wait_for(condition: callable, timeout: float = 10.0) -> bool:
+    """Wait until a condition holds, returning False if it still does not after `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class StreamRunTest(unittest.TestCase):
+    """Neither the processes of a command nor its spill file outlive `stream_run`, unless returned."""
+
+    def setUp(self) -> None:
+        """Make a directory for the spill files."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = Path(directory.name)
+
+    def test_spill_file(self) -> None:
+        """The spill file is only kept when the output was truncated, and then it is returned."""
+        short = stream_run("echo 1", tail_lines=2, spill_dir=self.dir)
+        self.assertIsNone(short.log_file)
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+        long = stream_run("seq 5", tail_lines=2, spill_dir=self.dir)
+        self.assertEqual(list(self.dir.iterdir()), [Path(long.log_file)])
+        self.assertEqual(Path(long.log_file).read_text(), "1\n2\n3\n4\n5\n")
+
+    def test_timeout(self) -> None:
+        """A command which times out leaves no spill file behind, even with truncated output."""
+        with pytest.raises(subprocess.TimeoutExpired) as expired:
+            stream_run("seq 5; sleep 30", timeout=0.5, tail_lines=2, spill_dir=self.dir)
+
+        self.assertEqual(expired.value.output, "... 3 lines omitted ...\n4\n5\n")
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+    def test_interrupted(self) -> None:
+        """Interrupting the caller terminates everything the command started, and removes its spill file."""
+        pid_file = self.dir / "pid"
+        spill_dir = self.dir / "spill"
+        spill_dir.mkdir()
+        env = {**os.environ, "PYTHONPATH": str(Path(__file__).parents[2])}
+        with subprocess.Popen([sys.executable, "-c", INTERRUPTED, pid_file, spill_dir], env=env) as caller:  # noqa: S603
+            self.addCleanup(caller.kill)
+            self.assertTrue(wait_for(lambda: pid_file.is_file() and pid_file.read_text().strip()))
+            sleep = int(pid_file.read_text())
+            self.addCleanup(lambda: running(sleep) and os.kill(sleep, signal.SIGKILL))
+
+            caller.send_signal(signal.SIGINT)
+            self.assertNotEqual(caller.wait(10), 0)
+
+        self.assertTrue(wait_for(lambda: not running(sleep)), f"sleep {sleep} is still running")
+        self.assertEqual(list(spill_dir.iterdir()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
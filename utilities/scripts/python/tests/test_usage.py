@@ -0,0 +1,47 @@
+"""Test the resource usage measured for commands."""
+
+import itertools
+import shlex
+import sys
+import unittest
+
+from python.exec_manager import stream_run
+
+MIB = 1024 * 1024
+SAMPLE_INTERVAL = 0.1
+
+
+class UsageTest(unittest.TestCase):
+    """Peak memory is the memory of the command, not of the process which started it."""
+
+    def test_peak_excludes_parent_memory(self) -> None:
+        """A small command reports a small peak, however large this process is."""
+        ballast = bytearray(b"\1") * (256 * MIB)
+        result = stream_run("sleep 0.5", tail_lines=None)
+        del ballast
+
+        self.assertIsNotNone(result.usage.peak_rss)
+        self.assertLess(result.usage.peak_rss, 64 * MIB)
+
+    def test_peak_includes_descendants(self) -> None:
+        """Memory used by the processes a command starts counts toward its peak."""
+        allocate = f"import time; x = bytearray(b'1') * {128 * MIB}; time.sleep(0.5)"
+        # The shell runs the allocation as a child, as it has more to do after it.
+        result = stream_run(f"{sys.executable} -c {shlex.quote(allocate)}; true", tail_lines=None)
+
+        self.assertEqual(result.rc, 0)
+        self.assertGreaterEqual(result.usage.peak_rss, 128 * MIB)
+
+    def test_records_samples(self) -> None:
+        """Samples are only recorded when asked for, and never more often than asked."""
+        quiet = stream_run("sleep 0.3", tail_lines=None)
+        sampled = stream_run("sleep 0.3", tail_lines=None, sample_interval=SAMPLE_INTERVAL)
+
+        self.assertEqual(quiet.usage.memory_samples, [])
+        self.assertGreaterEqual(len(sampled.usage.memory_samples), 2)
+        offsets = [offset for offset, _ in sampled.usage.memory_samples]
+        self.assertTrue(all(later - earlier >= SAMPLE_INTERVAL for earlier, later in itertools.pairwise(offsets)))
+
+
+if __name__ == "__main__":
+    unittest.main()
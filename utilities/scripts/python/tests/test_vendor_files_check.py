@@ -0,0 +1,272 @@
+"""Test checking provided files against vendored files, and fixing them."""
+
+import os
+import tempfile
+import tomllib
+import unittest
+from pathlib import Path
+
+import pytest
+
+from python.vendor_files_check import (
+    TEXT,
+    TOML_NON_STRICT,
+    TOML_STRICT,
+    VendorCheck,
+    check_vendor_files,
+    find_files,
+    fix_vendor_file,
+    forget_file,
+    load_file,
+    load_toml_templates,
+    merge_missing_keys,
+    missing_keys,
+    toml_templates_check,
+)
+
+VENDOR = """\
+edition = "2021"
+resolver = "2"
+
+[lints.rust]
+unsafe_code = "deny"
+missing_docs = "warn"
+
+[lints.clippy]
+pedantic = "deny"
+"""
+
+PROVIDED = """\
+# Workspace
+edition = "2021"
+
+# Lints
+[lints.rust]
+unsafe_code = "deny"  # no unsafe
+
+[package]
+name = "x"
+"""
+
+MERGED = """\
+# Workspace
+edition = "2021"
+resolver = "2"
+
+# Lints
+[lints.rust]
+unsafe_code = "deny"  # no unsafe
+missing_docs = "warn"
+
+[package]
+name = "x"
+
+[lints.clippy]
+pedantic = "deny"
+"""
+
+
+class FilesTestCase(unittest.TestCase):
+    """Tests which write files in a temporary directory."""
+
+    def setUp(self) -> None:
+        """Make the temporary directory."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = Path(directory.name)
+
+    def write(self, name: str, text: str) -> str:
+        """Write a file in the temporary directory, returning its path."""
+        path = self.dir / name
+        path.write_text(text)
+        return str(path)
+
+
+class LoadFileTest(FilesTestCase):
+    """Parsed files are cached while they are unchanged."""
+
+    def test_cached(self) -> None:
+        """An unchanged file is not parsed again."""
+        path = self.write("a.toml", "a = 1\n")
+        self.assertIs(load_file(path), load_file(path))
+
+    def test_changed(self) -> None:
+        """A file is parsed again when its modification time changes, even with the same size."""
+        path = self.write("a.toml", "a = 1\n")
+        stat = Path(path).stat()
+        self.assertEqual(load_file(path), {"a": 1})
+
+        Path(path).write_text("a = 2\n")
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        self.assertEqual(load_file(path), {"a": 2})
+
+    def test_kinds(self) -> None:
+        """A file is cached separately as toml and as text, and both are forgotten together."""
+        path = self.write("a.toml", "a = 1\n")
+        toml = load_file(path)
+        text = load_file(path, "text")
+        self.assertEqual(text, ["a = 1\n"])
+
+        forget_file(path)
+        self.assertIsNot(load_file(path), toml)
+        self.assertIsNot(load_file(path, "text"), text)
+
+
+class TemplatesTest(FilesTestCase):
+    """Manifests are found, and checked against templates parsed once."""
+
+    def test_find_files(self) -> None:
+        """Files are found in a stable order, without searching skipped directories."""
+        for directory in ("b", "a/c", "target/debug", ".git"):
+            (self.dir / directory).mkdir(parents=True)
+            self.write(f"{directory}/Cargo.toml", "")
+
+        self.assertEqual(
+            find_files("Cargo.toml", str(self.dir)),
+            [str(self.dir / "a/c/Cargo.toml"), str(self.dir / "b/Cargo.toml")],
+        )
+
+    def test_load_templates(self) -> None:
+        """Every template is parsed, and the result fails if any of them can not be."""
+        vendor = self.write("vendor.toml", VENDOR)
+        broken = self.write("broken.toml", "a = \n")
+
+        templates, parsed = load_toml_templates([vendor])
+        self.assertEqual((templates, parsed.rc), ({vendor: tomllib.loads(VENDOR)}, 0))
+
+        templates, parsed = load_toml_templates([vendor, broken])
+        self.assertEqual((list(templates), parsed.rc), ([vendor], 1))
+        self.assertIn(broken, parsed.out)
+
+    def test_check(self) -> None:
+        """The output is the template a file fits, or the differences to every template if it fits none."""
+        workspace = self.write("workspace.toml", '[workspace]\nresolver = "2"\n')
+        project = self.write("project.toml", '[package]\nname = "x"\n')
+        templates, _ = load_toml_templates([workspace, project])
+
+        fits = toml_templates_check(
+            templates, self.write("a.toml", '[package]\nname = "x"\nversion = "1"\n'), strict=False
+        )
+        self.assertEqual((fits.rc, fits.out), (0, project))
+
+        fits_none = toml_templates_check(templates, self.write("b.toml", '[package]\nname = "y"\n'), strict=False)
+        self.assertEqual(fits_none.rc, 1)
+        self.assertIn(workspace, fits_none.out)
+        self.assertIn(project, fits_none.out)
+
+
+class CheckVendorFilesTest(FilesTestCase):
+    """Batches of provided files are compared to their vendored files."""
+
+    def test_modes(self) -> None:
+        """Each check is compared the way its mode says, and the results are in the same order."""
+        vendor = self.write("vendor.toml", VENDOR)
+        merged = self.write("merged.toml", MERGED)
+        same = self.write("same.toml", VENDOR)
+        checks = [
+            VendorCheck(vendor, merged, TOML_STRICT),
+            VendorCheck(vendor, merged, TOML_NON_STRICT),
+            VendorCheck(vendor, same, TOML_STRICT),
+            VendorCheck(vendor, same, TEXT),
+            VendorCheck(vendor, merged, TEXT),
+        ]
+
+        results = check_vendor_files(checks, log=False)
+
+        self.assertEqual([res.rc for res in results], [1, 0, 0, 0, 1])
+        self.assertIn('-name = "x"', results[4].out)
+
+    def test_missing(self) -> None:
+        """A missing text file is empty, like `diff -N`, a missing toml file is an error."""
+        vendor = self.write("vendor.toml", VENDOR)
+        missing = str(self.dir / "missing.toml")
+
+        text, toml = check_vendor_files(
+            [VendorCheck(vendor, missing, TEXT), VendorCheck(vendor, missing, TOML_STRICT)], log=False
+        )
+
+        self.assertEqual(text.rc, 1)
+        self.assertIn('+edition = "2021"', text.out)
+        self.assertEqual(toml.rc, 1)
+        self.assertIn("Exception caught", toml.out)
+
+    def test_unknown_mode(self) -> None:
+        """A check with an unknown mode is an error before anything is checked."""
+        with pytest.raises(ValueError, match="Unknown mode 'json'"):
+            check_vendor_files([VendorCheck("vendor.json", "provided.json", "json")], log=False)
+
+
+class MergeMissingKeysTest(unittest.TestCase):
+    """Missing keys are merged into a toml text without touching its existing lines."""
+
+    def test_merge(self) -> None:
+        """Keys are added after the last key of their table, missing tables at the end."""
+        missing = missing_keys(tomllib.loads(VENDOR), tomllib.loads(PROVIDED))
+
+        self.assertEqual(
+            missing,
+            [
+                (("resolver",), "2"),
+                (("lints", "rust", "missing_docs"), "warn"),
+                (("lints", "clippy"), {"pedantic": "deny"}),
+            ],
+        )
+        self.assertEqual(merge_missing_keys(PROVIDED, missing), MERGED)
+
+    def test_round_trip(self) -> None:
+        """The merged text has nothing missing, so merging again changes nothing."""
+        merged = merge_missing_keys(PROVIDED, missing_keys(tomllib.loads(VENDOR), tomllib.loads(PROVIDED)))
+
+        self.assertEqual(missing_keys(tomllib.loads(VENDOR), tomllib.loads(merged)), [])
+        self.assertEqual(merge_missing_keys(merged, []), merged)
+
+
+class FixTest(FilesTestCase):
+    """`--fix` rewrites the provided files, after which they pass their checks."""
+
+    def test_non_strict(self) -> None:
+        """Missing keys are merged in, fixing again changes nothing, and the check then passes."""
+        vendor = self.write("vendor.toml", VENDOR)
+        provided = self.write("provided.toml", PROVIDED)
+        check = VendorCheck(vendor, provided, TOML_NON_STRICT)
+
+        (fixed,) = check_vendor_files([check], fix=True, log=False)
+        self.assertEqual(fixed.rc, 0)
+        self.assertIn('+missing_docs = "warn"', fixed.out)
+        self.assertEqual(Path(provided).read_text(), MERGED)
+
+        again = fix_vendor_file(check)
+        self.assertEqual((again.rc, again.out), (0, ""))
+        self.assertEqual(Path(provided).read_text(), MERGED)
+
+        (checked,) = check_vendor_files([check], log=False)
+        self.assertEqual(checked.rc, 0)
+
+    def test_by_hand(self) -> None:
+        """Values which differ are left to be fixed by hand, after the missing keys are merged in."""
+        vendor = self.write("vendor.toml", VENDOR)
+        provided = self.write("provided.toml", PROVIDED.replace('edition = "2021"', 'edition = "2018"'))
+
+        (fixed,) = check_vendor_files([VendorCheck(vendor, provided, TOML_NON_STRICT)], fix=True, log=False)
+
+        self.assertEqual(fixed.rc, 1)
+        self.assertIn("fixed by hand", fixed.out)
+        self.assertIn('missing_docs = "warn"', Path(provided).read_text())
+
+    def test_copy(self) -> None:
+        """Strict toml and text files are replaced by the vendored file, even when they are missing."""
+        vendor = self.write("vendor.toml", VENDOR)
+        for mode in (TOML_STRICT, TEXT):
+            with self.subTest(mode=mode):
+                provided = str(self.dir / mode / "provided.toml")
+                check = VendorCheck(vendor, provided, mode)
+
+                (fixed,) = check_vendor_files([check], fix=True, log=False)
+                self.assertEqual(fixed.rc, 0)
+                self.assertEqual(Path(provided).read_text(), VENDOR)
+                self.assertEqual(fix_vendor_file(check).out, "")
+                self.assertEqual(check_vendor_files([check], log=False)[0].rc, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
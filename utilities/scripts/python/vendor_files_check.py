@@ -3,61 +3,553 @@
 used to enforce consistency between local config files and the expected config locked in CI.
 """
 
+import concurrent.futures
+import copy
+import datetime as dt
+import json
+import math
+import os
+import re
+import shutil
 import tomllib
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any
 
 from python import exec_manager
-from python.diff import Diff
+from python.diff import Diff, unified_diff
 
+# Directories which never hold files to check, like build outputs and VCS metadata, which can be huge.
+SKIPPED_DIRS = frozenset({".git", "target", "node_modules"})
 
-def colordiff_check(vendor_file_path: str, provided_file_path: str) -> exec_manager.Result:
-    """Use colordiff to check files are the same."""
-    return exec_manager.cli_run(
-        f"colordiff -Nau {provided_file_path} {vendor_file_path}",
-        name=f"Checking if Provided File {provided_file_path} == Vendored File {vendor_file_path}",
-    )
+# How a provided file is compared to a vendored file:
+# the same toml, toml with at least everything in the vendored one, or the same text.
+TOML_STRICT = "toml"
+TOML_NON_STRICT = "toml_non_strict"
+TEXT = "text"
+MODES = (TOML_STRICT, TOML_NON_STRICT, TEXT)
 
+# A toml key which can be written without quotes.
+BARE_KEY = re.compile(r"[A-Za-z0-9_-]+")
+# A toml table header, like `[workspace.lints]`, or array of tables header, like `[[bin]]`.
+TABLE_HEADER = re.compile(r"^\s*\[(?!\[)(?P<table>.+)\]\s*(?:#.*)?$")
+ARRAY_HEADER = re.compile(r"^\s*\[\[.+\]\]\s*(?:#.*)?$")
 
-def toml_diff_check(
-    vendor_file_path: str,
+# Parsed files by absolute path and kind ("toml" or "text"), with the mtime and size they were parsed at.
+_parsed: dict[tuple[str, str], tuple[tuple[int, int], dict | list[str]]] = {}
+
+
+def find_files(file_name: str, root: str = ".", skip: frozenset[str] = SKIPPED_DIRS) -> list[str]:
+    """Find all the files with a name in a directory tree, without walking into skipped directories.
+
+    Args:
+        file_name (str): The name of the files to find.
+        root (str, optional): The directory to search. Defaults to ".".
+        skip (frozenset[str], optional): The names of the directories not to search. Defaults to SKIPPED_DIRS.
+
+    Returns:
+        list[str]: The paths of the files found, in a stable order.
+
+    """
+    found = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        # Pruning in place stops `os.walk` descending into them at all.
+        dir_names[:] = sorted(name for name in dir_names if name not in skip)
+        if file_name in file_names:
+            found.append(str(Path(dir_path, file_name)))
+    return found
+
+
+def load_file(path: str, kind: str = "toml") -> dict | list[str]:
+    """Read and parse a file, reusing the last parse of it while it is unchanged.
+
+    A file is unchanged while it has the same modification time and size.
+    The parse is shared, so it must not be modified.
+
+    Args:
+        path (str): The file.
+        kind (str, optional): "toml" to parse it as toml, "text" to split it into lines. Defaults to "toml".
+
+    Returns:
+        dict | list[str]: The parsed toml, or the lines of text with their line endings.
+
+    Raises:
+        OSError: If the file can not be read.
+        tomllib.TOMLDecodeError: If the file is not valid toml.
+
+    """
+    stat = Path(path).stat()
+    key = (str(Path(path).absolute()), kind)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _parsed.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    if kind == "toml":
+        with Path(path).open("rb") as toml_file:
+            parsed = tomllib.load(toml_file)
+    else:
+        parsed = Path(path).read_text().splitlines(keepends=True)
+    _parsed[key] = (version, parsed)
+    return parsed
+
+
+def forget_file(path: str) -> None:
+    """Drop the cached parses of a file, after it was rewritten."""
+    for kind in ("toml", "text"):
+        _parsed.pop((str(Path(path).absolute()), kind), None)
+
+
+def load_toml_templates(template_paths: list[str]) -> tuple[dict[str, dict], exec_manager.Result]:
+    """Parse vendored toml templates once, so many files can be checked against them.
+
+    Args:
+        template_paths (list[str]): The vendored templates.
+
+    Returns:
+        tuple[dict[str, dict], exec_manager.Result]: The parsed templates by path,
+            and the result of parsing them, which fails if any of them could not be.
+
+    """
+    templates = {}
+
+    def procedure() -> exec_manager.ProcedureResult:
+        errors = []
+        for path in template_paths:
+            try:
+                templates[path] = load_file(path)
+            except (OSError, tomllib.TOMLDecodeError) as exc:
+                errors.append(f"{path}: {exc}")
+        return exec_manager.ProcedureResult(
+            1 if errors else 0,
+            "Parse " + ", ".join(template_paths),
+            "\n".join(errors) or f"{len(templates)} templates parsed",
+        )
+
+    res = exec_manager.procedure_run(procedure, "Parse Vendored Templates", log=False)
+    return templates, res
+
+
+def toml_templates_check(
+    templates: dict[str, dict],
     provided_file_path: str,
     *,
     strict: bool = True,
-    log: bool = True,
+    name: str | None = None,
 ) -> exec_manager.Result:
-    """Check if toml files are the same."""
-    command_name = (
-        f"{'' if strict else 'Non '}Strict Checking"
-        f" if Provided File {provided_file_path} == Vendored File {vendor_file_path}"
-    )
+    """Check if a toml file is the same as at least one of some parsed templates.
+
+    Args:
+        templates (dict[str, dict]): The parsed templates by path, from `load_toml_templates`.
+        provided_file_path (str): The file to check.
+        strict (bool, optional): If the file must not have more than the template. Defaults to True.
+        name (str | None, optional): The name of the check. Defaults to one naming the file.
+
+    Returns:
+        exec_manager.Result: The result, its output is the template the file matched,
+            or the differences to every template if it matched none.
+
+    """
+    command_name = f"{'' if strict else 'Non '}Strict Checking Provided File {provided_file_path} against templates"
+
+    def procedure() -> exec_manager.ProcedureResult:
+        try:
+            provided_obj = load_file(provided_file_path)
+        except (OSError, tomllib.TOMLDecodeError) as exc:
+            return exec_manager.ProcedureResult(1, command_name, f"Exception caught: {exc}")
+
+        # Finding the template which fits only needs to know if there is a difference.
+        for template_path, template_obj in templates.items():
+            if Diff(template_obj, provided_obj, strict).equal():
+                return exec_manager.ProcedureResult(0, command_name, template_path)
+
+        diffs = [
+            Diff(template_obj, provided_obj, strict)
+            .get_diff()
+            .to_ascii_colored_string(template_path, provided_file_path)
+            for template_path, template_obj in templates.items()
+        ]
+        return exec_manager.ProcedureResult(1, command_name, "\n".join(diffs))
+
+    return exec_manager.procedure_run(procedure, name or command_name, log=False)
+
+
+def toml_key(key: str) -> str:
+    """Write a key as toml, quoting it only if it has to be."""
+    return key if BARE_KEY.fullmatch(key) else json.dumps(key, ensure_ascii=False)
+
+
+def toml_value(value: Any) -> str:  # noqa: ANN401, PLR0911
+    """Write a value as inline toml.
+
+    Args:
+        value (Any): A value, as parsed by `tomllib`.
+
+    Returns:
+        str: The value, with tables written as inline tables.
+
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and not math.isfinite(value):
+        return "nan" if math.isnan(value) else ("inf" if value > 0 else "-inf")
+    if isinstance(value, int | float):
+        return repr(value)
+    if isinstance(value, dt.date | dt.time):
+        return value.isoformat()
+    if isinstance(value, list):
+        return "[" + ", ".join(toml_value(element) for element in value) + "]"
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        return "{ " + ", ".join(f"{toml_key(key)} = {toml_value(val)}" for key, val in value.items()) + " }"
+    return json.dumps(value, ensure_ascii=False)
+
+
+def toml_table(path: tuple[str, ...], table: dict) -> list[str]:
+    """Write a table as toml, under a header, with its sub tables after it under their own headers.
+
+    Returns:
+        list[str]: The lines of the table.
+
+    """
+    lines = ["[" + ".".join(toml_key(key) for key in path) + "]"]
+    sub_tables = []
+    for key, value in table.items():
+        if isinstance(value, dict):
+            sub_tables.append(((*path, key), value))
+        else:
+            lines.append(f"{toml_key(key)} = {toml_value(value)}")
+    for sub_path, sub_table in sub_tables:
+        lines += ["", *toml_table(sub_path, sub_table)]
+    return lines
+
+
+def missing_keys(vendor: dict, provided: dict, path: tuple[str, ...] = ()) -> list[tuple[tuple[str, ...], Any]]:
+    """Find the keys of a vendored toml which a provided toml does not have, in tables both have.
+
+    Returns:
+        list[tuple[tuple[str, ...], Any]]: The path of every missing key, and its vendored value.
+
+    """
+    missing = []
+    for key, value in vendor.items():
+        if key not in provided:
+            missing.append(((*path, key), value))
+        elif isinstance(value, dict) and isinstance(provided[key], dict):
+            missing.extend(missing_keys(value, provided[key], (*path, key)))
+    return missing
+
+
+def header_table(line: str) -> tuple[str, ...] | None:
+    """Return the path of the table a line is the header of, or None if it is not a table header."""
+    match = TABLE_HEADER.match(line)
+    if match is None:
+        return None
+    try:
+        header = tomllib.loads(f"[{match.group('table')}]")
+    except tomllib.TOMLDecodeError:
+        return None
+    path = []
+    while header:
+        key, header = next(iter(header.items()))
+        path.append(key)
+    return tuple(path)
+
+
+def is_toml_content(line: str) -> bool:
+    """Check if a toml line has something on it besides a comment."""
+    return bool(line.strip()) and not line.lstrip().startswith("#")
+
+
+def insert_point(lines: list[str], table: tuple[str, ...], headers: dict[tuple[str, ...], int]) -> int:
+    """Find the line to add keys to a table at, after its last key.
+
+    Args:
+        lines (list[str]): The lines of the toml text.
+        table (tuple[str, ...]): The table, () for the top level.
+        headers (dict[tuple[str, ...], int]): The line of the header of each table.
+
+    Returns:
+        int: The index of the line the keys go before.
+
+    """
+    start = headers[table] + 1 if table else 0
+    end = next((index for index in sorted(headers.values()) if index >= start), len(lines))
+    end = next((index for index in range(start, end) if ARRAY_HEADER.match(lines[index])), end)
+    content = [index for index in range(start, end) if is_toml_content(lines[index])]
+    if content:
+        return content[-1] + 1
+    if table:
+        return start
+    # Keep the comments which lead into the first table with it.
+    while end > 0 and lines[end - 1].strip() and not is_toml_content(lines[end - 1]):
+        end -= 1
+    return end
 
+
+def merge_missing_keys(text: str, missing: list[tuple[tuple[str, ...], Any]]) -> str:
+    """Add missing keys to a toml text, without touching its existing lines.
+
+    Keys are added after the last key of their table, or before the first table for top level keys.
+    Missing tables, and keys of tables with no header of their own, are added to the end.
+
+    Args:
+        text (str): The toml text.
+        missing (list[tuple[tuple[str, ...], Any]]): The keys to add, from `missing_keys`.
+
+    Returns:
+        str: The toml text with the keys added.
+
+    """
+    lines = text.splitlines()
+    headers = {}
+    for index, line in enumerate(lines):
+        table = header_table(line)
+        if table is not None:
+            headers.setdefault(table, index)
+
+    inserts: dict[int, list[str]] = {}
+    new_tables: dict[tuple[str, ...], dict] = {}
+    for path, value in missing:
+        table, key = path[:-1], path[-1]
+        if isinstance(value, dict):
+            new_tables[path] = value
+        elif table and table not in headers:
+            new_tables.setdefault(table, {})[key] = value
+        else:
+            inserts.setdefault(insert_point(lines, table, headers), []).append(f"{toml_key(key)} = {toml_value(value)}")
+
+    first_table = min([*headers.values(), *(i for i, line in enumerate(lines) if ARRAY_HEADER.match(line)), len(lines)])
+    merged = []
+    for index, line in enumerate(lines):
+        merged += inserts.get(index, [])
+        if index in inserts and index <= first_table and line.strip():
+            # Keep a blank line between the top level keys and the first table.
+            merged.append("")
+        merged.append(line)
+    merged += inserts.get(len(lines), [])
+    for path, table in new_tables.items():
+        merged += [*([""] if merged else []), *toml_table(path, table)]
+    return "\n".join(merged) + "\n"
+
+
+@dataclass(frozen=True)
+class VendorCheck:
+    """A provided file which must match a vendored file.
+
+    Attributes:
+        vendor: The vendored file.
+        provided: The file to check.
+        mode: How they are compared, one of `MODES`.
+
+    """
+
+    vendor: str
+    provided: str
+    mode: str = TOML_STRICT
+
+    def kind(self) -> str:
+        """Return how both files are parsed for `load_file`."""
+        return "text" if self.mode == TEXT else "toml"
+
+    def name(self) -> str:
+        """Return the name of the check."""
+        if self.mode == TEXT:
+            return f"Checking if Provided File {self.provided} == Vendored File {self.vendor}"
+        return (
+            f"{'Non ' if self.mode == TOML_NON_STRICT else ''}Strict Checking"
+            f" if Provided File {self.provided} == Vendored File {self.vendor}"
+        )
+
+
+def _load(path: str, kind: str) -> dict | list[str] | Exception:
+    """Load a file for a check, returning the error instead of raising it."""
     try:
-        with (
-            Path(vendor_file_path).open("rb") as vendor_file,
-            Path(provided_file_path).open("rb") as provided_file,
-        ):
-
-            def procedure() -> exec_manager.ProcedureResult:
-                vendor_obj = tomllib.load(vendor_file)
-                provided_obj = tomllib.load(provided_file)
-
-                diff = Diff(vendor_obj, provided_obj, strict).get_diff()
-
-                return exec_manager.ProcedureResult(
-                    1 if diff.has_diff() else 0,
-                    command_name,
-                    diff.to_ascii_colored_string(vendor_file_path, provided_file_path),
-                )
-
-            res = exec_manager.procedure_run(
-                procedure,
-                command_name,
-                log=log,
+        return load_file(path, kind)
+    except FileNotFoundError as exc:
+        # Like `diff -N`, a missing file is an empty text.
+        return [] if kind == "text" else exc
+    except (OSError, tomllib.TOMLDecodeError) as exc:
+        return exc
+
+
+def _compare(check: VendorCheck, loaded: dict[tuple[str, str], dict | list[str] | Exception]) -> exec_manager.Result:
+    """Compare the files of a check, which have already been loaded."""
+    command_name = check.name()
+
+    def procedure() -> exec_manager.ProcedureResult:
+        vendor_obj = loaded[check.vendor, check.kind()]
+        provided_obj = loaded[check.provided, check.kind()]
+        for obj in (vendor_obj, provided_obj):
+            if isinstance(obj, Exception):
+                return exec_manager.ProcedureResult(1, command_name, f"Exception caught: {obj}")
+
+        if check.mode == TEXT:
+            diff = unified_diff(vendor_obj, provided_obj, check.vendor, check.provided)
+            return exec_manager.ProcedureResult(1 if diff else 0, command_name, diff)
+
+        diff = Diff(vendor_obj, provided_obj, check.mode == TOML_STRICT)
+        if diff.equal():
+            return exec_manager.ProcedureResult(0, command_name, "")
+        return exec_manager.ProcedureResult(
+            1,
+            command_name,
+            diff.get_diff().to_ascii_colored_string(check.vendor, check.provided),
+        )
+
+    return exec_manager.procedure_run(procedure, command_name, log=False)
+
+
+def fix_vendor_file(check: VendorCheck) -> exec_manager.Result:
+    """Rewrite a provided file so it matches its vendored file.
+
+    Strict toml and text files are replaced by a copy of the vendored file.
+    Non strict toml files get the keys they are missing merged in with `merge_missing_keys`,
+    keeping their formatting and comments, as long as that parses back to what is expected.
+    Values which differ are left alone, and need to be fixed by hand.
+
+    Args:
+        check (VendorCheck): The files to fix.
+
+    Returns:
+        exec_manager.Result: The result, its output is a diff of what was changed,
+            and of anything which still needs to be fixed by hand.
+
+    """
+    command_name = f"Fixing Provided File {check.provided} from Vendored File {check.vendor}"
+    provided_path = Path(check.provided)
+
+    def procedure() -> exec_manager.ProcedureResult:
+        old_text = provided_path.read_text() if provided_path.is_file() else ""
+        if check.mode != TOML_NON_STRICT:
+            provided_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(check.vendor, provided_path)
+            new_text = provided_path.read_text()
+            changes = unified_diff(
+                new_text.splitlines(keepends=True), old_text.splitlines(keepends=True), "fixed", check.provided
             )
-    except Exception as exc:  # noqa: BLE001
-        res = exec_manager.Result(1, command_name, f"Exception caught: {exc}", 0.0, command_name)
+            return exec_manager.ProcedureResult(0, command_name, changes)
+
+        vendor_obj = load_file(check.vendor)
+        provided_obj = tomllib.loads(old_text)
+        missing = missing_keys(vendor_obj, provided_obj)
+        expected_obj = copy.deepcopy(provided_obj)
+        for path, value in missing:
+            table = expected_obj
+            for key in path[:-1]:
+                table = table[key]
+            table[path[-1]] = value
+
+        new_text = merge_missing_keys(old_text, missing) if missing else old_text
+        try:
+            merged = tomllib.loads(new_text) == expected_obj
+        except tomllib.TOMLDecodeError:
+            merged = False
+        if not merged:
+            keys = ", ".join(".".join(path) for path, _ in missing)
+            return exec_manager.ProcedureResult(1, command_name, f"Could not add {keys}, they need to be added by hand")
 
-        if log:
-            res.print(verbose_errors=True, verbose=False)
+        if missing:
+            provided_path.parent.mkdir(parents=True, exist_ok=True)
+            provided_path.write_text(new_text)
+        changes = unified_diff(
+            new_text.splitlines(keepends=True), old_text.splitlines(keepends=True), "fixed", check.provided
+        )
+        diff = Diff(vendor_obj, expected_obj, strict=False)
+        if diff.equal():
+            return exec_manager.ProcedureResult(0, command_name, changes)
+        return exec_manager.ProcedureResult(
+            1,
+            command_name,
+            changes
+            + "Differences which need to be fixed by hand:"
+            + diff.get_diff().to_ascii_colored_string(check.vendor, check.provided),
+        )
 
-    return res
+    try:
+        return exec_manager.procedure_run(procedure, command_name, log=False)
+    except (OSError, tomllib.TOMLDecodeError) as exc:
+        return exec_manager.Result(1, command_name, f"Exception caught: {exc}", 0.0, command_name)
+    finally:
+        forget_file(check.provided)
+
+
+def check_vendor_files(
+    checks: list[VendorCheck],
+    *,
+    fix: bool = False,
+    log: bool = True,
+    max_workers: int | None = None,
+) -> list[exec_manager.Result]:
+    """Check a batch of provided files match their vendored files.
+
+    Every distinct file is read and parsed once, through the `load_file` cache,
+    so vendored files shared by checks, or checked by earlier batches, are not parsed again.
+    The files are loaded, and then compared, on a thread pool.
+
+    Args:
+        checks (list[VendorCheck]): The files to check.
+        fix (bool, optional): Rewrite the provided files which do not match with `fix_vendor_file`,
+            and report what was changed instead of the difference. Defaults to False.
+        log (bool, optional): Whether to print the results. Defaults to True.
+        max_workers (int | None, optional): The threads to use. Defaults to the `ThreadPoolExecutor` default.
+
+    Returns:
+        list[exec_manager.Result]: The result of each check, in the same order.
+
+    Raises:
+        ValueError: If a check has an unknown mode.
+
+    """
+    for check in checks:
+        if check.mode not in MODES:
+            msg = f"Unknown mode {check.mode!r} for {check.provided}, expected one of {', '.join(MODES)}"
+            raise ValueError(msg)
+
+    files = list(
+        dict.fromkeys(
+            file for check in checks for file in ((check.vendor, check.kind()), (check.provided, check.kind()))
+        )
+    )
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        loaded = dict(zip(files, pool.map(lambda file: _load(*file), files), strict=True))
+        results = list(pool.map(lambda check: _compare(check, loaded), checks))
+
+    fixed = set()
+    if fix:
+        for index, (check, res) in enumerate(zip(checks, results, strict=True)):
+            # A vendored file which can not be read can not be fixed from.
+            if not res.ok() and not isinstance(loaded[check.vendor, check.kind()], Exception):
+                results[index] = fix_vendor_file(check)
+                fixed.add(index)
+
+    if log:
+        for index, res in enumerate(results):
+            # Show what was fixed, not only what failed.
+            res.print(verbose_errors=True, verbose=index in fixed)
+    return results
+
+
+def text_diff_check(
+    vendor_file_path: str,
+    provided_file_path: str,
+    *,
+    fix: bool = False,
+    log: bool = True,
+) -> exec_manager.Result:
+    """Check if text files are the same, showing a unified diff if they are not."""
+    return check_vendor_files([VendorCheck(vendor_file_path, provided_file_path, TEXT)], fix=fix, log=log)[0]
+
+
+def toml_diff_check(
+    vendor_file_path: str,
+    provided_file_path: str,
+    *,
+    strict: bool = True,
+    fix: bool = False,
+    log: bool = True,
+) -> exec_manager.Result:
+    """Check if toml files are the same."""
+    mode = TOML_STRICT if strict else TOML_NON_STRICT
+    return check_vendor_files([VendorCheck(vendor_file_path, provided_file_path, mode)], fix=fix, log=log)[0]